@@ -0,0 +1,158 @@
+"""Measure the fast/slow chatbot routing split on a recorded query set.
+
+The query set is JSONL, one object per line with the user's question and
+the top retrieval score seen when it was answered:
+
+    {"question": "what are your opening hours", "top_score": 0.91}
+
+Export one from production chat history with --export, then run offline to
+see the routing split and estimated cost, or with --live to call Groq for
+every query on both the routed model and the large-model baseline.
+
+    python -m benchmarks.llm_router_benchmark --export queries.jsonl --limit 500
+    python -m benchmarks.llm_router_benchmark queries.jsonl
+    python -m benchmarks.llm_router_benchmark queries.jsonl --live
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from config import CHATBOT_SLOW_MODEL, GROQ_API_KEY
+from services.llm_router import route_reply_model
+
+# USD per million tokens (input, output); adjust to the current Groq price list
+MODEL_PRICES = {
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+}
+# Used for offline cost estimates when no live token counts are available
+ASSUMED_INPUT_TOKENS = 700
+ASSUMED_OUTPUT_TOKENS = 80
+
+def load_queries(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES[CHATBOT_SLOW_MODEL])
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return round(values[index], 1)
+
+async def export_queries(path: str, limit: int):
+    """Pair recorded user questions with the routing data stored on the bot reply"""
+    from motor.motor_asyncio import AsyncIOMotorClient # pyright: ignore[reportMissingImports]
+    from config import MONGODB_URI, DATABASE_NAME, CHAT_HISTORY_COLLECTION
+
+    client = AsyncIOMotorClient(MONGODB_URI)
+    history = client[DATABASE_NAME][CHAT_HISTORY_COLLECTION]
+    cursor = history.find({}).sort([("phone_number", 1), ("timestamp", 1)])
+
+    exported = 0
+    last_question = {}
+    with open(path, "w", encoding="utf-8") as f:
+        async for message in cursor:
+            key = (str(message.get("user_id")), message.get("phone_number"))
+            if message.get("is_from_user"):
+                last_question[key] = message["message"]
+                continue
+            route = message.get("route")
+            question = last_question.pop(key, None)
+            if not route or not question:
+                continue
+            f.write(json.dumps({"question": question, "top_score": route.get("top_score")}) + "\n")
+            exported += 1
+            if exported >= limit:
+                break
+    client.close()
+    print(f"Exported {exported} queries to {path}")
+
+async def run_live(queries):
+    """Answer each query with the routed model and the large model and time both"""
+    from langchain_groq import ChatGroq
+
+    models = {name: ChatGroq(api_key=GROQ_API_KEY, model=name, temperature=0.3) for name in MODEL_PRICES}
+    results = []
+    for query in queries:
+        route = query["route"]
+        for label, model in (("routed", route["model"]), ("baseline", CHATBOT_SLOW_MODEL)):
+            started = time.perf_counter()
+            response = await models[model].ainvoke(query["question"])
+            latency_ms = (time.perf_counter() - started) * 1000
+            usage = response.response_metadata.get("token_usage", {})
+            results.append({
+                "label": label,
+                "tier": route["tier"],
+                "model": model,
+                "latency_ms": latency_ms,
+                "cost": estimate_cost(model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+            })
+    return results
+
+def report(queries, live_results=None):
+    tiers = {"fast": [], "slow": []}
+    reasons = {}
+    for query in queries:
+        tiers[query["route"]["tier"]].append(query)
+        reasons[query["route"]["reason"]] = reasons.get(query["route"]["reason"], 0) + 1
+
+    total = len(queries)
+    print(f"Queries: {total}")
+    for tier, items in tiers.items():
+        print(f"  {tier:<5} {len(items):>6}  ({len(items) / total * 100:.1f}%)")
+    print("Routing reasons:")
+    for reason, count in sorted(reasons.items(), key=lambda r: -r[1]):
+        print(f"  {reason:<30} {count}")
+
+    if live_results is None:
+        routed_cost = sum(
+            estimate_cost(q["route"]["model"], ASSUMED_INPUT_TOKENS, ASSUMED_OUTPUT_TOKENS) for q in queries
+        )
+        baseline_cost = total * estimate_cost(CHATBOT_SLOW_MODEL, ASSUMED_INPUT_TOKENS, ASSUMED_OUTPUT_TOKENS)
+        print(f"Estimated cost: routed ${routed_cost:.4f} vs all-{CHATBOT_SLOW_MODEL} ${baseline_cost:.4f}")
+        return
+
+    for label in ("routed", "baseline"):
+        rows = [r for r in live_results if r["label"] == label]
+        latencies = [r["latency_ms"] for r in rows]
+        print(
+            f"{label:<8} p50 {percentile(latencies, 50)}ms  p95 {percentile(latencies, 95)}ms  "
+            f"mean {statistics.mean(latencies):.1f}ms  cost ${sum(r['cost'] for r in rows):.4f}"
+        )
+    for tier in ("fast", "slow"):
+        latencies = [r["latency_ms"] for r in live_results if r["label"] == "routed" and r["tier"] == tier]
+        if latencies:
+            print(f"  routed/{tier:<4} p50 {percentile(latencies, 50)}ms  p95 {percentile(latencies, 95)}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", nargs="?", help="JSONL query set")
+    parser.add_argument("--live", action="store_true", help="call Groq and measure real latency and cost")
+    parser.add_argument("--export", metavar="PATH", help="export a query set from chat history to PATH")
+    parser.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.export:
+        asyncio.run(export_queries(args.export, args.limit))
+        return
+
+    if not args.queries:
+        parser.error("a query set is required unless --export is given")
+
+    queries = load_queries(args.queries)[:args.limit]
+    for query in queries:
+        score = query.get("top_score")
+        query["route"] = route_reply_model(query["question"], [score] if score is not None else [])
+
+    live_results = asyncio.run(run_live(queries)) if args.live else None
+    report(queries, live_results)
+
+if __name__ == "__main__":
+    main()
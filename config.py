@@ -35,6 +35,124 @@ VECTOR_STORE_DIR = "user_vector_stores"
 WHATSAPP_API_URL = "https://graph.facebook.com/v19.0"
 SG_BASE = "https://api.sendgrid.com/v3"
 BATCH_SIZE = 16
+EMBEDDING_MAX_TOKENS = 512
+CHUNK_MIN_TOKENS = 64
+CHUNK_OVERLAP_RATIO = 0.15
+
+# Chatbot reply routing: short, well-grounded questions go to the fast model
+CHATBOT_FAST_MODEL = os.getenv("CHATBOT_FAST_MODEL", "llama-3.1-8b-instant")
+CHATBOT_SLOW_MODEL = os.getenv("CHATBOT_SLOW_MODEL", "llama-3.3-70b-versatile")
+CHATBOT_FAST_MAX_QUERY_WORDS = int(os.getenv("CHATBOT_FAST_MAX_QUERY_WORDS", 12))
+CHATBOT_FAST_MIN_RETRIEVAL_SCORE = float(os.getenv("CHATBOT_FAST_MIN_RETRIEVAL_SCORE", 0.85))
+
+# WhatsApp Cloud API HTTP client
+WHATSAPP_HTTP_TIMEOUT = float(os.getenv("WHATSAPP_HTTP_TIMEOUT", 10))
+WHATSAPP_HTTP_CONNECT_TIMEOUT = float(os.getenv("WHATSAPP_HTTP_CONNECT_TIMEOUT", 5))
+WHATSAPP_HTTP_MAX_CONNECTIONS = int(os.getenv("WHATSAPP_HTTP_MAX_CONNECTIONS", 100))
+WHATSAPP_HTTP_MAX_KEEPALIVE = int(os.getenv("WHATSAPP_HTTP_MAX_KEEPALIVE", 20))
+
+# Campaign media is uploaded to the Cloud API once per sender; Meta keeps uploaded media for 30 days
+WHATSAPP_MEDIA_ID_TTL_HOURS = int(os.getenv("WHATSAPP_MEDIA_ID_TTL_HOURS", 24 * 29))
+WHATSAPP_MEDIA_MAX_UPLOAD_BYTES = int(os.getenv("WHATSAPP_MEDIA_MAX_UPLOAD_BYTES", 16 * 1024 * 1024))
+WHATSAPP_MEDIA_FETCH_TIMEOUT = float(os.getenv("WHATSAPP_MEDIA_FETCH_TIMEOUT", 30))
+
+# Meta credential health: a check older than this is refreshed in the background
+META_CREDENTIAL_CHECK_TTL_SECONDS = int(os.getenv("META_CREDENTIAL_CHECK_TTL_SECONDS", 900))
+
+# Campaign dispatch: Meta's default Cloud API throughput is 80 messages/second per number
+WHATSAPP_MESSAGES_PER_SECOND = float(os.getenv("WHATSAPP_MESSAGES_PER_SECOND", 80))
+WHATSAPP_SENDER_CONCURRENCY = int(os.getenv("WHATSAPP_SENDER_CONCURRENCY", 20))
+CAMPAIGN_EMAIL_PER_SECOND = float(os.getenv("CAMPAIGN_EMAIL_PER_SECOND", 2))
+
+# Campaign send queue: per-recipient tasks in Mongo, leased by workers on any node
+CAMPAIGN_SEND_TASKS_COLLECTION = "campaign_send_tasks"
+CAMPAIGN_WORKER_ENABLED = os.getenv("CAMPAIGN_WORKER_ENABLED", "true").lower() == "true"
+# Concurrent sends per channel (WhatsApp, email, SMS each get their own budget)
+CAMPAIGN_WORKER_CONCURRENCY = int(os.getenv("CAMPAIGN_WORKER_CONCURRENCY", 50))
+CAMPAIGN_TASK_LEASE_SECONDS = int(os.getenv("CAMPAIGN_TASK_LEASE_SECONDS", 60))
+CAMPAIGN_WORKER_POLL_SECONDS = float(os.getenv("CAMPAIGN_WORKER_POLL_SECONDS", 1))
+CAMPAIGN_SCHEDULER_TICK_SECONDS = float(os.getenv("CAMPAIGN_SCHEDULER_TICK_SECONDS", 1))
+CAMPAIGN_SCHEDULER_LEASE_SECONDS = int(os.getenv("CAMPAIGN_SCHEDULER_LEASE_SECONDS", 15))
+CAMPAIGN_TASK_MAX_ATTEMPTS = int(os.getenv("CAMPAIGN_TASK_MAX_ATTEMPTS", 5))
+CAMPAIGN_RETRY_BASE_SECONDS = float(os.getenv("CAMPAIGN_RETRY_BASE_SECONDS", 5))
+CAMPAIGN_RETRY_MAX_SECONDS = float(os.getenv("CAMPAIGN_RETRY_MAX_SECONDS", 600))
+# Inline retries for the synchronous /sms/send endpoint, kept short since the caller is waiting
+SMS_SEND_MAX_ATTEMPTS = int(os.getenv("SMS_SEND_MAX_ATTEMPTS", 3))
+SMS_RETRY_BASE_SECONDS = float(os.getenv("SMS_RETRY_BASE_SECONDS", 0.5))
+SMS_RETRY_MAX_SECONDS = float(os.getenv("SMS_RETRY_MAX_SECONDS", 5))
+
+# Async SMS engine: long codes are limited to 1 message/second per number by carriers
+TWILIO_HTTP_TIMEOUT = float(os.getenv("TWILIO_HTTP_TIMEOUT", 15))
+SMS_SEND_CONCURRENCY = int(os.getenv("SMS_SEND_CONCURRENCY", 20))
+SMS_NUMBER_MESSAGES_PER_SECOND = float(os.getenv("SMS_NUMBER_MESSAGES_PER_SECOND", 1))
+# A Messaging Service fans out over its own number pool; set to pool size x per-number rate
+SMS_MESSAGING_SERVICE_MESSAGES_PER_SECOND = float(os.getenv("SMS_MESSAGING_SERVICE_MESSAGES_PER_SECOND", 10))
+SMS_MAX_SENDER_NUMBERS = int(os.getenv("SMS_MAX_SENDER_NUMBERS", 50))
+
+# Bulk email: SendGrid accepts up to 1000 personalizations per /mail/send call
+SENDGRID_HTTP_TIMEOUT = float(os.getenv("SENDGRID_HTTP_TIMEOUT", 30))
+SENDGRID_BATCH_SIZE = int(os.getenv("SENDGRID_BATCH_SIZE", 1000))
+SENDGRID_SEND_CONCURRENCY = int(os.getenv("SENDGRID_SEND_CONCURRENCY", 4))
+
+# Provider rate governor: "mongo" shares token buckets across workers and nodes, "local" keeps them in process
+RATE_GOVERNOR_BACKEND = os.getenv("RATE_GOVERNOR_BACKEND", "mongo").lower()
+RATE_GOVERNOR_LEASE_SECONDS = float(os.getenv("RATE_GOVERNOR_LEASE_SECONDS", 0.5))
+SMS_HOURLY_LIMIT = int(os.getenv("SMS_HOURLY_LIMIT", 100))
+
+# Adaptive throttling (AIMD) of each sender's send rate on provider feedback.
+# The configured rate is the ceiling; throttling and latency inflation back off from it.
+ADAPTIVE_THROTTLE_ENABLED = os.getenv("ADAPTIVE_THROTTLE_ENABLED", "true").lower() == "true"
+ADAPTIVE_CEILING_FACTOR = float(os.getenv("ADAPTIVE_CEILING_FACTOR", 1.0))
+ADAPTIVE_MIN_RATE_FRACTION = float(os.getenv("ADAPTIVE_MIN_RATE_FRACTION", 0.05))
+ADAPTIVE_INCREASE_FRACTION = float(os.getenv("ADAPTIVE_INCREASE_FRACTION", 0.05))
+ADAPTIVE_DECREASE_FACTOR = float(os.getenv("ADAPTIVE_DECREASE_FACTOR", 0.5))
+ADAPTIVE_LATENCY_FACTOR = float(os.getenv("ADAPTIVE_LATENCY_FACTOR", 2.0))
+
+# Bearer token the Prometheus scraper sends to /metrics; the endpoint is off while unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Circuit breakers: open after consecutive provider failures, probe again after the recovery time
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", 30))
+CIRCUIT_MAX_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_MAX_RECOVERY_SECONDS", 300))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", 20))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", 1))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 30))
+
+# Priority lanes: realtime (OTP, chatbot), standard (single API sends), bulk (campaigns).
+# Reserved slots are never lent to another lane; spare slots go to waiting lanes by weight.
+LANE_WEIGHTS = {
+    "realtime": int(os.getenv("LANE_REALTIME_WEIGHT", 8)),
+    "standard": int(os.getenv("LANE_STANDARD_WEIGHT", 3)),
+    "bulk": int(os.getenv("LANE_BULK_WEIGHT", 1))
+}
+LANE_REALTIME_SLO_MS = float(os.getenv("LANE_REALTIME_SLO_MS", 250))
+WHATSAPP_LANE_CAPACITY = WHATSAPP_HTTP_MAX_CONNECTIONS
+WHATSAPP_LANE_RESERVED = {
+    "realtime": int(os.getenv("WHATSAPP_LANE_REALTIME_RESERVED", 10)),
+    "standard": int(os.getenv("WHATSAPP_LANE_STANDARD_RESERVED", 10))
+}
+SMS_LANE_CAPACITY = int(os.getenv("SMS_LANE_CAPACITY", 50))
+SMS_LANE_RESERVED = {
+    "realtime": int(os.getenv("SMS_LANE_REALTIME_RESERVED", 5)),
+    "standard": int(os.getenv("SMS_LANE_STANDARD_RESERVED", 10))
+}
+# Campaigns pace each WhatsApp number to this share of its rate, leaving the rest for replies
+WHATSAPP_BULK_RATE_SHARE = float(os.getenv("WHATSAPP_BULK_RATE_SHARE", 0.8))
+
+# Transactional SMTP (OTP, notifications): pooled authenticated connections
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 3))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 10))
+SMTP_SEND_TIMEOUT = float(os.getenv("SMTP_SEND_TIMEOUT", 15))
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", 30))
+SMTP_REALTIME_RESERVED = int(os.getenv("SMTP_REALTIME_RESERVED", 1))
+SMS_LOG_BATCH_SIZE = int(os.getenv("SMS_LOG_BATCH_SIZE", 500))
+SMS_LOG_FLUSH_SECONDS = float(os.getenv("SMS_LOG_FLUSH_SECONDS", 1))
+
+# Idempotency-Key handling for the send endpoints
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", 24))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", 600))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 120))
 
 # Collections
 USERS_COLLECTION = "users"
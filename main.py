@@ -2,7 +2,7 @@ import os
 import uvicorn
 import logging
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
@@ -25,6 +25,19 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     from services.database import mongodb, get_users_collection, get_campaigns_collection, get_email_users_collection, get_api_keys_collection
+    from services.whatsapp_service import whatsapp_client
+    from services.campaign_queue import create_campaign_queue_indexes
+    from services.idempotency import create_idempotency_indexes
+    from services.whatsapp_media import create_whatsapp_media_indexes
+    from services.rate_limiter import create_rate_governor_indexes
+    from services.sms_engine import twilio_clients, sms_log_writer
+    from services.email_engine import sendgrid_client
+    from services.email_sender import email_sender
+    from services.campaign_worker import CampaignWorker
+    from services.campaign_scheduler import CampaignScheduler
+    from config import CAMPAIGN_WORKER_ENABLED
+    campaign_worker = None
+    campaign_scheduler = None
     
     # Startup
     try:
@@ -80,12 +93,34 @@ async def lifespan(app: FastAPI):
         await whatsapp_contacts.create_index("user_id")
         await whatsapp_contacts.create_index([("user_id", 1), ("number", 1)], unique=True)
         
+        whatsapp_message_logs = mongodb.db.whatsapp_message_logs
+        await whatsapp_message_logs.create_index([("user_id", 1), ("error_code", 1)])
+        
+        knowledge_base_documents = mongodb.db.knowledge_base_documents
+        await knowledge_base_documents.create_index([("user_id", 1), ("source", 1), ("url", 1)], unique=True)
+        await knowledge_base_documents.create_index([("user_id", 1), ("source", 1), ("root_url", 1)])
+        
+        await create_campaign_queue_indexes()
+        await create_idempotency_indexes()
+        await create_whatsapp_media_indexes()
+        await create_rate_governor_indexes()
+        
         api_keys_collection = await get_api_keys_collection()
         await api_keys_collection.create_index("user_id", unique=True)
         await api_keys_collection.create_index("last_rotated")
         await api_keys_collection.create_index([("user_id", 1), ("last_rotated", -1)])
         
         logger.info("All MongoDB indexes created successfully")
+
+        await whatsapp_client.start()
+        await sms_log_writer.start()
+        await sendgrid_client.start()
+
+        if CAMPAIGN_WORKER_ENABLED:
+            campaign_worker = CampaignWorker()
+            await campaign_worker.start()
+            campaign_scheduler = CampaignScheduler()
+            await campaign_scheduler.start()
         
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
@@ -94,6 +129,16 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown
+    if campaign_scheduler:
+        await campaign_scheduler.stop()
+    if campaign_worker:
+        await campaign_worker.stop()
+    await whatsapp_client.close()
+    await sms_log_writer.stop()
+    await twilio_clients.close()
+    await sendgrid_client.close()
+    await email_sender.close()
+
     if mongodb.client:
         mongodb.client.close()
         logger.info("MongoDB connection closed")
@@ -145,20 +190,40 @@ async def serve_image(image_name: str):
 @app.get("/health")
 async def health_check():
     from services.database import mongodb
+    from services.circuit_breaker import breaker_stats, sender_breaker_stats, CLOSED
     from datetime import datetime, timezone
     try:
         await mongodb.client.admin.command('ping')
         db_status = "connected"
     except Exception as e:
         db_status = f"error: {str(e)}"
+
+    circuits = breaker_stats()
+    # An open circuit means a provider is down; the API itself still serves
+    degraded = any(circuit["state"] != CLOSED for circuit in circuits.values())
+    # A single tenant's sender being down doesn't degrade the service; just count them
+    senders_tripped = sum(circuit["state"] != CLOSED for circuit in sender_breaker_stats().values())
     
     return {
-        "status": "healthy",
+        "status": "degraded" if degraded else "healthy",
         "database": db_status,
+        "circuits": circuits,
+        "sender_circuits_open": senders_tripped,
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "version": "2.0.0"
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    import secrets
+    from services.metrics import render_metrics
+    from config import METRICS_TOKEN
+    # Internal only: the scraper authenticates with METRICS_TOKEN, nobody else may read per-sender series
+    authorization = request.headers.get("authorization", "")
+    if not METRICS_TOKEN or not secrets.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=403, detail="Not authorized to read metrics")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.middleware("http")
 async def log_headers(request: Request, call_next):
     # Enhanced logging to show API key usage
@@ -6,6 +6,7 @@ class IdeaInput(BaseModel):
 
 class KnowledgeBaseInput(BaseModel):
     url: Optional[str] = None
+    max_pages: int = 50
 
 class ChatTestInput(BaseModel):
     question: str
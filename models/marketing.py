@@ -25,6 +25,12 @@ class NumberRequest(BaseModel):
 class OTPVerifyRequest(BaseModel):
     code: str
 
+class SenderNumberRequest(BaseModel):
+    phone_number: str
+
+class MessagingServiceRequest(BaseModel):
+    messaging_service_sid: Optional[str] = None
+
 class SMSRequest(BaseModel):
     to_number: str
     message: str
@@ -60,12 +66,23 @@ class EmailUserUpdate(BaseModel):
     subuser_username: Optional[str] = None
     subuser_id: Optional[str] = None
 
+class EmailRecipient(BaseModel):
+    email: EmailStr
+    name: Optional[str] = None
+    var1: Optional[str] = None
+    var2: Optional[str] = None
+    var3: Optional[str] = None
+
 class SendEmailRequest(BaseModel):
-    to: List[EmailStr]
+    to: List[EmailStr] = []
+    # Recipients with per-recipient {name}/{var1..3} substitutions
+    recipients: List[EmailRecipient] = []
     from_email: EmailStr
     subject: str
     content: str
     content_type: Literal["text/plain", "text/html"] = "text/html" 
+    # Let SendGrid hold the send until then (at most 72 hours ahead)
+    send_at: Optional[datetime] = None
 
 class SubuserCreate(BaseModel):
     username: str
@@ -1,17 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, UploadFile, File, Form, Header
-from typing import Optional, List
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Header
+from typing import Optional
 import io
 import pandas as pd
 import re
-import asyncio
 from models.campaigns import IdeaInput, CampaignCreate
-from models.marketing import SendEmailRequest, SMSRequest
-from services.database import get_campaigns_collection, get_message_status_collection, get_users_collection
+from services.database import get_campaigns_collection, get_users_collection, get_campaign_dead_letters_collection
 from services.auth import get_current_user
-from services.whatsapp_service import send_whatsapp_message
-from services.email_service import send_email_with_storage
-from services.sms_service import send_sms
+from services.send_schedule import SendSchedule
+from services.campaign_queue import enqueue_campaign_tasks, control_campaign, get_task_status_counts, redrive_dead_letters
 from services.generate_message import call_gemini_api
+from services.email_service import get_email_user
+from services.sms_service import get_sms_route
+from services.sms_engine import estimate_send_seconds
+from services.send_errors import SendConfigurationError
+from services.email_engine import create_batch_id, set_batch_status
+from services.personalization import PERSONALIZATION_FIELDS, validate_template
+from config import SENDGRID_BATCH_SIZE
 from bson import ObjectId
 from datetime import datetime, timezone
 import logging
@@ -23,69 +27,9 @@ security = HTTPBearer()
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/campaigns", tags=["Campaigns"])
 
-async def send_messages_background(numbers: List[str], message: str, user: dict, campaign_id: str):
-    """Background task for sending WhatsApp messages"""
-    message_status_collection = await get_message_status_collection()
-    campaigns_collection = await get_campaigns_collection()
-    
-    for number in numbers:
-        try:
-            send_whatsapp_message(user['phone_number_id'], number, message, user['meta_api_key'])
-            
-            status_doc = {
-                "campaign_id": ObjectId(campaign_id),
-                "phone_number": number,
-                "status": "sent",
-                "sent_at": datetime.now(timezone.utc),
-                "updated_at": datetime.now(timezone.utc)
-            }
-            await message_status_collection.insert_one(status_doc)
-            
-            await asyncio.sleep(2.0)  # Rate limiting for WhatsApp
-        except Exception as e:
-            logger.error(f"Failed to send WhatsApp to {number}: {e}")
-            continue
-    
-    # Update campaign status to completed
-    await campaigns_collection.update_one(
-        {"_id": ObjectId(campaign_id)},
-        {"$set": {"status": "completed"}}
-    )
-    logger.info(f"Campaign {campaign_id} completed.")
-
-async def send_bulk_emails_background(emails: List[str], subject: str, content: str, from_email: str, user_id: str):
-    """Background task for sending bulk emails with rate limiting"""
-    for email in emails:
-        try:
-            await send_email_with_storage(SendEmailRequest(
-                user_id=user_id,
-                to=email,
-                subject=subject,
-                from_email=from_email,
-                content=content
-            ))
-            await asyncio.sleep(0.5)  # 2 emails/second
-        except Exception as e:
-            logger.error(f"Failed to send email to {email}: {e}")
-            continue
-
-async def send_bulk_sms_background(numbers: List[str], message: str, user_id: str):
-    """Background task for sending bulk SMS with rate limiting"""
-    for number in numbers:
-        try:
-            await send_sms(SMSRequest(
-                user_id=user_id,
-                to_number=number,
-                message=message
-            ))
-            await asyncio.sleep(3.0)  # 20 SMS/minute
-        except Exception as e:
-            logger.error(f"Failed to send SMS to {number}: {e}")
-            continue
-
 @router.post("/generate-from-idea", status_code=200)
 async def generate_message_from_idea(data: IdeaInput):
-    system_prompt = "You are an expert WhatsApp marketing copywriter. Write a short, engaging, and friendly promotional message based on the user's idea. The message must be under 250 characters. Include placeholders like {name} for personalization. The response should only be the marketing message text, without any introductory phrases like 'Here is the message:' or quotes."
+    system_prompt = "You are an expert WhatsApp marketing copywriter. Write a short, engaging, and friendly promotional message based on the user's idea. The message must be under 250 characters. Personalize with the {name} placeholder only; no other placeholders are filled in. The response should only be the marketing message text, without any introductory phrases like 'Here is the message:' or quotes."
     user_query = f"Generate a WhatsApp marketing message for the following idea: {data.ai_idea}"
     
     generated_text = await call_gemini_api(system_prompt, user_query)
@@ -98,17 +42,22 @@ async def send_bulk_message(
     campaign_type: str = Form(...),
     contacts_file: Optional[UploadFile] = File(None),
     manual_numbers: Optional[str] = Form(None),
-    current_user: dict = Depends(get_current_user),
-    background_tasks: BackgroundTasks = BackgroundTasks()
+    send_at: Optional[str] = Form(None),
+    spread_minutes: Optional[float] = Form(None),
+    window_start: Optional[str] = Form(None),
+    window_end: Optional[str] = Form(None),
+    timezone_name: Optional[str] = Form(None, alias="timezone"),
+    current_user: dict = Depends(get_current_user)
 ):
-    all_numbers = set()
+    # number -> personalization fields ({name}, {var1}..{var3}) for that contact
+    all_numbers = {}
 
     if manual_numbers:
         numbers_found = re.findall(r'\+?\d[\d\s-]*', manual_numbers)
         for num_str in numbers_found:
             cleaned_num = re.sub(r'[\s-]', '', num_str)
             if cleaned_num:
-                all_numbers.add(cleaned_num)
+                all_numbers.setdefault(cleaned_num, {})
 
     if contacts_file:
         if not contacts_file.filename.endswith(('.csv', '.xlsx')):
@@ -123,8 +72,11 @@ async def send_bulk_message(
                 
             if 'number' not in df.columns:
                 raise HTTPException(status_code=400, detail="File must contain a 'number' column.")
-            for num in df['number'].dropna().astype(str):
-                all_numbers.add(num.strip())
+            fields = [field for field in PERSONALIZATION_FIELDS if field in df.columns]
+            for row in df.dropna(subset=['number']).to_dict('records'):
+                all_numbers[str(row['number']).strip()] = {
+                    field: str(row[field]).strip() for field in fields if pd.notna(row[field])
+                }
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Error processing file: {e}")
 
@@ -133,42 +85,176 @@ async def send_bulk_message(
 
     contact_list = list(all_numbers)
     
+    try:
+        validate_template(message)
+        if campaign_type == "email":
+            validate_template(campaign_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if campaign_type not in ("whatsapp", "email", "sms"):
+        raise HTTPException(status_code=400, detail="Invalid campaign type. Use 'whatsapp', 'email', or 'sms'")
+    
+    if campaign_type == "whatsapp":
+        if not current_user.get('meta_api_key') or not current_user.get('phone_number_id'):
+            raise HTTPException(status_code=400, detail="WhatsApp API credentials not set up.")
+    elif campaign_type == "sms":
+        # Checked once here; every queued task would otherwise fail the same way
+        try:
+            sms_route = await get_sms_route(str(current_user["_id"]))
+        except SendConfigurationError as e:
+            raise HTTPException(status_code=400, detail=f"SMS sending not set up: {e}")
+    
+    try:
+        schedule = SendSchedule.from_request(send_at, spread_minutes, window_start, window_end, timezone_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid schedule: {e}")
+    campaign_status = "scheduled" if schedule and schedule.send_at > datetime.now(timezone.utc) else "processing"
+    
     campaigns_collection = await get_campaigns_collection()
     new_campaign = {
         "name": campaign_name,
         "message_template": message,
+        "campaign_type": campaign_type,
         "contact_count": len(contact_list),
+        "sent_count": 0,
+        "failed_count": 0,
         "owner_id": current_user["_id"],
-        "status": "processing",
+        "status": campaign_status,
+        "schedule": schedule.to_document() if schedule else None,
         "sent_at": datetime.now(timezone.utc)
     }
+    if campaign_type == "sms":
+        # Recipients are spread over the tenant's senders, each paced to its own rate
+        new_campaign["sender_count"] = len(sms_route.senders)
+        new_campaign["estimated_duration_seconds"] = estimate_send_seconds(
+            len(contact_list), sms_route.senders, sms_route.messages_per_second
+        )
+    
+    if campaign_type == "email":
+        # Email goes out in SendGrid personalization batches, one send task per batch
+        recipients = [
+            {
+                "recipient": f"batch-{start // SENDGRID_BATCH_SIZE:05d}",
+                "data": {"recipients": [
+                    {"email": email, **all_numbers[email]} for email in contact_list[start:start + SENDGRID_BATCH_SIZE]
+                ]}
+            }
+            for start in range(0, len(contact_list), SENDGRID_BATCH_SIZE)
+        ]
+        email_user = await get_email_user(str(current_user["_id"]))
+        if email_user and email_user.get("api_key"):
+            new_campaign["sendgrid_batch_id"] = await create_batch_id(email_user["api_key"])
+    else:
+        recipients = [{"recipient": number, "data": all_numbers[number]} for number in contact_list]
     
     result = await campaigns_collection.insert_one(new_campaign)
     campaign_id = str(result.inserted_id)
     
-    # Start background task based on campaign type
-    if campaign_type == "whatsapp":
-        if not current_user.get('meta_api_key') or not current_user.get('phone_number_id'):
-            raise HTTPException(status_code=400, detail="WhatsApp API credentials not set up.")
-        background_tasks.add_task(send_messages_background, contact_list, message, current_user, campaign_id)
-        
-    elif campaign_type == "email":
-        background_tasks.add_task(
-            send_bulk_emails_background,
-            contact_list, campaign_name, message, current_user['email'], str(current_user['_id'])
-        )
-        
-    elif campaign_type == "sms":
-        background_tasks.add_task(
-            send_bulk_sms_background,
-            contact_list, message, str(current_user['_id'])
-        )
-        
-    else:
-        raise HTTPException(status_code=400, detail="Invalid campaign type. Use 'whatsapp', 'email', or 'sms'")
+    # Queue durable send tasks; campaign workers pick them up
+    await enqueue_campaign_tasks(
+        campaign_id, current_user["_id"], campaign_type, recipients, schedule=schedule
+    )
     
     return {
         "message": "Campaign accepted and is being processed.", 
         "contacts_found": len(contact_list), 
-        "campaign_id": campaign_id
-    }
\ No newline at end of file
+        "campaign_id": campaign_id,
+        "status": campaign_status,
+        "send_at": schedule.send_at.isoformat() if schedule else None,
+        "estimated_duration_seconds": new_campaign.get("estimated_duration_seconds")
+    }
+
+@router.get("/dead-letters")
+async def get_dead_letters(
+    campaign_id: Optional[str] = None,
+    error_code: Optional[str] = None,
+    limit: int = 100,
+    current_user: dict = Depends(get_current_user)
+):
+    """Recipients whose sends kept failing with retryable errors until attempts ran out"""
+    query = {"user_id": current_user["_id"]}
+    if campaign_id:
+        query["campaign_id"] = ObjectId(campaign_id)
+    if error_code:
+        query["error_code"] = error_code
+    
+    dead_letters_collection = await get_campaign_dead_letters_collection()
+    cursor = dead_letters_collection.find(query).sort("dead_lettered_at", -1).limit(min(limit, 1000))
+    dead_letters = []
+    async for dead_letter in cursor:
+        dead_letters.append({
+            "id": str(dead_letter["_id"]),
+            "campaign_id": str(dead_letter["campaign_id"]),
+            "channel": dead_letter["channel"],
+            "recipient": dead_letter["recipient"],
+            "attempts": dead_letter.get("attempts"),
+            "error_code": dead_letter.get("error_code"),
+            "provider_code": dead_letter.get("provider_code"),
+            "error_message": dead_letter.get("error_message", ""),
+            "dead_lettered_at": dead_letter["dead_lettered_at"].isoformat()
+        })
+    
+    return {"dead_letters": dead_letters, "count": len(dead_letters)}
+
+@router.post("/dead-letters/redrive")
+async def redrive_campaign_dead_letters(
+    campaign_id: Optional[str] = None,
+    error_code: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Queue dead-lettered recipients again, optionally only one campaign or error code"""
+    redriven = await redrive_dead_letters(current_user["_id"], campaign_id, error_code)
+    return {"redriven_count": redriven}
+
+async def _control_campaign(campaign_id: str, action: str, current_user: dict):
+    campaigns_collection = await get_campaigns_collection()
+    campaign = await campaigns_collection.find_one(
+        {"_id": ObjectId(campaign_id), "owner_id": current_user["_id"]}
+    )
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    
+    try:
+        result = await control_campaign(campaigns_collection, campaign, action)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Batches SendGrid already holds follow the campaign too
+    if campaign.get("sendgrid_batch_id"):
+        email_user = await get_email_user(str(current_user["_id"]))
+        if email_user and email_user.get("api_key"):
+            await set_batch_status(email_user["api_key"], campaign["sendgrid_batch_id"], action)
+    
+    return {"campaign_id": campaign_id, **result}
+
+@router.post("/{campaign_id}/pause")
+async def pause_campaign(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    return await _control_campaign(campaign_id, "pause", current_user)
+
+@router.post("/{campaign_id}/resume")
+async def resume_campaign(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    return await _control_campaign(campaign_id, "resume", current_user)
+
+@router.post("/{campaign_id}/cancel")
+async def cancel_campaign(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    return await _control_campaign(campaign_id, "cancel", current_user)
+
+@router.get("/{campaign_id}/progress")
+async def get_campaign_progress(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    campaigns_collection = await get_campaigns_collection()
+    campaign = await campaigns_collection.find_one(
+        {"_id": ObjectId(campaign_id), "owner_id": current_user["_id"]}
+    )
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    
+    task_counts = await get_task_status_counts({"campaign_id": campaign["_id"]})
+    return {
+        "campaign_id": campaign_id,
+        "status": campaign.get("status"),
+        "contact_count": campaign.get("contact_count", 0),
+        "sent_count": campaign.get("sent_count", 0),
+        "failed_count": campaign.get("failed_count", 0),
+        "recipients": task_counts.get(campaign["_id"], {})
+    }
@@ -1,14 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
 from typing import Optional
-from models.campaigns import ChatTestInput
+from models.campaigns import ChatTestInput, KnowledgeBaseInput
 from services.database import get_users_collection
 from services.auth import get_current_user
-from services.vector_store import load_vector_store_safely, close_vector_store, create_advanced_retriever
-from utils.embeddings import embedding_model
-from config import GROQ_API_KEY
+from services.vector_store import load_vector_store_safely, close_vector_store
+from services.chatbot_service import retrieve_documents, generate_reply, TEST_QUERY_PROMPT
 import logging
-from langchain_groq import ChatGroq
-from langchain_core.prompts import PromptTemplate
 import asyncio
 from bson import ObjectId
 
@@ -51,6 +48,34 @@ async def upload_knowledge_base(
         logger.error(f"Error processing knowledge base: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing knowledge base: {str(e)}")
 
+@router.post("/knowledge-base/crawl", status_code=200)
+async def crawl_knowledge_base(
+    data: KnowledgeBaseInput,
+    current_user: dict = Depends(get_current_user)
+):
+    """Crawl a website into the chatbot knowledge base - re-crawls only re-embed changed pages"""
+    if not data.url or not data.url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="A valid http(s) URL is required")
+    
+    if not 1 <= data.max_pages <= 500:
+        raise HTTPException(status_code=400, detail="max_pages must be between 1 and 500")
+    
+    from services.knowledge_base_service import crawl_user_knowledge_base_service
+    
+    users_collection = await get_users_collection()
+    result = await crawl_user_knowledge_base_service(
+        current_user["_id"], data.url, users_collection, max_pages=data.max_pages
+    )
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return {
+        "message": "Chatbot knowledge base updated from website",
+        "documents_count": result["documents_count"],
+        "pages": result["pages"]
+    }
+
 @router.post("/activate")
 async def activate_chatbot(current_user: dict = Depends(get_current_user)):
     """Activate chatbot functionality"""
@@ -94,54 +119,17 @@ async def test_chatbot_query(
     if not current_user.get('chatbot_active', False):
         raise HTTPException(status_code=400, detail="Chatbot is not active. Please activate it first.")
     
-    vector_store = None
     try:
-        loop = asyncio.get_event_loop()
-        vector_store = await loop.run_in_executor(
-            None, load_vector_store_safely, current_user['vector_store_path']
-        )
-        
-        advanced_retriever = create_advanced_retriever(vector_store, embedding_model)
-        compressed_docs = await loop.run_in_executor(
-            None,
-            advanced_retriever.get_relevant_documents,
-            data.question
-        )
-        
+        compressed_docs = await retrieve_documents(current_user['vector_store_path'], data.question)
         docs_text = "\n\n".join([d.page_content for d in compressed_docs[:3]])
-        logger.info(f"Retrieved {len(compressed_docs)} documents for test query")
-
-        if not GROQ_API_KEY:
-            return {"answer": "AI service is currently unavailable. Please try again later."}
-
-        chat_model = ChatGroq(api_key=GROQ_API_KEY, model="llama-3.3-70b-versatile", temperature=0.3)
-        prompt = PromptTemplate.from_template("""
-Context: {context}
 
-Question: {question}
-
-Instructions:
-- Use the knowledge base content primarily to answer the question
-- If the knowledge base doesn't contain relevant information, respond politely that you don't have that information
-- Keep responses concise and helpful
-- Maintain a friendly, professional tone
-
-Note: Do not tell from your side that you did not find the information in the knowledge base. Instead, just say an apology message that you don't have that information.
-Do not use any vague or introduction message. Also if there is no context then just say that "Sorry, I don't have any information regarding this."
-
-Answer:""")
-        chain = prompt | chat_model
-        response = await chain.ainvoke({"context": docs_text, "question": data.question})
-        ai_response = response.content
+        reply = await generate_reply(TEST_QUERY_PROMPT, docs_text, data.question, compressed_docs)
         
-        return {"answer": ai_response}
+        return {"answer": reply["answer"], "model": reply["route"]["model"], "route": reply["route"]}
         
     except Exception as e:
         logger.error(f"Error during test RAG processing: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
-    finally:
-        if vector_store:
-            close_vector_store(vector_store)
 
 @router.get("/verify-knowledge-base")
 async def verify_knowledge_base(current_user: dict = Depends(get_current_user)):
@@ -194,12 +182,16 @@ async def clear_knowledge_base(current_user: dict = Depends(get_current_user)):
         if os.path.exists(vector_store_dir):
             shutil.rmtree(vector_store_dir)
     
+    from services.knowledge_base_service import forget_crawled_pages
+    await forget_crawled_pages(current_user["_id"])
+    
     # Update user in database
     await users_collection.update_one(
         {"_id": ObjectId(current_user["_id"])},
         {"$unset": {
             "vector_store_path": "",
             "knowledge_base_file": "",
+            "knowledge_base_source_url": "",
             "knowledge_base_updated": "",
             "documents_count": "",
             "chatbot_active": ""
@@ -2,13 +2,12 @@ from fastapi import APIRouter, HTTPException, Request, Response, status, Depends
 from models.marketing import EmailUserCreate, EmailUserUpdate, SendEmailRequest, SubuserCreate, DomainCreate, SendEmailModel
 from services.database import get_email_users_collection, get_email_logs_collection
 from config import SENDGRID_MASTER_KEY, SG_BASE
-from sendgrid import SendGridAPIClient # pyright: ignore[reportMissingImports]
-from sendgrid.helpers.mail import Mail # pyright: ignore[reportMissingImports]
 import requests
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import logging
 import secrets
 import string
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/email", tags=["Email Marketing"])
@@ -16,6 +15,9 @@ router = APIRouter(prefix="/email", tags=["Email Marketing"])
 # Import API key service for authentication
 from services.api_key_service import APIKeyService
 from services.database import get_api_keys_collection
+from services.idempotency import run_idempotent
+from services.email_engine import send_bulk_email, create_batch_id, set_batch_status
+from services.personalization import validate_template
 
 async def get_current_user_from_api_key(x_api_key: str = Header(..., alias="X-API-Key")):
     """
@@ -515,7 +517,18 @@ async def verify_user_domain(current_user_id: str = Depends(get_current_user_id)
         )
 
 @router.post("/send")
-async def send_email_with_storage(data: SendEmailRequest, current_user_id: str = Depends(get_current_user_id)):
+async def send_email_with_storage(
+    data: SendEmailRequest,
+    current_user_id: str = Depends(get_current_user_id),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    return await run_idempotent(
+        idempotency_key, current_user_id, "email.send",
+        lambda: _send_email_with_storage(data, current_user_id),
+        request_body=data
+    )
+
+async def _send_email_with_storage(data: SendEmailRequest, current_user_id: str):
     try:
         user = await get_email_user(current_user_id)
         if not user:
@@ -535,55 +548,94 @@ async def send_email_with_storage(data: SendEmailRequest, current_user_id: str =
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Domain not verified. Please complete domain verification first."
             )
-        content_type = getattr(data, "content_type", "text/html")
-        if content_type == "text/plain":
-            message = Mail(
-            from_email=data.from_email,
-            to_emails=data.to,
-            subject=data.subject,
-            plain_text_content=data.content
+        recipients = [{"email": email} for email in data.to]
+        recipients += [recipient.dict() for recipient in data.recipients]
+        if not recipients:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="At least one recipient is required"
             )
-        else:
-            # default to html
-            message = Mail(
-            from_email=data.from_email,
-            to_emails=data.to,
-            subject=data.subject,
-            html_content=data.content
+        try:
+            validate_template(data.subject, data.content)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        
+        send_at = data.send_at
+        if send_at and send_at.tzinfo is None:
+            send_at = send_at.replace(tzinfo=timezone.utc)
+        if send_at and send_at > datetime.now(timezone.utc) + timedelta(hours=72):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="send_at can be at most 72 hours in the future"
             )
-        sg = SendGridAPIClient(user["api_key"])
-        response = sg.send(message)
         
-        await log_email_send(
-            user_id=current_user_id,
-            to_email=data.to,
-            from_email=data.from_email,
-            subject=data.subject,
-            message_id=response.headers.get('X-Message-Id'),
-            status="sent"
-        )
+        # A batch id lets scheduled sends be paused or cancelled later
+        batch_id = await create_batch_id(user["api_key"]) if send_at else None
+        results = await send_bulk_email(
+            user["api_key"],
+            data.from_email,
+            data.subject,
+            data.content,
+            recipients,
+            content_type=data.content_type,
+            batch_id=batch_id,
+            send_at=send_at
+        )
+        
+        accepted = 0
+        offset = 0
+        for result in results:
+            chunk = recipients[offset:offset + result.recipient_count]
+            offset += result.recipient_count
+            if result.ok:
+                accepted += result.recipient_count
+            else:
+                logger.error(f"SendGrid rejected {result.recipient_count} recipients: {result.error['error_message']}")
+            await log_email_send(
+                user_id=current_user_id,
+                to_email=[recipient["email"] for recipient in chunk],
+                from_email=data.from_email,
+                subject=data.subject,
+                message_id=result.message_id,
+                status="sent" if result.ok else "failed"
+            )
+        
+        if not accepted:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Error sending email: {results[0].error['error_message']}"
+            )
         
         return {
-            "status": "success", 
-            "code": response.status_code,
-            "message_id": response.headers.get('X-Message-Id')
+            "status": "success" if accepted == len(recipients) else "partial",
+            "code": 202,
+            "message_id": next(result.message_id for result in results if result.ok),
+            "accepted": accepted,
+            "failed": len(recipients) - accepted,
+            "batch_id": batch_id,
+            "send_at": send_at.isoformat() if send_at else None
         }
     except HTTPException:
         raise
     except Exception as e:
-        await log_email_send(
-            user_id=current_user_id,
-            to_email=data.to,
-            from_email=data.from_email,
-            subject=data.subject,
-            status="failed"
-        )
         logger.error(f"Error sending email: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Error sending email: {str(e)}"
         )
 
+@router.post("/batches/{batch_id}/{action}")
+async def control_email_batch(batch_id: str, action: str, current_user_id: str = Depends(get_current_user_id)):
+    """Pause, resume or cancel an email batch scheduled with send_at"""
+    if action not in ("pause", "resume", "cancel"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown action")
+    user = await get_email_user(current_user_id)
+    if not user or not user.get("api_key"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No API key configured for this user")
+    if not await set_batch_status(user["api_key"], batch_id, action):
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"SendGrid could not {action} the batch")
+    return {"batch_id": batch_id, "status": action}
+
 @router.get("/logs")
 async def get_email_logs_endpoint(current_user_id: str = Depends(get_current_user_id), limit: int = 50):
     try:
@@ -1,17 +1,24 @@
 # sms_marketing.py
 from fastapi import APIRouter, HTTPException, Request, Response, Depends, UploadFile, File, Header, status, Body
-from models.marketing import BusinessVerifyRequest, NumberRequest, OTPVerifyRequest, SMSRequest
+from models.marketing import BusinessVerifyRequest, NumberRequest, OTPVerifyRequest, SMSRequest, SenderNumberRequest, MessagingServiceRequest
 from services.database import get_sms_users_collection, get_sms_logs_collection, get_twilio_numbers_collection, get_business_profiles_collection, get_users_collection
-from config import twilio_client, TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN
-from datetime import datetime, timezone, timedelta
+from config import twilio_client, TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, SMS_MAX_SENDER_NUMBERS, SMS_HOURLY_LIMIT
+from datetime import datetime, timezone
+import asyncio
+import hashlib
 import logging
 from bson import ObjectId
+from pymongo import ReturnDocument
 from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
 import re
 import pandas as pd
 import io
 from services.api_key_service import APIKeyService
+from services.sms_engine import send_sms_batch, user_senders, aggregate_rate, estimate_send_seconds
+from services.personalization import compile_template
+from services.idempotency import run_idempotent
+from services.rate_limiter import consume_quota, refund_quota
 from services.database import get_api_keys_collection
 from typing import List, Optional
 from pydantic import BaseModel, validator
@@ -206,7 +213,10 @@ async def get_sms_user(user_id: str):
     user = await sms_users_collection.find_one({"user_id": user_id})
     return user
 
-async def log_sms_send(user_id: str, to_number: str, from_number: str, message: str, message_id: str = None, status: str = "sent", cost: float = 0.0):
+async def log_sms_send(
+    user_id: str, to_number: str, from_number: str, message: str, message_id: str = None,
+    status: str = "sent", cost: float = 0.0, error_code: str = None, error_message: str = None
+):
     """Log SMS sending activity"""
     try:
         sms_logs_collection = await get_sms_logs_collection()
@@ -221,6 +231,9 @@ async def log_sms_send(user_id: str, to_number: str, from_number: str, message:
             "cost": cost,
             "timestamp": datetime.now(timezone.utc)
         }
+        if status != "sent":
+            log_doc["error_code"] = error_code
+            log_doc["error_message"] = error_message
         
         await sms_logs_collection.insert_one(log_doc)
         
@@ -371,7 +384,8 @@ async def send_sms_unified(
     message: Optional[str] = Body(None, description="SMS message content"),
     campaign_name: Optional[str] = Body("SMS Campaign", description="Campaign name for tracking"),
     excel_file: UploadFile = File(None, description="Excel file with contacts"),
-    current_user_id: str = Depends(get_current_user_id)
+    current_user_id: str = Depends(get_current_user_id),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     UNIFIED SMS SENDING ENDPOINT - Handles both single and bulk SMS
@@ -382,7 +396,32 @@ async def send_sms_unified(
     - Excel contacts (excel_contacts array) 
     - Excel file upload (excel_file)
     - JSON and form-data requests
+    Retries carrying the same Idempotency-Key get the original result back.
     """
+    request_body = {
+        "to_numbers": to_numbers, "contacts": contacts, "excel_contacts": excel_contacts,
+        "message": message, "campaign_name": campaign_name
+    }
+    if idempotency_key and excel_file:
+        content = await excel_file.read()
+        await excel_file.seek(0)
+        request_body["excel_file"] = hashlib.sha256(content).hexdigest()
+    return await run_idempotent(
+        idempotency_key, current_user_id, "sms.send",
+        lambda: _send_sms_unified(request, to_numbers, contacts, excel_contacts, message, campaign_name, excel_file, current_user_id),
+        request_body=request_body
+    )
+
+async def _send_sms_unified(
+    request: Request,
+    to_numbers: Optional[List[str]],
+    contacts: Optional[List[dict]],
+    excel_contacts: Optional[List[dict]],
+    message: Optional[str],
+    campaign_name: Optional[str],
+    excel_file: Optional[UploadFile],
+    current_user_id: str
+):
     if not twilio_client:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -584,6 +623,11 @@ async def send_sms_unified(
             detail="No valid recipients found. Provide phone numbers, contacts, or upload an Excel file."
         )
     
+    try:
+        template = compile_template(message)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
     # Rest of the function remains the same...
     # Check SMS credits
     required_credits = len(validated_contacts)
@@ -595,70 +639,39 @@ async def send_sms_unified(
             detail=f"Insufficient SMS credits. Required: {required_credits}, Available: {current_credits}"
         )
     
-    # Rate limiting check
-    sms_logs_collection = await get_sms_logs_collection()
-    hour_ago = datetime.now(timezone.utc) - timedelta(hours=1)
-    recent_messages = await sms_logs_collection.count_documents({
-        "user_id": current_user_id,
-        "timestamp": {"$gte": hour_ago},
-        "status": "sent"
-    })
-    
-    if recent_messages + len(validated_contacts) > 100:  # 100 SMS per hour limit
+    # Hourly send limit over a sliding hour, counted atomically so concurrent requests on any worker can't overshoot it
+    quota = await consume_quota(f"sms_hourly:{current_user_id}", len(validated_contacts), SMS_HOURLY_LIMIT, 3600)
+    if quota is None:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS, 
-            detail=f"Rate limit exceeded. You can send {100 - recent_messages} more SMS this hour."
+            detail=f"Rate limit exceeded. You can send at most {SMS_HOURLY_LIMIT} SMS per hour."
         )
     
-    # Get Twilio subaccount client
-    subaccount_client = get_twilio_subaccount_client(
-        user["subaccount_sid"],
-        user["subaccount_auth_token"]
-    )
-    
-    purchased_number = user["purchased_number"]
-    successful_sends = 0
-    failed_sends = 0
-    message_sids = []
+    senders = user_senders(user)
     batch_id = f"sms_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     
-    # Send to all recipients
-    for contact in validated_contacts:
-        try:
-            message_obj = subaccount_client.messages.create(
-                body=message,
-                from_=purchased_number,
-                to=contact["number"]
-            )
-            
-            # Log successful SMS
-            await log_sms_send(
-                user_id=current_user_id,
-                to_number=contact["number"],
-                from_number=purchased_number,
-                message=message,
-                message_id=message_obj.sid,
-                status="sent",
-                cost=0.0075
-            )
-            
-            successful_sends += 1
-            message_sids.append(message_obj.sid)
-            
-        except Exception as e:
-            logger.error(f"Error sending SMS to {contact['number']}: {e}")
-            
-            # Log failed SMS
-            await log_sms_send(
-                user_id=current_user_id,
-                to_number=contact["number"],
-                from_number=purchased_number,
-                message=message,
-                status="failed",
-                cost=0.0
-            )
-            
-            failed_sends += 1
+    # Only sent messages count toward the hourly limit; all of it comes back if the batch raises
+    unsent = len(validated_contacts)
+    try:
+        # Send concurrently through the subaccount's pooled async client, spread over
+        # the tenant's senders and paced per sender
+        results = await send_sms_batch(
+            user["subaccount_sid"],
+            user["subaccount_auth_token"],
+            senders,
+            [
+                {"to": contact["number"], "body": body}
+                for contact, body in zip(validated_contacts, template.render_many(validated_contacts))
+            ],
+            current_user_id,
+            messages_per_second=user.get("sms_messages_per_second")
+        )
+        message_sids = [result.sid for result in results if result.ok]
+        successful_sends = len(message_sids)
+        failed_sends = len(results) - successful_sends
+        unsent = failed_sends
+    finally:
+        await refund_quota(quota, unsent)
     
     # Update credits (only deduct successful sends)
     if successful_sends > 0:
@@ -691,6 +704,10 @@ async def send_sms_unified(
         "successful": successful_sends,
         "failed": failed_sends,
         "remaining_credits": current_credits - successful_sends,
+        "sender_count": len(senders),
+        "estimated_duration_seconds": estimate_send_seconds(
+            len(validated_contacts), senders, user.get("sms_messages_per_second")
+        ),
         "batch_id": batch_id,
         "campaign_name": campaign_name
     }
@@ -991,6 +1008,106 @@ async def get_user_sms_status(current_user_id: str = Depends(get_current_user_id
             detail=f"Error retrieving SMS status: {str(e)}"
         )
        
+async def _get_registered_sms_user(current_user_id: str) -> dict:
+    sms_users_collection = await get_sms_users_collection()
+    user = await sms_users_collection.find_one({"user_id": current_user_id})
+    if not user or not user.get("number_verified"):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User number not verified. Please complete number registration first."
+        )
+    return user
+
+def _sender_pool(user: dict) -> dict:
+    senders = user_senders(user)
+    return {
+        "purchased_number": user.get("purchased_number"),
+        "sender_numbers": user.get("sender_numbers", []),
+        "messaging_service_sid": user.get("messaging_service_sid"),
+        "active_senders": senders,
+        "messages_per_second": aggregate_rate(senders, user.get("sms_messages_per_second"))
+    }
+
+@router.get("/senders")
+async def get_sms_senders(current_user_id: str = Depends(get_current_user_id)):
+    """Sender numbers / Messaging Service used to fan out SMS sends, with their combined rate"""
+    user = await _get_registered_sms_user(current_user_id)
+    return _sender_pool(user)
+
+@router.post("/senders", status_code=status.HTTP_201_CREATED)
+async def add_sms_sender(data: SenderNumberRequest, current_user_id: str = Depends(get_current_user_id)):
+    """Attach another number owned by the user's Twilio subaccount to the sender pool"""
+    user = await _get_registered_sms_user(current_user_id)
+    phone_number = clean_and_validate_phone_number(data.phone_number)
+    if not phone_number:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid phone number")
+    if phone_number in user_senders({**user, "messaging_service_sid": None}):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Number is already a sender")
+    if len(user.get("sender_numbers", [])) >= SMS_MAX_SENDER_NUMBERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {SMS_MAX_SENDER_NUMBERS} sender numbers are allowed"
+        )
+    
+    subaccount_client = get_twilio_subaccount_client(user["subaccount_sid"], user["subaccount_auth_token"])
+    try:
+        owned = await asyncio.to_thread(subaccount_client.incoming_phone_numbers.list, phone_number=phone_number, limit=1)
+    except TwilioRestException as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Twilio error: {e.msg}")
+    if not owned:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Number is not owned by your Twilio subaccount"
+        )
+    
+    sms_users_collection = await get_sms_users_collection()
+    user = await sms_users_collection.find_one_and_update(
+        {"user_id": current_user_id},
+        {"$addToSet": {"sender_numbers": phone_number}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        return_document=ReturnDocument.AFTER
+    )
+    return _sender_pool(user)
+
+@router.delete("/senders/{phone_number}")
+async def remove_sms_sender(phone_number: str, current_user_id: str = Depends(get_current_user_id)):
+    """Detach a sender number; recipients that used it move to the remaining senders"""
+    user = await _get_registered_sms_user(current_user_id)
+    phone_number = clean_and_validate_phone_number(phone_number) or phone_number
+    if phone_number == user.get("purchased_number"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The primary number cannot be removed")
+    if phone_number not in user.get("sender_numbers", []):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sender number not found")
+    
+    sms_users_collection = await get_sms_users_collection()
+    user = await sms_users_collection.find_one_and_update(
+        {"user_id": current_user_id},
+        {"$pull": {"sender_numbers": phone_number}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        return_document=ReturnDocument.AFTER
+    )
+    return _sender_pool(user)
+
+@router.put("/messaging-service")
+async def set_sms_messaging_service(data: MessagingServiceRequest, current_user_id: str = Depends(get_current_user_id)):
+    """Send through a Twilio Messaging Service instead of individual numbers; null clears it"""
+    user = await _get_registered_sms_user(current_user_id)
+    sid = data.messaging_service_sid
+    if sid:
+        if not re.fullmatch(r"MG[0-9a-fA-F]{32}", sid):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Messaging Service SID")
+        subaccount_client = get_twilio_subaccount_client(user["subaccount_sid"], user["subaccount_auth_token"])
+        try:
+            await asyncio.to_thread(subaccount_client.messaging.v1.services(sid).fetch)
+        except TwilioRestException as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Messaging Service not found: {e.msg}")
+    
+    sms_users_collection = await get_sms_users_collection()
+    user = await sms_users_collection.find_one_and_update(
+        {"user_id": current_user_id},
+        {"$set": {"messaging_service_sid": sid, "updated_at": datetime.now(timezone.utc)}},
+        return_document=ReturnDocument.AFTER
+    )
+    return _sender_pool(user)
+
 @router.get("/logs")
 async def get_sms_logs_endpoint(current_user_id: str = Depends(get_current_user_id), limit: int = 50):
     """Get SMS sending logs for user"""
@@ -1,25 +1,34 @@
 from fastapi import APIRouter, HTTPException, Request, Response, Depends, UploadFile, File, Form, Header
 from services.database import get_users_collection, get_chat_history_collection
 from services.auth import get_current_user, validate_api_key
-from services.vector_store import load_vector_store_safely, close_vector_store, create_advanced_retriever
+from services.chatbot_service import (
+    retrieve_documents_coalesced, generate_reply, generate_reply_coalesced, WHATSAPP_REPLY_PROMPT
+)
 from services.generate_message import call_gemini_api
-from services.whatsapp_service import send_whatsapp_message, send_whatsapp_media, send_whatsapp_interactive
+from services.whatsapp_service import send_whatsapp_message, send_whatsapp_interactive, whatsapp_client
+from services.send_schedule import SendSchedule
+from services.campaign_queue import (
+    enqueue_campaign_tasks, control_campaign, cancel_campaign_tasks, get_task_status_counts,
+    TASK_SCHEDULED, TASK_PENDING, TASK_LEASED, TASK_PAUSED, TASK_CANCELLED
+)
 from services.database import get_devices_collection
+from services.send_errors import INVALID_NUMBER, NOT_ON_WHATSAPP
+from services.idempotency import run_idempotent
+from services.personalization import validate_template
+from services.whatsapp_payloads import WHATSAPP_MESSAGE_TYPES, build_message
+from services.meta_credentials import require_valid_credentials, current_health, record_health, CREDENTIALS_VALID
+from services.priority_lanes import REALTIME
+from services.auto_reply_service import match_auto_reply, send_auto_reply, invalidate_auto_replies
 from models.campaigns import IdeaInput
 from routes.campaigns import generate_message_from_idea
-from utils.embeddings import embedding_model
-from config import META_API_VERIFY_TOKEN, WHATSAPP_API_URL, GROQ_API_KEY
+from config import META_API_VERIFY_TOKEN, WHATSAPP_API_URL
 from bson import ObjectId
-import requests
 import json
 import pandas as pd
 from io import BytesIO
-import asyncio
 import logging
 from datetime import datetime, timezone
-from langchain_groq import ChatGroq
-from langchain_core.prompts import PromptTemplate
-from typing import Optional, List
+from typing import Optional
 from fastapi import Query
 from datetime import datetime, timezone, timedelta
 from pymongo import UpdateOne
@@ -85,43 +94,31 @@ async def whatsapp_callback(request: Request):
     if not code:
         raise HTTPException(status_code=400, detail="Missing authorization code")
 
-    token_url = (
-        f"https://graph.facebook.com/v19.0/oauth/access_token"
-        f"?client_id={META_APP_ID}"
-        f"&redirect_uri={META_REDIRECT_URI}"
-        f"&client_secret={META_APP_SECRET}"
-        f"&code={code}"
+    token_result = await whatsapp_client.request(
+        "GET", "/oauth/access_token", None,
+        params={
+            "client_id": META_APP_ID,
+            "redirect_uri": META_REDIRECT_URI,
+            "client_secret": META_APP_SECRET,
+            "code": code
+        }
     )
-    
-    try:
-        token_response = requests.get(token_url)
-        token_response.raise_for_status()
-        token_data = token_response.json()
-        access_token = token_data.get("access_token")
-    except requests.RequestException as e:
-        raise HTTPException(status_code=400, detail=f"Failed to retrieve access token: {e}")
+    if not token_result:
+        raise HTTPException(status_code=400, detail=f"Failed to retrieve access token: {token_result.error_message}")
+    access_token = (token_result.data or {}).get("access_token")
 
     if not access_token:
         raise HTTPException(status_code=400, detail="Failed to retrieve access token")
 
     try:
-        business_info = requests.get(
-            f"https://graph.facebook.com/v19.0/me?fields=id,name&access_token={access_token}"
-        ).json()
-
-        waba_resp = requests.get(
-            f"https://graph.facebook.com/v19.0/me/owned_whatsapp_business_accounts"
-            f"?access_token={access_token}"
-        ).json()
+        waba_resp = (await whatsapp_client.request("GET", "/me/owned_whatsapp_business_accounts", access_token)).data or {}
 
         waba_id = None
         phone_number_id = None
 
         if "data" in waba_resp and len(waba_resp["data"]) > 0:
             waba_id = waba_resp["data"][0]["id"]
-            phone_resp = requests.get(
-                f"https://graph.facebook.com/v19.0/{waba_id}/phone_numbers?access_token={access_token}"
-            ).json()
+            phone_resp = (await whatsapp_client.request("GET", f"/{waba_id}/phone_numbers", access_token)).data or {}
             if "data" in phone_resp and len(phone_resp["data"]) > 0:
                 phone_number_id = phone_resp["data"][0]["id"]
 
@@ -134,6 +131,9 @@ async def whatsapp_callback(request: Request):
                 "whatsapp_account_verified": True
             }}
         )
+        if phone_number_id:
+            # The token just listed this number, so campaign starts can trust it right away
+            await record_health(ObjectId(state), phone_number_id, access_token, CREDENTIALS_VALID, 200)
 
         return {
             "message": "WhatsApp account connected successfully!",
@@ -159,7 +159,12 @@ async def whatsapp_webhook(request: Request):
 
     users_collection = await get_users_collection()
     user = await users_collection.find_one({"phone_number_id": business_phone_id})
-    if not user or not user.get('vector_store_path'):
+    if not user:
+        return Response(status_code=200)
+
+    # Keyword auto-replies short-circuit retrieval and the LLM
+    auto_reply = await match_auto_reply(user, user_question)
+    if not auto_reply and not user.get('vector_store_path'):
         return Response(status_code=200)
 
     chat_history_collection = await get_chat_history_collection()
@@ -172,26 +177,27 @@ async def whatsapp_webhook(request: Request):
     }
     await chat_history_collection.insert_one(incoming_chat)
 
-    vector_store = None
+    if auto_reply:
+        await chat_history_collection.insert_one({
+            "user_id": user["_id"],
+            "phone_number": from_number,
+            "message": auto_reply.get("message_content", ""),
+            "is_from_user": False,
+            "auto_reply_id": auto_reply["_id"],
+            "timestamp": datetime.now(timezone.utc)
+        })
+        if user.get('meta_api_key'):
+            await send_auto_reply(user, from_number, auto_reply)
+        return Response(status_code=200)
+
+    route = None
     try:
-        loop = asyncio.get_event_loop()
-        vector_store = await loop.run_in_executor(
-            None, load_vector_store_safely, user['vector_store_path']
-        )
-        
-        advanced_retriever = create_advanced_retriever(vector_store, embedding_model)
-        compressed_docs = await loop.run_in_executor(
-            None,
-            advanced_retriever.get_relevant_documents,
-            user_question
-        )
-        
+        compressed_docs, _ = await retrieve_documents_coalesced(user, user_question)
         docs_text = "\n\n".join([d.page_content for d in compressed_docs[:3]])
-        logger.info(f"Retrieved {len(compressed_docs)} documents after compression")
 
         # Fetch last 5 chat messages for context
         last_msgs = await chat_history_collection.find(
-            {"phone_number": from_number}
+            {"user_id": user["_id"], "phone_number": from_number}
         ).sort("timestamp", -1).limit(5).to_list(length=5)
         
         # Build conversation context
@@ -202,49 +208,32 @@ async def whatsapp_webhook(request: Request):
 
         combined_context = f"ShortConversation:\n{conversation_history}\n\nKnowledgeBase:\n{docs_text}".strip()
 
-        if not GROQ_API_KEY:
-            ai_response = "AI service is currently unavailable. Please try again later."
+        # With no earlier turns the context is the same for every sender, so the answer can be shared
+        if len(last_msgs) <= 1:
+            reply, _ = await generate_reply_coalesced(
+                user, WHATSAPP_REPLY_PROMPT, combined_context, user_question, compressed_docs
+            )
         else:
-            chat_model = ChatGroq(api_key=GROQ_API_KEY, model="llama-3.3-70b-versatile", temperature=0.3)
-            prompt = PromptTemplate.from_template("""
-You are a intelligent bot that helps users based on the provided context. Your tone must be according to the whatsapp platform bot.
-Context: {context}
-
-Question: {question}
-
-Instructions:
-- Use the knowledge base content primarily to answer the question
-- If the knowledge base doesn't contain relevant information, respond politely that you don't have that information
-- Keep responses concise and helpful
-- Maintain a friendly, professional tone
-- Provide response in short and precise manner appropriate for WhatsApp Marketing Bot 
-                                              
-Note: Do not tell from  ur side that i do not find from theknowledge base provided instead just say an appology message that i do not have that information to that.
-Do not use any vague or introduction message. Also if there is no context then just say that "Sorry, I donot have any information regarding this."
-
-Answer:""")
-            chain = prompt | chat_model
-            response = await chain.ainvoke({"context": combined_context, "question": user_question})
-            ai_response = response.content
+            reply = await generate_reply(WHATSAPP_REPLY_PROMPT, combined_context, user_question, compressed_docs)
+        ai_response = reply["answer"]
+        route = reply["route"]
         
     except Exception as e:
         logger.error(f"Error during advanced RAG processing: {e}")
         ai_response = "Sorry, I'm having trouble finding that information right now."
-    finally:
-        if vector_store:
-            close_vector_store(vector_store)
 
     outgoing_chat = {
         "user_id": user["_id"],
         "phone_number": from_number,
         "message": ai_response,
         "is_from_user": False,
+        "route": route,
         "timestamp": datetime.now(timezone.utc)
     }
     await chat_history_collection.insert_one(outgoing_chat)
 
     if user.get('meta_api_key'):
-        send_whatsapp_message(user['phone_number_id'], from_number, ai_response, user['meta_api_key'])
+        await send_whatsapp_message(user['phone_number_id'], from_number, ai_response, user['meta_api_key'], lane=REALTIME)
     
     return Response(status_code=200)
 
@@ -443,8 +432,50 @@ async def delete_campaign(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Campaign not found")
     
+    # Stop any recipients still waiting in the send queue
+    await cancel_campaign_tasks(campaign_id)
+    
     return {"success": True}
 
+async def _control_whatsapp_campaign(campaign_id: str, action: str, current_user: dict):
+    campaigns_collection = await get_whatsapp_campaigns_collection()
+    campaign = await campaigns_collection.find_one(
+        {"_id": ObjectId(campaign_id), "user_id": current_user["_id"]}
+    )
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    
+    try:
+        result = await control_campaign(campaigns_collection, campaign, action)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"success": True, "campaign_id": campaign_id, **result}
+
+@router.post("/campaigns/{campaign_id}/pause")
+async def pause_campaign(
+    campaign_id: str, 
+    current_user: dict = Depends(require_whatsapp_marketing)
+):
+    """Pause a sending campaign; unsent recipients stay queued - requires whatsapp_marketing key"""
+    return await _control_whatsapp_campaign(campaign_id, "pause", current_user)
+
+@router.post("/campaigns/{campaign_id}/resume")
+async def resume_campaign(
+    campaign_id: str, 
+    current_user: dict = Depends(require_whatsapp_marketing)
+):
+    """Resume a paused campaign - requires whatsapp_marketing key"""
+    return await _control_whatsapp_campaign(campaign_id, "resume", current_user)
+
+@router.post("/campaigns/{campaign_id}/cancel")
+async def cancel_campaign(
+    campaign_id: str, 
+    current_user: dict = Depends(require_whatsapp_marketing)
+):
+    """Cancel a campaign; unsent recipients are marked cancelled - requires whatsapp_marketing key"""
+    return await _control_whatsapp_campaign(campaign_id, "cancel", current_user)
+
 @router.post("/knowledge-base/upload-replace")
 async def upload_replace_knowledge_base(
     file: UploadFile = File(...),
@@ -510,12 +541,16 @@ async def clear_knowledge_base(
         if os.path.exists(vector_store_dir):
             shutil.rmtree(vector_store_dir)
     
+    from services.knowledge_base_service import forget_crawled_pages
+    await forget_crawled_pages(current_user["_id"])
+    
     # Update user in database
     await users_collection.update_one(
         {"_id": ObjectId(current_user["_id"])},
         {"$unset": {
             "vector_store_path": "",
             "knowledge_base_file": "",
+            "knowledge_base_source_url": "",
             "knowledge_base_updated": "",
             "documents_count": ""
         }}
@@ -557,6 +592,7 @@ async def create_auto_reply(
     }
     
     result = await auto_replies_collection.insert_one(auto_reply)
+    await invalidate_auto_replies(current_user["_id"])
     return {"success": True, "auto_reply_id": str(result.inserted_id)}
 
 @router.get("/auto-replies")
@@ -609,6 +645,7 @@ async def update_auto_reply(
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Auto-reply not found")
     
+    await invalidate_auto_replies(current_user["_id"])
     return {"success": True}
 
 @router.delete("/auto-replies/{auto_reply_id}")
@@ -626,6 +663,7 @@ async def delete_auto_reply(
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Auto-reply not found")
     
+    await invalidate_auto_replies(current_user["_id"])
     return {"success": True}
 
 @router.post("/contacts/process-excel")
@@ -711,9 +749,17 @@ async def process_excel_contacts(
 @router.post("/send-message")
 async def send_bulk_message(
     message_data: dict, 
-    current_user: dict = Depends(require_whatsapp_marketing)
+    current_user: dict = Depends(require_whatsapp_marketing),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Send bulk WhatsApp messages with only Template and AI options - requires whatsapp_marketing key"""
+    return await run_idempotent(
+        idempotency_key, current_user["_id"], "whatsapp.send-message",
+        lambda: _send_bulk_message(message_data, current_user),
+        request_body=message_data
+    )
+
+async def _send_bulk_message(message_data: dict, current_user: dict):
     
     # ==================== META CREDENTIALS VALIDATION ====================
     if not current_user.get('meta_api_key'):
@@ -756,38 +802,62 @@ async def send_bulk_message(
     if not campaign_name:
         raise HTTPException(status_code=400, detail="Campaign name is required")
     
+    # ==================== OPTIONAL SCHEDULE ====================
+    try:
+        schedule = SendSchedule.from_request(
+            send_at=message_data.get("send_at"),
+            spread_minutes=message_data.get("spread_minutes"),
+            window_start=message_data.get("window_start"),
+            window_end=message_data.get("window_end"),
+            timezone_name=message_data.get("timezone")
+        )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid schedule: {e}")
+    
     # ==================== INSTANCE IS NOW COMPULSORY ====================
+    # One instance, a list of them ("instance_ids"), or every active device ("all_devices")
     instance_id = message_data.get("instance_id")
-    if not instance_id:
+    instance_ids = message_data.get("instance_ids") or []
+    all_devices = bool(message_data.get("all_devices"))
+    if not instance_id and not instance_ids and not all_devices:
         raise HTTPException(status_code=400, detail="Instance ID is required for sending messages")
     
     # ==================== VALIDATE INSTANCE ACCESS ====================
-    try:
-        devices_collection = await get_devices_collection()
-        device = await devices_collection.find_one({
-            "_id": ObjectId(instance_id), 
+    devices_collection = await get_devices_collection()
+    if all_devices:
+        devices = await devices_collection.find(
+            {"user_id": current_user["_id"], "status": "active"}
+        ).to_list(length=100)
+        if not devices:
+            raise HTTPException(status_code=400, detail="No active instances to send from")
+        instance_ids = [str(device["_id"]) for device in devices]
+    else:
+        instance_ids = list(dict.fromkeys(instance_ids or [instance_id]))
+        try:
+            device_object_ids = [ObjectId(device_id) for device_id in instance_ids]
+        except Exception:
+            raise HTTPException(
+                status_code=400, 
+                detail="Invalid instance ID format"
+            )
+        devices = await devices_collection.find({
+            "_id": {"$in": device_object_ids}, 
             "user_id": current_user["_id"]
-        })
+        }).to_list(length=len(device_object_ids))
         
-        if not device:
+        if len(devices) != len(instance_ids):
             raise HTTPException(
                 status_code=404, 
                 detail="Instance not found or you don't have access to this instance"
             )
         
-        if device.get("status") != "active":
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Instance is not active. Current status: {device.get('status', 'unknown')}"
-            )
-            
-    except Exception as e:
-        if isinstance(e, HTTPException):
-            raise e
-        raise HTTPException(
-            status_code=400, 
-            detail="Invalid instance ID format"
-        )
+        for device in devices:
+            if device.get("status") != "active":
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"Instance {device.get('name', device['_id'])} is not active. Current status: {device.get('status', 'unknown')}"
+                )
+    instance_id = instance_ids[0]
     
     # Determine message source: template or AI-generated
     message_source = message_data.get("message_source")
@@ -890,22 +960,8 @@ async def send_bulk_message(
         if not message_type:
             raise HTTPException(status_code=400, detail="Message type is required when using template source")
         
-        # Use validate_message_type variable (values remain as-is)
-        validate_message_type = [
-            "Text",
-            "Text with Media", 
-            "Media",
-            "Buttons",
-            "Buttons with Media",
-            "List",
-            "List with Media",
-            "List/Menu",
-            "List/Menu with Media",
-            "Poll",
-            "Poll with Media"
-        ]
-        if message_type not in validate_message_type:
-            raise HTTPException(status_code=400, detail="Message type must be one of: " + ", ".join(validate_message_type))
+        if message_type not in WHATSAPP_MESSAGE_TYPES:
+            raise HTTPException(status_code=400, detail="Message type must be one of: " + ", ".join(WHATSAPP_MESSAGE_TYPES))
     
     # For AI source, message_type is optional - default to "Text" if not provided
     elif message_source == "ai":
@@ -913,21 +969,8 @@ async def send_bulk_message(
             message_type = "" 
         else:
             # Still validate if provided, but make it optional
-            validate_message_type = [
-                "Text",
-                "Text with Media",
-                "Media",
-                "Buttons",
-                "Buttons with Media",
-                "List",
-                "List with Media",
-                "List/Menu",
-                "List/Menu with Media",
-                "Poll",
-                "Poll with Media"
-            ]
-            if message_type not in validate_message_type:
-                raise HTTPException(status_code=400, detail="Message type must be one of: " + ", ".join(validate_message_type))
+            if message_type not in WHATSAPP_MESSAGE_TYPES:
+                raise HTTPException(status_code=400, detail="Message type must be one of: " + ", ".join(WHATSAPP_MESSAGE_TYPES))
     
     # Instance selection is now COMPULSORY (already validated above)
     phone_number_id = instance_id
@@ -935,6 +978,10 @@ async def send_bulk_message(
     message_content = ""
     media_url = message_data.get("media_url", "")
     caption = message_data.get("caption", "")
+    buttons = message_data.get("buttons") or []
+    list_items = message_data.get("list_items") or []
+    poll_data = message_data.get("poll_data")
+    approved_template = message_data.get("approved_template")
     
     # Handle different message sources
     if message_source == "template":
@@ -955,6 +1002,10 @@ async def send_bulk_message(
         message_content = template.get("content", "")
         media_url = media_url or template.get("media_url", "")
         caption = caption or template.get("caption", "")
+        buttons = buttons or template.get("buttons", [])
+        list_items = list_items or template.get("list_items", [])
+        poll_data = poll_data or template.get("poll_data")
+        approved_template = approved_template or template.get("approved_template")
         
     elif message_source == "ai":
         # For AI, use the PRE-GENERATED message content directly
@@ -965,164 +1016,85 @@ async def send_bulk_message(
             raise HTTPException(status_code=400, detail="AI message content is required")
     
     # Validation based on message type
-    if not message_content and message_type not in ["Media"]:
+    if not message_content and message_type not in ["Media", "Approved Template"]:
         # For non-media-only messages, content is required
         raise HTTPException(status_code=400, detail="Message content is required")
     
     if message_type in ["Text with Media", "Media"] and not media_url:
         raise HTTPException(status_code=400, detail="Media URL is required for media messages")
     
-    # ==================== VALIDATE META API CONNECTION ====================
+    # Build the provider payload now so a malformed message fails here, not per contact;
+    # {name}/{var1..3} are filled in per contact when the message is sent
     try:
-        # Test Meta API connection with a simple request
-        test_url = f"https://graph.facebook.com/v19.0/{current_user['phone_number_id']}"
-        headers = {"Authorization": f"Bearer {current_user['meta_api_key']}"}
-        
-        test_response = requests.get(test_url, headers=headers)
-        if test_response.status_code == 401:
-            raise HTTPException(
-                status_code=400,
-                detail="Meta API token is invalid or expired. Please reconnect your WhatsApp Business account."
-            )
-        elif test_response.status_code == 403:
-            raise HTTPException(
-                status_code=400,
-                detail="Access denied to Meta API. Please check your permissions and reconnect your account."
-            )
-        elif test_response.status_code != 200:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Meta API connection failed with status {test_response.status_code}. Please check your WhatsApp Business account setup."
-            )
-            
-    except requests.RequestException as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Failed to connect to Meta API: {str(e)}. Please check your internet connection and try again."
+        validate_template(message_content, caption)
+        build_message(
+            message_type or "Text", message_content, media_url, caption,
+            buttons, list_items, poll_data, approved_template
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # ==================== MESSAGE LOGGING COLLECTION ====================
-    message_logs_collection = await get_whatsapp_message_logs_collection()
-    
-    # Process sending messages
-    results = []
-    successful_sends = 0
-    failed_sends = 0
-    message_logs = []
-    
-    for contact in validated_contacts:
-        try:
-            whatsapp_response = None
-            message_status = "failed"
-            error_message = ""
-            
-            # Text-only
-            if message_type == "Text":
-                whatsapp_response = send_whatsapp_message(
-                    phone_number_id=phone_number_id,
-                    to_number=contact["number"],
-                    message=message_content,
-                    access_token=current_user['meta_api_key']
-                )
-            # Media (with or without text)
-            elif message_type in ["Text with Media", "Media"]:
-                # caption used only when there is accompanying text (Text with Media)
-                use_caption = caption if message_type == "Text with Media" else ""
-                whatsapp_response = send_whatsapp_media(
-                    phone_number_id=phone_number_id,
-                    to_number=contact["number"],
-                    media_url=media_url,
-                    caption=use_caption,
-                    access_token=current_user['meta_api_key']
-                )
-            # Integration with a proper interactive payload can be added later.
-            else:
-                whatsapp_response = send_whatsapp_message(
-                    phone_number_id=phone_number_id,
-                    to_number=contact["number"],
-                    message=message_content,
-                    access_token=current_user['meta_api_key']
-                )
-            
-            if whatsapp_response:
-                successful_sends += 1
-                message_status = "sent"
-                results.append({"contact": contact["number"], "status": "sent"})
-            else:
-                failed_sends += 1
-                message_status = "failed"
-                error_message = "WhatsApp API returned no response"
-                results.append({"contact": contact["number"], "status": "failed"})
-                
-        except Exception as e:
-            logger.error(f"Failed to send to {contact['number']}: {e}")
-            failed_sends += 1
-            message_status = "failed"
-            error_message = str(e)
-            results.append({"contact": contact["number"], "status": "failed"})
-        
-        # ==================== LOG INDIVIDUAL MESSAGE ====================
-        try:
-            log_entry = {
-                "user_id": current_user["_id"],
-                "campaign_name": campaign_name,
-                "contact_number": contact["number"],
-                "contact_name": contact.get("name", ""),
-                "message_content": message_content,
-                "message_type": message_type,
-                "message_source": message_source,
-                "media_url": media_url,
-                "caption": caption,
-                "status": message_status,
-                "error_message": error_message,
-                "instance_id": instance_id,
-                "whatsapp_message_id": whatsapp_response.get("messages")[0]["id"] if whatsapp_response and whatsapp_response.get("messages") else None,
-                "sent_at": datetime.now(timezone.utc),
-                "created_at": datetime.now(timezone.utc)
-            }
-            message_logs.append(log_entry)
-        except Exception as log_error:
-            logger.error(f"Error creating log entry for {contact['number']}: {log_error}")
-    
-    # ==================== BULK INSERT MESSAGE LOGS ====================
-    try:
-        if message_logs:
-            await message_logs_collection.insert_many(message_logs)
-            logger.info(f"Logged {len(message_logs)} individual message records")
-    except Exception as e:
-        logger.error(f"Error saving message logs: {e}")
-    # ==================== END MESSAGE LOGGING ====================
-    
-    # Save campaign and get campaign ID
+    # ==================== VALIDATE META API CONNECTION ====================
+    # Cached token health from the user record; stale checks refresh in the background
+    require_valid_credentials(current_user)
+    # Refresh each extra device's check (and its tier and quality) for the device balancer
+    for device_id in instance_ids:
+        if device_id != current_user.get("phone_number_id"):
+            current_health(current_user, device_id)
+    
+    # ==================== QUEUE CAMPAIGN ====================
+    # Save the campaign first; campaign workers send one durable task per contact
+    # and keep sent_count / failed_count up to date as they go
+    campaign_status = "scheduled" if schedule and schedule.send_at > datetime.now(timezone.utc) else "processing"
     campaigns_collection = await get_whatsapp_campaigns_collection()
     campaign = {
         "user_id": current_user["_id"],
         "campaign_name": campaign_name,
         "type": "broadcast",
-        "status": "Active",
+        "status": campaign_status,
+        "schedule": schedule.to_document() if schedule else None,
         "message_source": message_source,
         "message_type": message_type,
         "message_content": message_content,
         "media_url": media_url,
         "caption": caption,
+        "buttons": buttons,
+        "list_items": list_items,
+        "poll_data": poll_data,
+        "approved_template": approved_template,
         "template_id": message_data.get("template_id"),
         "ai_idea": message_data.get("ai_idea"),
         "instance_id": instance_id,
+        "phone_number_id": phone_number_id,
+        # Set when the campaign is spread over several devices; see services.device_balancer
+        "instance_ids": instance_ids if len(instance_ids) > 1 else None,
         "contacts": validated_contacts,
-        "sent_count": successful_sends,
-        "failed_count": failed_sends,
+        "sent_count": 0,
+        "failed_count": 0,
         "created_at": datetime.now(timezone.utc)
     }
     result = await campaigns_collection.insert_one(campaign)
     campaign_id = str(result.inserted_id)
     
+    queued_count = await enqueue_campaign_tasks(
+        campaign_id,
+        current_user["_id"],
+        "whatsapp_broadcast",
+        [{"recipient": contact["number"], "data": contact} for contact in validated_contacts],
+        schedule=schedule
+    )
+    
     return {
         "success": True,
         "campaign_id": campaign_id,  
-        "sent_count": successful_sends,
-        "failed_count": failed_sends,
+        "status": campaign_status,
+        "send_at": schedule.send_at.isoformat() if schedule else None,
+        "queued_count": queued_count,
+        "sent_count": 0,
+        "failed_count": 0,
         "message_source": message_source,
         "instance_used": instance_id,
+        "instances_used": instance_ids,
         "template_id": message_data.get("template_id"),
         "campaign_name": campaign_name,
         "message_content": message_content,  
@@ -1130,10 +1102,8 @@ async def send_bulk_message(
         "media_used": media_url if media_url else None,
         "contacts_source": "manual" if contacts else "excel",
         "total_contacts": len(validated_contacts),
-        "results": results,
         "logging": {
-            "contacts_saved": len(contact_operations) if 'contact_operations' in locals() else 0,
-            "messages_logged": len(message_logs)
+            "contacts_saved": len(contact_operations) if 'contact_operations' in locals() else 0
         }
     }
 
@@ -1525,6 +1495,7 @@ async def get_campaign_reports(
         sent_messages = 0
         failed_messages = 0
         pending_messages = 0
+        scheduled_messages = 0
         paused_messages = 0
         cancelled_messages = 0
         invalid_numbers = 0
@@ -1535,41 +1506,38 @@ async def get_campaign_reports(
             sent_messages += camp.get("sent_count", 0)
             failed_messages += camp.get("failed_count", 0)
         
-        # Calculate additional statistics from message logs for better accuracy
-        message_logs_stats = await message_logs_collection.aggregate([
-            {"$match": {"user_id": current_user["_id"]}},
-            {"$group": {
-                "_id": "$status",
-                "count": {"$sum": 1}
-            }}
-        ]).to_list(length=20)
+        # Live recipient states from the send queue for the listed campaigns
+        task_counts = await get_task_status_counts({"campaign_id": {"$in": [c["_id"] for c in campaigns]}})
         
-        # Convert message logs stats to a dictionary
-        logs_stats_dict = {}
-        for stat in message_logs_stats:
-            logs_stats_dict[stat["_id"]] = stat["count"]
+        queue_totals = {}
+        for campaign_counts in task_counts.values():
+            for task_status, count in campaign_counts.items():
+                queue_totals[task_status] = queue_totals.get(task_status, 0) + count
         
-        # Use message logs data for more accurate counts
-        sent_messages = logs_stats_dict.get("sent", sent_messages)
-        failed_messages = logs_stats_dict.get("failed", failed_messages)
-        pending_messages = logs_stats_dict.get("pending", 0)
-        paused_messages = logs_stats_dict.get("paused", 0)
-        cancelled_messages = logs_stats_dict.get("cancelled", 0)
+        # sent_count / failed_count on the campaigns are kept live by the workers
+        pending_messages = queue_totals.get(TASK_PENDING, 0) + queue_totals.get(TASK_LEASED, 0)
+        # Held by send_at, a delivery window or retry backoff
+        scheduled_messages = queue_totals.get(TASK_SCHEDULED, 0)
+        paused_messages = queue_totals.get(TASK_PAUSED, 0)
+        cancelled_messages = queue_totals.get(TASK_CANCELLED, 0)
         
-        # For invalid and non-whatsapp, we can check error messages in logs
+        # Invalid and non-WhatsApp numbers come from the classified error codes
         invalid_logs = await message_logs_collection.count_documents({
             "user_id": current_user["_id"],
-            "error_message": {"$regex": "invalid|Invalid", "$options": "i"}
+            "error_code": INVALID_NUMBER
         })
         non_whatsapp_logs = await message_logs_collection.count_documents({
             "user_id": current_user["_id"], 
-            "error_message": {"$regex": "whatsapp|WhatsApp", "$options": "i"}
+            "error_code": NOT_ON_WHATSAPP
         })
         
         invalid_numbers = invalid_logs
         non_whatsapp_numbers = non_whatsapp_logs
         
-        total_messages = sent_messages + failed_messages + pending_messages + paused_messages + cancelled_messages
+        total_messages = (
+            sent_messages + failed_messages + pending_messages + scheduled_messages
+            + paused_messages + cancelled_messages
+        )
         
         # Format campaigns for the report table
         formatted_reports = []
@@ -1578,22 +1546,25 @@ async def get_campaign_reports(
                 # Safely convert the document
                 formatted_campaign = safe_convert_document(campaign)
                 
-                # Calculate additional statistics from message logs for this campaign
-                campaign_stats = await message_logs_collection.aggregate([
-                    {"$match": {
-                        "user_id": current_user["_id"],
-                        "campaign_name": formatted_campaign.get("campaign_name", formatted_campaign.get("name", ""))
-                    }},
-                    {"$group": {
-                        "_id": "$status",
-                        "count": {"$sum": 1}
-                    }}
-                ]).to_list(length=10)
+                status_counts = task_counts.get(campaign["_id"])
                 
-                # Convert stats to readable format
-                status_counts = {}
-                for stat in campaign_stats:
-                    status_counts[stat["_id"]] = stat["count"]
+                # Campaigns sent before the send queue only have message logs
+                if status_counts is None:
+                    campaign_stats = await message_logs_collection.aggregate([
+                        {"$match": {
+                            "user_id": current_user["_id"],
+                            "campaign_name": formatted_campaign.get("campaign_name", formatted_campaign.get("name", ""))
+                        }},
+                        {"$group": {
+                            "_id": "$status",
+                            "count": {"$sum": 1}
+                        }}
+                    ]).to_list(length=10)
+                    
+                    # Convert stats to readable format
+                    status_counts = {}
+                    for stat in campaign_stats:
+                        status_counts[stat["_id"]] = stat["count"]
                 
                 # Get instance information - use device name instead of ID
                 instance_id = formatted_campaign.get("instance_id")
@@ -1656,6 +1627,7 @@ async def get_campaign_reports(
             "cancelled": cancelled_messages,
             "sent": sent_messages,
             "pending": pending_messages,
+            "scheduled": scheduled_messages,
             "paused": paused_messages,
             "failed": failed_messages,
             "invalid": invalid_numbers,
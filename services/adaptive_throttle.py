@@ -0,0 +1,130 @@
+"""AIMD send-rate control per provider sender.
+
+Every paced sender key ("whatsapp:<phone_number_id>", "sms_number:<sender>",
+...) has a controller that sets the rate its token bucket runs at:
+
+- a rate-limit response halves the rate and, when the provider sent
+  Retry-After, holds the sender's sends until it has passed;
+- latency well above the sender's healthy baseline trims the rate;
+- healthy sends raise it by a small step per second, up to the ceiling
+  (the configured rate times ADAPTIVE_CEILING_FACTOR).
+
+Decreases are spaced at least one latency period apart, so a burst of
+throttled responses to requests already in flight counts once.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from config import (
+    ADAPTIVE_THROTTLE_ENABLED, ADAPTIVE_CEILING_FACTOR, ADAPTIVE_MIN_RATE_FRACTION,
+    ADAPTIVE_INCREASE_FRACTION, ADAPTIVE_DECREASE_FACTOR, ADAPTIVE_LATENCY_FACTOR
+)
+from services.send_errors import RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+# Latency inflation trims the rate more gently than an explicit rate limit
+LATENCY_DECREASE_FACTOR = 0.8
+# Weight of each new sample in the short (current) and long (baseline) latency averages
+LATENCY_ALPHA = 0.2
+BASELINE_ALPHA = 0.02
+MIN_DECREASE_INTERVAL_SECONDS = 1.0
+
+class AIMDController:
+    def __init__(self, key: str, configured_rate: float):
+        self.key = key
+        self.rate = configured_rate
+        self.configure(configured_rate)
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self.paused_until = 0.0
+        self.throttled_count = 0
+        self._last_increase = time.monotonic()
+        self._last_decrease = 0.0
+
+    def configure(self, configured_rate: float):
+        """Follow a change in the sender's configured rate (e.g. a new Meta tier)"""
+        self.ceiling = configured_rate * ADAPTIVE_CEILING_FACTOR
+        self.floor = configured_rate * ADAPTIVE_MIN_RATE_FRACTION
+        self.configured_rate = configured_rate
+        self.rate = min(max(self.rate, self.floor), self.ceiling)
+
+    def _decrease(self, factor: float, reason: str) -> bool:
+        now = time.monotonic()
+        if now - self._last_decrease < max(MIN_DECREASE_INTERVAL_SECONDS, self.latency or 0):
+            return False
+        self._last_decrease = self._last_increase = now
+        previous, self.rate = self.rate, max(self.floor, self.rate * factor)
+        logger.warning(f"{self.key}: {reason}; send rate {previous:.2f}/s -> {self.rate:.2f}/s")
+        return True
+
+    def on_throttled(self, retry_after: Optional[float] = None):
+        self.throttled_count += 1
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        self._decrease(ADAPTIVE_DECREASE_FACTOR, f"rate limited (Retry-After {retry_after})")
+
+    def on_success(self, latency: float):
+        if self.latency is None:
+            self.latency = self.baseline = latency
+        # The baseline follows slowly, so a lasting change in the provider's
+        # latency stops counting as inflation instead of pinning the rate at the floor
+        self.latency += LATENCY_ALPHA * (latency - self.latency)
+        self.baseline += BASELINE_ALPHA * (latency - self.baseline)
+        if self.latency > self.baseline * ADAPTIVE_LATENCY_FACTOR:
+            self._decrease(LATENCY_DECREASE_FACTOR, f"latency {self.latency * 1000:.0f}ms vs {self.baseline * 1000:.0f}ms baseline")
+            return
+
+        now = time.monotonic()
+        if self.rate < self.ceiling:
+            self.rate = min(self.ceiling, self.rate + self.ceiling * ADAPTIVE_INCREASE_FRACTION * (now - self._last_increase))
+        self._last_increase = now
+
+    async def wait_until_ready(self):
+        """Hold sends while a provider's Retry-After is in force"""
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "rate": round(self.rate, 3),
+            "configured_rate": self.configured_rate,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "throttled": self.throttled_count,
+            "paused": self.paused_until > time.monotonic()
+        }
+
+class SendFeedback:
+    """Handed out by a sender slot; report() the send's outcome once it is known"""
+
+    def __init__(self, controller: Optional[AIMDController]):
+        self.controller = controller
+        self.started = time.monotonic()
+
+    def report(self, outcome: dict, latency: Optional[float] = None):
+        """`latency` is the provider's response time; defaults to the time since the slot was granted"""
+        if self.controller is None:
+            return
+        if outcome.get("error_code") == RATE_LIMITED:
+            self.controller.on_throttled(outcome.get("retry_after"))
+        elif outcome.get("ok"):
+            self.controller.on_success(latency if latency is not None else time.monotonic() - self.started)
+
+# sender key -> controller
+_controllers: Dict[str, AIMDController] = {}
+
+def get_controller(key: str, configured_rate: float) -> Optional[AIMDController]:
+    if not ADAPTIVE_THROTTLE_ENABLED:
+        return None
+    controller = _controllers.get(key)
+    if controller is None:
+        controller = _controllers[key] = AIMDController(key, configured_rate)
+    elif controller.configured_rate != configured_rate:
+        controller.configure(configured_rate)
+    return controller
+
+def controller_stats() -> Dict[str, dict]:
+    return {key: controller.stats() for key, controller in _controllers.items()}
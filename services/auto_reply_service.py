@@ -0,0 +1,75 @@
+import logging
+from bson import ObjectId
+
+from services.database import get_users_collection, get_whatsapp_auto_replies_collection
+from services.whatsapp_service import send_whatsapp_message, send_whatsapp_media, send_whatsapp_interactive, create_button_message
+from services.priority_lanes import REALTIME
+from utils.keyword_matcher import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+# user_id -> (auto_replies_version, KeywordMatcher)
+_matcher_cache = {}
+
+async def _build_matcher(user_id) -> KeywordMatcher:
+    auto_replies_collection = await get_whatsapp_auto_replies_collection()
+    auto_replies = await auto_replies_collection.find(
+        {"user_id": user_id, "is_active": True}
+    ).to_list(length=None)
+
+    matcher = KeywordMatcher([
+        (reply["keyword"], reply) for reply in auto_replies if reply.get("keyword")
+    ])
+    logger.info(f"Compiled {len(matcher)} auto-reply keywords for user {user_id}")
+    return matcher
+
+async def get_auto_reply_matcher(user: dict) -> KeywordMatcher:
+    """Return the user's compiled matcher, rebuilding it when the auto-replies version moved"""
+    user_id = user["_id"]
+    version = user.get("auto_replies_version", 0)
+
+    cached = _matcher_cache.get(str(user_id))
+    if cached and cached[0] == version:
+        return cached[1]
+
+    matcher = await _build_matcher(user_id)
+    _matcher_cache[str(user_id)] = (version, matcher)
+    return matcher
+
+async def match_auto_reply(user: dict, message: str):
+    """Find the active auto-reply whose keyword appears in message, if any"""
+    try:
+        matcher = await get_auto_reply_matcher(user)
+        return matcher.match(message)
+    except Exception as e:
+        logger.error(f"Error matching auto-replies for user {user.get('_id')}: {e}")
+        return None
+
+async def invalidate_auto_replies(user_id):
+    """Bump the user's auto-replies version so every worker recompiles its matcher"""
+    _matcher_cache.pop(str(user_id), None)
+    users_collection = await get_users_collection()
+    await users_collection.update_one(
+        {"_id": ObjectId(user_id)},
+        {"$inc": {"auto_replies_version": 1}}
+    )
+
+async def send_auto_reply(user: dict, to_number: str, auto_reply: dict):
+    """Send a matched auto-reply using its configured message type"""
+    message_type = auto_reply.get("message_type", "Text")
+    content = auto_reply.get("message_content", "")
+    media_url = auto_reply.get("media_url", "")
+
+    if "Media" in message_type and media_url:
+        return await send_whatsapp_media(
+            user['phone_number_id'], to_number, media_url,
+            auto_reply.get("caption") or content, user['meta_api_key'], lane=REALTIME
+        )
+
+    if message_type.startswith("Buttons") and auto_reply.get("buttons"):
+        return await send_whatsapp_interactive(
+            user['phone_number_id'], to_number,
+            create_button_message(content, auto_reply["buttons"][:3]), user['meta_api_key'], lane=REALTIME
+        )
+
+    return await send_whatsapp_message(user['phone_number_id'], to_number, content, user['meta_api_key'], lane=REALTIME)
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from config import (
+    WHATSAPP_MESSAGES_PER_SECOND, WHATSAPP_SENDER_CONCURRENCY, WHATSAPP_BULK_RATE_SHARE,
+    CAMPAIGN_EMAIL_PER_SECOND, SMS_NUMBER_MESSAGES_PER_SECOND, SMS_SEND_CONCURRENCY
+)
+from services.adaptive_throttle import SendFeedback, get_controller
+from services.priority_lanes import LaneScheduler
+from services.rate_limiter import get_token_bucket
+
+logger = logging.getLogger(__name__)
+
+# sender key -> semaphore capping in-flight sends from that sender in this process
+_sender_slots = {}
+# sender key -> one-slot lane scheduler deciding which waiting lane takes the next token
+_token_gates = {}
+
+async def _take_token(key: str, rate: float, controller):
+    if controller is not None:
+        await controller.wait_until_ready()
+        rate = controller.rate
+    await get_token_bucket(key, rate).acquire()
+
+@asynccontextmanager
+async def sender_slot(key: str, rate: float, concurrency: int, lane: str = None):
+    """Hold one of the sender's concurrent slots and take a token from its bucket.
+
+    The bucket runs at the sender's adaptive rate, which never exceeds `rate`
+    times ADAPTIVE_CEILING_FACTOR. Yields a SendFeedback; report the send's
+    outcome to it so throttling and slow responses lower the rate.
+
+    With a `lane`, waiters take the sender's tokens by lane priority instead of
+    in arrival order, so a single send from a number that is running a campaign
+    doesn't queue behind the campaign's whole backlog.
+    """
+    semaphore = _sender_slots.get(key)
+    if semaphore is None:
+        semaphore = _sender_slots[key] = asyncio.Semaphore(concurrency)
+    controller = get_controller(key, rate)
+    if lane is None:
+        async with semaphore:
+            await _take_token(key, rate, controller)
+            yield SendFeedback(controller)
+        return
+
+    gate = _token_gates.get(key)
+    if gate is None:
+        gate = _token_gates[key] = LaneScheduler(key, 1, {})
+    async with gate.slot(lane):
+        await _take_token(key, rate, controller)
+    async with semaphore:
+        yield SendFeedback(controller)
+
+def whatsapp_sender_slot(phone_number_id: str, messages_per_second: float = None):
+    """Pace campaign sends from one WhatsApp number to its Meta throughput tier.
+
+    Campaigns get WHATSAPP_BULK_RATE_SHARE of the tier; the rest is headroom
+    for chatbot and API sends from the same number, which aren't paced here.
+    """
+    return sender_slot(
+        f"whatsapp:{phone_number_id}",
+        (messages_per_second or WHATSAPP_MESSAGES_PER_SECOND) * WHATSAPP_BULK_RATE_SHARE,
+        WHATSAPP_SENDER_CONCURRENCY
+    )
+
+def email_sender_slot(user_id: str):
+    return sender_slot(f"email:{user_id}", CAMPAIGN_EMAIL_PER_SECOND, WHATSAPP_SENDER_CONCURRENCY)
+
+def sms_number_slot(sender: str, messages_per_second: float = None, lane: str = None):
+    """Pace sends from one Twilio number or Messaging Service to its throughput"""
+    return sender_slot(
+        f"sms_number:{sender}",
+        messages_per_second or SMS_NUMBER_MESSAGES_PER_SECOND,
+        SMS_SEND_CONCURRENCY,
+        lane
+    )
@@ -0,0 +1,187 @@
+import logging
+from datetime import datetime, timezone
+
+from models.marketing import SMSRequest
+from services.database import (
+    get_campaigns_collection, get_message_status_collection,
+    get_whatsapp_campaigns_collection, get_whatsapp_message_logs_collection
+)
+from services.campaign_queue import ChannelHandler, CampaignHalted, register_channel, will_retry
+from services.send_errors import classify_whatsapp_result, classify_twilio_error, AUTH_FAILED, PROVIDER_UNAVAILABLE, MEDIA_ERROR_CODES
+from services.campaign_dispatcher import whatsapp_sender_slot, email_sender_slot
+from services.whatsapp_service import post_whatsapp_payload
+from services.whatsapp_payloads import campaign_payload, uses_media
+from services.whatsapp_media import get_media_id, forget_media_id
+from services.meta_credentials import mark_credentials_invalid
+from services.device_balancer import campaign_device
+from services.priority_lanes import BULK
+from services.email_service import get_email_user, log_email_send
+from services.email_engine import send_email_batch
+from services.personalization import render_message
+from services.sms_service import send_sms
+
+logger = logging.getLogger(__name__)
+
+async def _whatsapp_outcome(result, user: dict, phone_number_id: str) -> dict:
+    if result:
+        return {"ok": True, "message_id": result.message_id}
+    outcome = {"ok": False, "message_id": None, **classify_whatsapp_result(result)}
+    if outcome["error_code"] == AUTH_FAILED:
+        await mark_credentials_invalid(
+            user["_id"], phone_number_id, user['meta_api_key'], result.status_code, result.error_message
+        )
+    return outcome
+
+async def _send_whatsapp_broadcast(task: dict, campaign: dict, user: dict, phone_number_id: str, ready) -> dict:
+    media_url = campaign.get("media_url", "")
+    # Media goes out by the id of a one-time upload to this sender, or by link if that failed
+    media_id = None
+    if uses_media(campaign):
+        media_id = await get_media_id(phone_number_id, user['meta_api_key'], media_url)
+    # Built and serialized once per campaign; only recipient and personalized text change here
+    payload = campaign_payload(campaign, media_id=media_id)
+
+    async with whatsapp_sender_slot(phone_number_id, user.get("whatsapp_messages_per_second")) as feedback:
+        await ready()
+        result = await post_whatsapp_payload(
+            phone_number_id, user['meta_api_key'],
+            payload.render(task["recipient"], task["data"]), payload.message_type, lane=BULK
+        )
+
+    outcome = await _whatsapp_outcome(result, user, phone_number_id)
+    feedback.report(outcome, result.elapsed)
+    if media_id and result.error_code in MEDIA_ERROR_CODES:
+        # Expired or rejected upload; the retry uploads the asset again
+        await forget_media_id(phone_number_id, media_url)
+    return outcome
+
+async def send_whatsapp_broadcast_task(task: dict, campaign: dict, user: dict, ready) -> dict:
+    """One recipient of a /whatsapp/send-message campaign"""
+    message_type = campaign.get("message_type", "")
+    message_content = render_message(campaign.get("message_content", ""), task["data"])
+    media_url = campaign.get("media_url", "")
+    caption = render_message(campaign.get("caption", ""), task["data"])
+    # Multi-device campaigns pick the recipient's device from those still active
+    phone_number_id = await campaign_device(campaign, task["recipient"], user)
+    if phone_number_id is None:
+        # Every device is down; retried later in case one comes back
+        outcome = {
+            "ok": False, "message_id": None, "error_code": PROVIDER_UNAVAILABLE, "retryable": True,
+            "retry_after": None, "error_message": "None of the campaign's instances are active and healthy"
+        }
+    else:
+        outcome = await _send_whatsapp_broadcast(task, campaign, user, phone_number_id, ready)
+
+    # A retried attempt is logged once it finally succeeds or gives up
+    if will_retry(task, outcome):
+        return outcome
+
+    message_logs_collection = await get_whatsapp_message_logs_collection()
+    await message_logs_collection.insert_one({
+        "user_id": campaign["user_id"],
+        "campaign_id": campaign["_id"],
+        "campaign_name": campaign.get("campaign_name"),
+        "contact_number": task["recipient"],
+        "contact_name": task["data"].get("name", ""),
+        "message_content": message_content,
+        "message_type": message_type,
+        "message_source": campaign.get("message_source"),
+        "media_url": media_url,
+        "caption": caption,
+        "status": "sent" if outcome["ok"] else "failed",
+        "error_code": outcome.get("error_code"),
+        "error_message": outcome.get("error_message", ""),
+        "instance_id": phone_number_id or campaign.get("instance_id"),
+        "whatsapp_message_id": outcome["message_id"],
+        "sent_at": datetime.now(timezone.utc),
+        "created_at": datetime.now(timezone.utc)
+    })
+    return outcome
+
+async def send_whatsapp_campaign_task(task: dict, campaign: dict, user: dict, ready) -> dict:
+    """One recipient of a /campaigns/send WhatsApp campaign"""
+    payload = campaign_payload(campaign, content_field="message_template")
+    async with whatsapp_sender_slot(user['phone_number_id'], user.get("whatsapp_messages_per_second")) as feedback:
+        await ready()
+        result = await post_whatsapp_payload(
+            user['phone_number_id'], user['meta_api_key'],
+            payload.render(task["recipient"], task["data"]), payload.message_type, lane=BULK
+        )
+
+    outcome = await _whatsapp_outcome(result, user, user['phone_number_id'])
+    feedback.report(outcome, result.elapsed)
+    if will_retry(task, outcome):
+        return outcome
+
+    message_status_collection = await get_message_status_collection()
+    await message_status_collection.insert_one({
+        "campaign_id": campaign["_id"],
+        "phone_number": task["recipient"],
+        "status": "sent" if outcome["ok"] else "failed",
+        "whatsapp_message_id": outcome["message_id"],
+        "error_code": outcome.get("error_code"),
+        "error_message": outcome.get("error_message", ""),
+        "sent_at": datetime.now(timezone.utc),
+        "updated_at": datetime.now(timezone.utc)
+    })
+    return outcome
+
+async def send_email_campaign_task(task: dict, campaign: dict, user: dict, ready) -> dict:
+    """One SendGrid batch of a /campaigns/send email campaign"""
+    user_id = str(user["_id"])
+    # Tasks queued before email batching carry a single recipient
+    recipients = task["data"].get("recipients") or [{"email": task["recipient"]}]
+    email_user = await get_email_user(user_id)
+    if not email_user or not email_user.get("api_key"):
+        return {
+            "ok": False, "recipient_count": len(recipients),
+            "error_code": AUTH_FAILED, "error_message": "No API key configured for this user"
+        }
+
+    async with email_sender_slot(user_id) as feedback:
+        await ready()
+        result = await send_email_batch(
+            email_user["api_key"],
+            user["email"],
+            campaign["name"],
+            campaign["message_template"],
+            recipients,
+            batch_id=campaign.get("sendgrid_batch_id")
+        )
+
+    if result.ok:
+        outcome = {"ok": True, "message_id": result.message_id, "recipient_count": result.recipient_count}
+    else:
+        outcome = {"ok": False, "recipient_count": result.recipient_count, **result.error}
+    feedback.report(outcome)
+    if will_retry(task, outcome):
+        return outcome
+    await log_email_send(
+        user_id=user_id,
+        to_email=[recipient["email"] for recipient in recipients],
+        from_email=user["email"],
+        subject=campaign["name"],
+        message_id=result.message_id,
+        status="sent" if outcome["ok"] else "failed"
+    )
+    return outcome
+
+async def send_sms_campaign_task(task: dict, campaign: dict, user: dict, ready) -> dict:
+    """One recipient of a /campaigns/send SMS campaign"""
+    user_id = str(user["_id"])
+    # Sent from the recipient's sender in the tenant's pool, paced per sender inside create_message
+    try:
+        message = render_message(campaign["message_template"], task["data"])
+        result = await send_sms(
+            SMSRequest(to_number=task["recipient"], message=message), user_id, lane=BULK, before_send=ready
+        )
+        return {"ok": True, "message_id": result.get("sid")}
+    except CampaignHalted:
+        raise
+    except Exception as e:
+        return {"ok": False, **classify_twilio_error(e)}
+
+register_channel("whatsapp_broadcast", ChannelHandler(get_whatsapp_campaigns_collection, send_whatsapp_broadcast_task))
+register_channel("whatsapp", ChannelHandler(get_campaigns_collection, send_whatsapp_campaign_task))
+register_channel("email", ChannelHandler(get_campaigns_collection, send_email_campaign_task))
+register_channel("sms", ChannelHandler(get_campaigns_collection, send_sms_campaign_task))
@@ -0,0 +1,448 @@
+import logging
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from config import CAMPAIGN_TASK_MAX_ATTEMPTS, CAMPAIGN_RETRY_BASE_SECONDS, CAMPAIGN_RETRY_MAX_SECONDS
+from services.database import get_campaign_send_tasks_collection, get_campaign_dead_letters_collection
+from services.send_schedule import SendSchedule
+
+logger = logging.getLogger(__name__)
+
+TASK_SCHEDULED = "scheduled"
+TASK_PENDING = "pending"
+TASK_LEASED = "leased"
+TASK_SENT = "sent"
+TASK_FAILED = "failed"
+TASK_PAUSED = "paused"
+TASK_CANCELLED = "cancelled"
+
+# Tasks that still keep their campaign open
+OPEN_TASK_STATUSES = [TASK_SCHEDULED, TASK_PENDING, TASK_LEASED, TASK_PAUSED]
+
+# Campaign-level control: action -> (allowed from, new campaign status)
+CAMPAIGN_TRANSITIONS = {
+    "pause": (["scheduled", "processing"], "paused"),
+    "resume": (["paused"], "processing"),
+    "cancel": (["scheduled", "processing", "paused"], "cancelled")
+}
+
+ENQUEUE_BATCH_SIZE = 1000
+RELEASE_BATCH_SIZE = 1000
+
+class CampaignHalted(Exception):
+    """Raised by a send's ready() check once the campaign was paused or cancelled; the task is already parked"""
+
+@dataclass
+class ChannelHandler:
+    """How the worker sends one task of a channel and where its campaign lives.
+
+    send(task, campaign, user, ready) returns an outcome dict:
+    {"ok": bool, "message_id": str | None, "error_code": ..., "error_message": str}
+
+    The handler awaits ready() once its sender slot is granted, right before
+    the provider call; it raises CampaignHalted if the campaign stopped while
+    the send waited for its rate budget.
+    """
+    get_campaigns_collection: Callable[[], Awaitable]
+    send: Callable[[dict, dict, dict, Callable[[], Awaitable[None]]], Awaitable[dict]]
+
+# channel name -> ChannelHandler, filled in by services.campaign_handlers
+channel_handlers: Dict[str, ChannelHandler] = {}
+
+def register_channel(channel: str, handler: ChannelHandler):
+    channel_handlers[channel] = handler
+
+async def create_campaign_queue_indexes():
+    tasks_collection = await get_campaign_send_tasks_collection()
+    await tasks_collection.create_index([("campaign_id", 1), ("recipient", 1)], unique=True)
+    await tasks_collection.create_index([("campaign_id", 1), ("status", 1)])
+    await tasks_collection.create_index([("status", 1), ("created_at", 1)])
+    await tasks_collection.create_index([("channel", 1), ("status", 1), ("created_at", 1)])
+    await tasks_collection.create_index([("status", 1), ("lease_expires_at", 1)])
+    await tasks_collection.create_index([("user_id", 1), ("channel", 1), ("status", 1)])
+    await tasks_collection.create_index(
+        [("release_at", 1)], partialFilterExpression={"status": TASK_SCHEDULED}
+    )
+
+    dead_letters_collection = await get_campaign_dead_letters_collection()
+    await dead_letters_collection.create_index([("user_id", 1), ("campaign_id", 1)])
+    await dead_letters_collection.create_index([("user_id", 1), ("error_code", 1)])
+
+async def enqueue_campaign_tasks(
+    campaign_id, user_id, channel: str, recipients: List[dict], schedule: Optional[SendSchedule] = None
+) -> int:
+    """Queue one send task per recipient; re-enqueueing a recipient of the same campaign is a no-op.
+
+    Each recipient is {"recipient": <number or email>, "data": {...personalization fields}}.
+    With a schedule, tasks wait as scheduled until the scheduler releases them at their release_at.
+    """
+    if channel not in channel_handlers:
+        raise ValueError(f"No handler registered for channel '{channel}'")
+
+    tasks_collection = await get_campaign_send_tasks_collection()
+    now = datetime.now(timezone.utc)
+    queued = 0
+
+    for start in range(0, len(recipients), ENQUEUE_BATCH_SIZE):
+        batch = []
+        for index, r in enumerate(recipients[start:start + ENQUEUE_BATCH_SIZE], start):
+            task = {
+                "campaign_id": ObjectId(campaign_id),
+                "user_id": user_id,
+                "channel": channel,
+                "recipient": r["recipient"],
+                "data": r.get("data", {}),
+                "status": TASK_PENDING,
+                "attempts": 0,
+                "created_at": now,
+                "updated_at": now
+            }
+            if schedule:
+                task["status"] = TASK_SCHEDULED
+                task["release_at"] = schedule.release_at(index, len(recipients), r["recipient"], r.get("data"))
+            batch.append(task)
+        try:
+            result = await tasks_collection.insert_many(batch, ordered=False)
+            queued += len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Duplicates are recipients that were already queued
+            queued += e.details.get("nInserted", 0)
+
+    logger.info(f"Queued {queued} {channel} send tasks for campaign {campaign_id}")
+    return queued
+
+async def claim_task(worker_id: str, lease_seconds: int, channel: Optional[str] = None) -> Optional[dict]:
+    """Lease the oldest pending task (of `channel`, if given), or one whose previous lease expired"""
+    tasks_collection = await get_campaign_send_tasks_collection()
+    now = datetime.now(timezone.utc)
+    query = {"$or": [
+        {"status": TASK_PENDING},
+        {"status": TASK_LEASED, "lease_expires_at": {"$lt": now}}
+    ]}
+    if channel:
+        query["channel"] = channel
+    return await tasks_collection.find_one_and_update(
+        query,
+        {
+            "$set": {
+                "status": TASK_LEASED,
+                "lease_owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def extend_leases(worker_id: str, task_ids: List[ObjectId], lease_seconds: int):
+    """Heartbeat: push out the lease of every task this worker still holds"""
+    if not task_ids:
+        return
+    tasks_collection = await get_campaign_send_tasks_collection()
+    await tasks_collection.update_many(
+        {"_id": {"$in": task_ids}, "lease_owner": worker_id, "status": TASK_LEASED},
+        {"$set": {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)}}
+    )
+
+async def release_task(worker_id: str, task: dict):
+    """Hand an unstarted task back to the queue (e.g. on shutdown)"""
+    tasks_collection = await get_campaign_send_tasks_collection()
+    await tasks_collection.update_one(
+        {"_id": task["_id"], "lease_owner": worker_id, "status": TASK_LEASED},
+        {
+            "$set": {"status": TASK_PENDING, "updated_at": datetime.now(timezone.utc)},
+            "$unset": {"lease_owner": "", "lease_expires_at": ""},
+            "$inc": {"attempts": -1}
+        }
+    )
+
+def will_retry(task: dict, outcome: dict) -> bool:
+    """Whether a failed outcome sends the task round again instead of finishing it"""
+    if not outcome.get("ok") and outcome.get("deferred"):
+        # Never reached the provider (circuit open); doesn't count as an attempt
+        return True
+    return (
+        not outcome.get("ok")
+        and outcome.get("retryable", False)
+        and task.get("attempts", 1) < CAMPAIGN_TASK_MAX_ATTEMPTS
+    )
+
+def retry_delay(
+    attempts: int,
+    retry_after: Optional[float] = None,
+    base: float = CAMPAIGN_RETRY_BASE_SECONDS,
+    max_seconds: float = CAMPAIGN_RETRY_MAX_SECONDS
+) -> float:
+    """Exponential backoff with full jitter, never sooner than the provider asked"""
+    ceiling = min(max_seconds, base * 2 ** max(attempts - 1, 0))
+    return max(random.uniform(0, ceiling), retry_after or 0)
+
+async def _schedule_retry(worker_id: str, task: dict, outcome: dict) -> bool:
+    tasks_collection = await get_campaign_send_tasks_collection()
+    now = datetime.now(timezone.utc)
+    delay = retry_delay(task.get("attempts", 1), outcome.get("retry_after"))
+    update = {
+        "$set": {
+            "status": TASK_SCHEDULED,
+            "release_at": now + timedelta(seconds=delay),
+            "error_code": outcome.get("error_code"),
+            "error_message": outcome.get("error_message", ""),
+            "updated_at": now
+        },
+        "$unset": {"lease_owner": "", "lease_expires_at": ""}
+    }
+    if outcome.get("deferred"):
+        update["$inc"] = {"attempts": -1}
+    result = await tasks_collection.update_one(
+        {"_id": task["_id"], "lease_owner": worker_id, "status": TASK_LEASED}, update
+    )
+    logger.info(
+        f"Retrying task {task['_id']} to {task['recipient']} in {delay:.1f}s "
+        f"after {outcome.get('error_code')} (attempt {task.get('attempts')})"
+    )
+    return bool(result.modified_count)
+
+async def _dead_letter(task: dict, outcome: dict):
+    dead_letters_collection = await get_campaign_dead_letters_collection()
+    await dead_letters_collection.insert_one({
+        "task_id": task["_id"],
+        "campaign_id": task["campaign_id"],
+        "user_id": task["user_id"],
+        "channel": task["channel"],
+        "recipient": task["recipient"],
+        "attempts": task.get("attempts"),
+        "recipient_count": outcome.get("recipient_count", 1),
+        "error_code": outcome.get("error_code"),
+        "provider_code": outcome.get("provider_code"),
+        "error_message": outcome.get("error_message", ""),
+        "dead_lettered_at": datetime.now(timezone.utc)
+    })
+
+async def complete_task(worker_id: str, task: dict, outcome: dict) -> bool:
+    """Record a send outcome and bump the campaign counters.
+
+    Retryable failures with attempts left go back to the scheduler with a
+    backoff; retryable failures that ran out of attempts are dead-lettered.
+    Only the current lease owner may complete a task, so a worker whose lease
+    expired and was taken over cannot double count.
+    """
+    if will_retry(task, outcome):
+        return await _schedule_retry(worker_id, task, outcome)
+
+    tasks_collection = await get_campaign_send_tasks_collection()
+    now = datetime.now(timezone.utc)
+    status = TASK_SENT if outcome.get("ok") else TASK_FAILED
+    dead_lettered = status == TASK_FAILED and outcome.get("retryable", False)
+
+    result = await tasks_collection.update_one(
+        {"_id": task["_id"], "lease_owner": worker_id, "status": TASK_LEASED},
+        {
+            "$set": {
+                "status": status,
+                "message_id": outcome.get("message_id"),
+                "error_code": outcome.get("error_code"),
+                "provider_code": outcome.get("provider_code"),
+                "error_message": outcome.get("error_message", ""),
+                "dead_lettered": dead_lettered,
+                "completed_at": now,
+                "updated_at": now
+            },
+            "$unset": {"lease_owner": "", "lease_expires_at": ""}
+        }
+    )
+    if not result.modified_count:
+        logger.warning(f"Lost lease on task {task['_id']} before completing it")
+        return False
+
+    if dead_lettered:
+        await _dead_letter(task, outcome)
+
+    campaigns_collection = await channel_handlers[task["channel"]].get_campaigns_collection()
+    await campaigns_collection.update_one(
+        {"_id": task["campaign_id"]},
+        {
+            # A task may carry a whole provider batch (email) rather than one recipient
+            "$inc": {"sent_count" if status == TASK_SENT else "failed_count": outcome.get("recipient_count", 1)},
+            "$set": {"updated_at": now}
+        }
+    )
+
+    # Last open task of the campaign closes it
+    open_tasks = await tasks_collection.count_documents(
+        {"campaign_id": task["campaign_id"], "status": {"$in": OPEN_TASK_STATUSES}},
+        limit=1
+    )
+    if not open_tasks:
+        await campaigns_collection.update_one(
+            {"_id": task["campaign_id"], "status": "processing"},
+            {"$set": {"status": "completed", "completed_at": now}}
+        )
+        logger.info(f"Campaign {task['campaign_id']} completed.")
+    return True
+
+async def halt_task(worker_id: str, task: dict, status: str):
+    """Take a leased task out of circulation because its campaign was paused or cancelled"""
+    tasks_collection = await get_campaign_send_tasks_collection()
+    update = {
+        "$set": {"status": status, "updated_at": datetime.now(timezone.utc)},
+        "$unset": {"lease_owner": "", "lease_expires_at": ""}
+    }
+    if status == TASK_PAUSED:
+        # Not a real attempt; the task goes back to the queue on resume
+        update["$inc"] = {"attempts": -1}
+    await tasks_collection.update_one(
+        {"_id": task["_id"], "lease_owner": worker_id, "status": TASK_LEASED}, update
+    )
+
+async def resume_paused_task(task: dict):
+    """Undo halt_task(TASK_PAUSED) that raced with a resume"""
+    tasks_collection = await get_campaign_send_tasks_collection()
+    await tasks_collection.update_one(
+        {"_id": task["_id"], "status": TASK_PAUSED},
+        {"$set": {"status": TASK_PENDING, "updated_at": datetime.now(timezone.utc)}}
+    )
+
+async def release_due_tasks(limit: int = RELEASE_BATCH_SIZE) -> int:
+    """Move scheduled tasks whose release_at has passed into the pending queue.
+
+    Reads at most `limit` due tasks through the partial release_at index per call,
+    so a large backlog is released over several ticks instead of one write spike.
+    """
+    tasks_collection = await get_campaign_send_tasks_collection()
+    now = datetime.now(timezone.utc)
+    due = await tasks_collection.find(
+        {"status": TASK_SCHEDULED, "release_at": {"$lte": now}},
+        {"_id": 1, "channel": 1, "campaign_id": 1}
+    ).sort("release_at", 1).limit(limit).to_list(length=limit)
+    if not due:
+        return 0
+
+    result = await tasks_collection.update_many(
+        {"_id": {"$in": [t["_id"] for t in due]}, "status": TASK_SCHEDULED},
+        {"$set": {"status": TASK_PENDING, "updated_at": now}}
+    )
+
+    # Campaigns waiting for their send_at start processing with their first released task
+    campaign_ids = {}
+    for task in due:
+        campaign_ids.setdefault(task["channel"], set()).add(task["campaign_id"])
+    for channel, ids in campaign_ids.items():
+        campaigns_collection = await channel_handlers[channel].get_campaigns_collection()
+        await campaigns_collection.update_many(
+            {"_id": {"$in": list(ids)}, "status": "scheduled"},
+            {"$set": {"status": "processing", "started_at": now}}
+        )
+    return result.modified_count
+
+async def control_campaign(campaigns_collection, campaign: dict, action: str) -> dict:
+    """Pause, resume or cancel a queued campaign.
+
+    Queued tasks flip state immediately; tasks already leased by a worker are
+    stopped by the worker's campaign status check before they are sent.
+    """
+    if action not in CAMPAIGN_TRANSITIONS:
+        raise ValueError(f"Unknown campaign action '{action}'")
+    allowed_from, new_status = CAMPAIGN_TRANSITIONS[action]
+    if campaign.get("status") not in allowed_from:
+        raise ValueError(f"Cannot {action} a campaign that is {campaign.get('status')}")
+
+    now = datetime.now(timezone.utc)
+    result = await campaigns_collection.update_one(
+        {"_id": campaign["_id"], "status": {"$in": allowed_from}},
+        {"$set": {"status": new_status, "updated_at": now, f"{new_status}_at": now}}
+    )
+    if not result.modified_count:
+        raise ValueError(f"Campaign status changed, cannot {action} it")
+
+    tasks_collection = await get_campaign_send_tasks_collection()
+    if action == "pause":
+        transitions = [({"status": {"$in": [TASK_SCHEDULED, TASK_PENDING]}}, TASK_PAUSED)]
+    elif action == "resume":
+        # Scheduled recipients keep their release_at; overdue ones go out on the next scheduler tick
+        transitions = [
+            ({"status": TASK_PAUSED, "release_at": {"$exists": True}}, TASK_SCHEDULED),
+            ({"status": TASK_PAUSED, "release_at": {"$exists": False}}, TASK_PENDING)
+        ]
+    else:
+        transitions = [({"status": {"$in": [TASK_SCHEDULED, TASK_PENDING, TASK_PAUSED]}}, TASK_CANCELLED)]
+
+    affected = 0
+    for task_filter, task_status in transitions:
+        task_result = await tasks_collection.update_many(
+            {"campaign_id": campaign["_id"], **task_filter},
+            {"$set": {"status": task_status, "updated_at": now}}
+        )
+        affected += task_result.modified_count
+    logger.info(f"Campaign {campaign['_id']} {new_status}: {affected} tasks moved")
+    return {"status": new_status, "tasks_affected": affected}
+
+async def cancel_campaign_tasks(campaign_id) -> int:
+    """Cancel every queued task of a campaign, e.g. when the campaign is deleted"""
+    tasks_collection = await get_campaign_send_tasks_collection()
+    result = await tasks_collection.update_many(
+        {"campaign_id": ObjectId(campaign_id), "status": {"$in": [TASK_SCHEDULED, TASK_PENDING, TASK_PAUSED]}},
+        {"$set": {"status": TASK_CANCELLED, "updated_at": datetime.now(timezone.utc)}}
+    )
+    return result.modified_count
+
+async def get_task_status_counts(match: dict) -> Dict:
+    """Live task counts per campaign and status: {campaign_id: {status: count}}"""
+    tasks_collection = await get_campaign_send_tasks_collection()
+    rows = await tasks_collection.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"campaign_id": "$campaign_id", "status": "$status"}, "count": {"$sum": 1}}}
+    ]).to_list(length=None)
+
+    counts = {}
+    for row in rows:
+        counts.setdefault(row["_id"]["campaign_id"], {})[row["_id"]["status"]] = row["count"]
+    return counts
+
+async def redrive_dead_letters(user_id, campaign_id=None, error_code: Optional[str] = None) -> int:
+    """Put dead-lettered tasks back in the queue with a fresh attempt budget"""
+    dead_letters_collection = await get_campaign_dead_letters_collection()
+    tasks_collection = await get_campaign_send_tasks_collection()
+
+    query = {"user_id": user_id}
+    if campaign_id:
+        query["campaign_id"] = ObjectId(campaign_id)
+    if error_code:
+        query["error_code"] = error_code
+
+    dead_letters = await dead_letters_collection.find(query).to_list(length=None)
+    if not dead_letters:
+        return 0
+
+    now = datetime.now(timezone.utc)
+    result = await tasks_collection.update_many(
+        {"_id": {"$in": [d["task_id"] for d in dead_letters]}, "status": TASK_FAILED, "dead_lettered": True},
+        {
+            "$set": {"status": TASK_PENDING, "attempts": 0, "dead_lettered": False, "updated_at": now},
+            "$unset": {"completed_at": ""}
+        }
+    )
+
+    # The redriven recipients no longer count as failed, and finished campaigns reopen
+    per_campaign = {}
+    for dead_letter in dead_letters:
+        key = (dead_letter["channel"], dead_letter["campaign_id"])
+        per_campaign[key] = per_campaign.get(key, 0) + dead_letter.get("recipient_count", 1)
+    for (channel, campaign), count in per_campaign.items():
+        campaigns_collection = await channel_handlers[channel].get_campaigns_collection()
+        await campaigns_collection.update_one({"_id": campaign}, {"$inc": {"failed_count": -count}})
+        await campaigns_collection.update_one(
+            {"_id": campaign, "status": "completed"},
+            {"$set": {"status": "processing", "updated_at": now}}
+        )
+
+    await dead_letters_collection.delete_many({"_id": {"$in": [d["_id"] for d in dead_letters]}})
+    logger.info(f"Redrove {result.modified_count} dead-lettered tasks for user {user_id}")
+    return result.modified_count
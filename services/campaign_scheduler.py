@@ -0,0 +1,54 @@
+import asyncio
+import logging
+import os
+import socket
+
+from config import CAMPAIGN_SCHEDULER_TICK_SECONDS, CAMPAIGN_SCHEDULER_LEASE_SECONDS
+from services.campaign_queue import release_due_tasks
+from services.leader_election import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+class CampaignScheduler:
+    """Releases scheduled campaign tasks into the send queue as they fall due.
+
+    Every node runs one; a Mongo leader lease makes sure only one of them
+    releases at a time, and another takes over if the leader dies.
+    """
+
+    def __init__(
+        self,
+        tick_seconds: float = CAMPAIGN_SCHEDULER_TICK_SECONDS,
+        lease_seconds: int = CAMPAIGN_SCHEDULER_LEASE_SECONDS
+    ):
+        self.tick_seconds = tick_seconds
+        self.lease = LeaderLease(
+            "campaign_scheduler", f"{socket.gethostname()}:{os.getpid()}", lease_seconds
+        )
+        self._stopping = asyncio.Event()
+        self._runner = None
+
+    async def start(self):
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopping.set()
+        if self._runner:
+            await self._runner
+        await self.lease.release()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if await self.lease.acquire():
+                    # At most one release batch per tick caps the queue's inflow rate
+                    released = await release_due_tasks()
+                    if released:
+                        logger.info(f"Released {released} scheduled campaign tasks")
+            except Exception as e:
+                logger.error(f"Campaign scheduler tick failed: {e}")
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.tick_seconds)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,241 @@
+"""Campaign send worker.
+
+Runs inside the API process (started from the app lifespan) and can also run
+on its own, on any number of nodes, together with the campaign scheduler:
+
+    python -m services.campaign_worker
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+
+from bson import ObjectId
+
+from config import CAMPAIGN_WORKER_CONCURRENCY, CAMPAIGN_TASK_LEASE_SECONDS, CAMPAIGN_WORKER_POLL_SECONDS
+from services.database import get_users_collection
+from services.campaign_queue import (
+    channel_handlers, claim_task, extend_leases, release_task, complete_task,
+    halt_task, resume_paused_task, CampaignHalted, TASK_PAUSED, TASK_CANCELLED
+)
+from services.send_errors import classify_exception
+import services.campaign_handlers  # noqa: F401  registers the channel handlers
+
+logger = logging.getLogger(__name__)
+
+# How often a worker re-reads documents. Leased tasks also re-read their
+# campaign uncached once their sender slot is granted, so a pause or cancel
+# reaches sends that waited for their rate budget before they go out
+CAMPAIGN_CACHE_SECONDS = 1
+USER_CACHE_SECONDS = 5
+
+class CampaignWorker:
+    """Leases send tasks from Mongo and runs them with bounded concurrency.
+
+    Each channel is claimed by its own loop with its own concurrency budget, so
+    a slowly paced channel (SMS at about 1 msg/s per number) holding all of its
+    slots doesn't stop WhatsApp or email tasks queued behind it.
+
+    Leases are heartbeated while a send is in flight; if the process dies the
+    leases expire and another worker picks the tasks up, so a restart resumes
+    with exactly the recipients that were not yet completed.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = CAMPAIGN_WORKER_CONCURRENCY,
+        lease_seconds: int = CAMPAIGN_TASK_LEASE_SECONDS,
+        poll_interval: float = CAMPAIGN_WORKER_POLL_SECONDS
+    ):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+        self._slots = {}
+        self._held = {}
+        self._in_flight = set()
+        self._documents = {}
+        self._stopping = asyncio.Event()
+        self._runners = []
+        self._heartbeat = None
+
+    async def start(self):
+        for channel in channel_handlers:
+            self._slots[channel] = asyncio.Semaphore(self.concurrency)
+            self._runners.append(asyncio.create_task(self._run(channel)))
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"Campaign worker {self.worker_id} started")
+
+    async def stop(self):
+        """Stop claiming, let in-flight sends finish and keep their leases until then"""
+        self._stopping.set()
+        if self._runners:
+            await asyncio.gather(*self._runners)
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        logger.info(f"Campaign worker {self.worker_id} stopped")
+
+    async def _run(self, channel: str):
+        slots = self._slots[channel]
+        while not self._stopping.is_set():
+            await slots.acquire()
+            if self._stopping.is_set():
+                slots.release()
+                break
+            try:
+                task = await claim_task(self.worker_id, self.lease_seconds, channel)
+            except Exception as e:
+                logger.error(f"Failed to claim {channel} campaign task: {e}")
+                task = None
+
+            if task is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._held[task["_id"]] = task
+            job = asyncio.create_task(self._process(task))
+            self._in_flight.add(job)
+            job.add_done_callback(self._in_flight.discard)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await extend_leases(self.worker_id, list(self._held), self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Failed to extend campaign task leases: {e}")
+
+    async def _cached_document(self, key, load, max_age: float):
+        cached = self._documents.get(key)
+        if cached and time.monotonic() - cached[0] < max_age:
+            return cached[1]
+        document = await load()
+        if len(self._documents) > 1000:
+            self._documents.clear()
+        self._documents[key] = (time.monotonic(), document)
+        return document
+
+    async def _load_campaign(self, task: dict, max_age: float = CAMPAIGN_CACHE_SECONDS):
+        handler = channel_handlers[task["channel"]]
+
+        async def load():
+            campaigns_collection = await handler.get_campaigns_collection()
+            return await campaigns_collection.find_one({"_id": task["campaign_id"]})
+
+        return await self._cached_document(("campaign", task["campaign_id"]), load, max_age)
+
+    async def _load_user(self, user_id):
+        async def load():
+            users_collection = await get_users_collection()
+            return await users_collection.find_one({"_id": ObjectId(user_id)})
+
+        return await self._cached_document(("user", str(user_id)), load, USER_CACHE_SECONDS)
+
+    async def _halted(self, task: dict, campaign: dict) -> bool:
+        """Park the task if its campaign is paused or cancelled; False means go ahead and send"""
+        if campaign.get("status") not in ("paused", "cancelled"):
+            return False
+
+        # The cached status may be up to a second old; confirm before parking
+        campaign = await self._load_campaign(task, max_age=0)
+        if not campaign or campaign.get("status") == "cancelled":
+            await halt_task(self.worker_id, task, TASK_CANCELLED)
+            return True
+        if campaign.get("status") != "paused":
+            return False
+
+        await halt_task(self.worker_id, task, TASK_PAUSED)
+        # A resume may have swept paused tasks just before we parked this one
+        campaign = await self._load_campaign(task, max_age=0)
+        if campaign and campaign.get("status") == "processing":
+            await resume_paused_task(task)
+        return True
+
+    async def _process(self, task: dict):
+        try:
+            if self._stopping.is_set():
+                await release_task(self.worker_id, task)
+                return
+
+            handler = channel_handlers.get(task["channel"])
+            campaign = await self._load_campaign(task) if handler else None
+            user = await self._load_user(task["user_id"]) if campaign else None
+
+            if campaign and await self._halted(task, campaign):
+                return
+
+            if not handler:
+                outcome = {"ok": False, "error_message": f"Unknown channel '{task['channel']}'"}
+            elif not campaign or not user:
+                outcome = {"ok": False, "error_message": "Campaign or owner no longer exists"}
+            else:
+                async def ready():
+                    # The send may have waited a long time for its sender's rate budget
+                    current = await self._load_campaign(task, max_age=0)
+                    if await self._halted(task, current or {"status": "cancelled"}):
+                        raise CampaignHalted()
+
+                try:
+                    outcome = await handler.send(task, campaign, user, ready)
+                except CampaignHalted:
+                    return
+                except Exception as e:
+                    logger.error(f"Send task {task['_id']} to {task['recipient']} failed: {e}")
+                    outcome = {"ok": False, **classify_exception(e)}
+
+            await complete_task(self.worker_id, task, outcome)
+        except Exception as e:
+            # Leave the lease to expire so another worker retries the task
+            logger.error(f"Error processing campaign task {task['_id']}: {e}")
+        finally:
+            self._held.pop(task["_id"], None)
+            self._slots[task["channel"]].release()
+
+async def main():
+    from motor.motor_asyncio import AsyncIOMotorClient # pyright: ignore[reportMissingImports]
+    from config import MONGODB_URI, DATABASE_NAME
+    from services.database import mongodb
+    from services.campaign_queue import create_campaign_queue_indexes
+    from services.whatsapp_service import whatsapp_client
+    from services.campaign_scheduler import CampaignScheduler
+    from services.sms_engine import twilio_clients, sms_log_writer
+    from services.email_engine import sendgrid_client
+
+    mongodb.client = AsyncIOMotorClient(MONGODB_URI)
+    mongodb.db = mongodb.client[DATABASE_NAME]
+    await create_campaign_queue_indexes()
+    await whatsapp_client.start()
+    await sms_log_writer.start()
+    await sendgrid_client.start()
+
+    worker = CampaignWorker()
+    scheduler = CampaignScheduler()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await worker.start()
+    await scheduler.start()
+    await stop.wait()
+    await scheduler.stop()
+    await worker.stop()
+
+    await whatsapp_client.close()
+    await sms_log_writer.stop()
+    await twilio_clients.close()
+    await sendgrid_client.close()
+    mongodb.client.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
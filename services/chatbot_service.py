@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+
+from langchain_groq import ChatGroq
+from langchain_core.prompts import PromptTemplate
+
+from config import GROQ_API_KEY, GROQ_TIMEOUT, GROQ_MAX_RETRIES
+from services.circuit_breaker import groq_breaker, is_server_error, CircuitOpenError
+from services.vector_store import load_vector_store_safely, close_vector_store, create_advanced_retriever
+from services.llm_router import retrieval_scores, route_reply_model
+from services.singleflight import SingleFlight
+from utils.embeddings import embedding_model
+
+logger = logging.getLogger(__name__)
+
+AI_UNAVAILABLE_REPLY = "AI service is currently unavailable. Please try again later."
+# Sent while Groq is down instead of waiting out its timeout for every message
+AI_BUSY_REPLY = "Thanks for your message! Our assistant is briefly unavailable; please try again in a few minutes."
+
+WHATSAPP_REPLY_PROMPT = PromptTemplate.from_template("""
+You are a intelligent bot that helps users based on the provided context. Your tone must be according to the whatsapp platform bot.
+Context: {context}
+
+Question: {question}
+
+Instructions:
+- Use the knowledge base content primarily to answer the question
+- If the knowledge base doesn't contain relevant information, respond politely that you don't have that information
+- Keep responses concise and helpful
+- Maintain a friendly, professional tone
+- Provide response in short and precise manner appropriate for WhatsApp Marketing Bot
+
+Note: Do not tell from  ur side that i do not find from theknowledge base provided instead just say an appology message that i do not have that information to that.
+Do not use any vague or introduction message. Also if there is no context then just say that "Sorry, I donot have any information regarding this."
+
+Answer:""")
+
+TEST_QUERY_PROMPT = PromptTemplate.from_template("""
+Context: {context}
+
+Question: {question}
+
+Instructions:
+- Use the knowledge base content primarily to answer the question
+- If the knowledge base doesn't contain relevant information, respond politely that you don't have that information
+- Keep responses concise and helpful
+- Maintain a friendly, professional tone
+
+Note: Do not tell from your side that you did not find the information in the knowledge base. Instead, just say an apology message that you don't have that information.
+Do not use any vague or introduction message. Also if there is no context then just say that "Sorry, I don't have any information regarding this."
+
+Answer:""")
+
+# One client per model; ChatGroq holds its own HTTP session
+_chat_models = {}
+
+# Identical questions arriving together (e.g. replies to a broadcast) share one retrieval / completion
+_retrieval_flights = SingleFlight("retrieval")
+_reply_flights = SingleFlight("reply")
+
+def get_chat_model(model: str) -> ChatGroq:
+    if model not in _chat_models:
+        _chat_models[model] = ChatGroq(
+            api_key=GROQ_API_KEY, model=model, temperature=0.3,
+            timeout=GROQ_TIMEOUT, max_retries=GROQ_MAX_RETRIES
+        )
+    return _chat_models[model]
+
+async def retrieve_documents(vector_store_path: str, question: str):
+    """Run MMR + compression retrieval against a user's vector store"""
+    vector_store = None
+    try:
+        loop = asyncio.get_event_loop()
+        vector_store = await loop.run_in_executor(
+            None, load_vector_store_safely, vector_store_path
+        )
+
+        advanced_retriever = create_advanced_retriever(vector_store, embedding_model)
+        compressed_docs = await loop.run_in_executor(
+            None,
+            advanced_retriever.get_relevant_documents,
+            question
+        )
+        logger.info(f"Retrieved {len(compressed_docs)} documents after compression")
+        return compressed_docs
+    finally:
+        if vector_store:
+            close_vector_store(vector_store)
+
+async def generate_reply(prompt: PromptTemplate, context: str, question: str, documents) -> dict:
+    """Route the question to the fast or large model and generate the answer"""
+    route = route_reply_model(question, retrieval_scores(documents))
+
+    if not GROQ_API_KEY:
+        return {"answer": AI_UNAVAILABLE_REPLY, "route": route}
+
+    started = time.perf_counter()
+    chain = prompt | get_chat_model(route["model"])
+    try:
+        async with groq_breaker.protect(is_server_error):
+            response = await chain.ainvoke({"context": context, "question": question})
+    except CircuitOpenError as e:
+        logger.warning(f"Chatbot reply skipped: {e}")
+        return {"answer": AI_BUSY_REPLY, "route": dict(route, fallback="circuit_open")}
+    route["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    logger.info(f"Chatbot reply via {route['model']} ({route['reason']}) in {route['latency_ms']}ms")
+    return {"answer": response.content, "route": route}
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).strip("?!.,")
+
+def _question_key(user: dict, question: str) -> tuple:
+    """Tenant, normalized question and knowledge-base version"""
+    return (
+        str(user["_id"]),
+        user.get("vector_store_path"),
+        str(user.get("knowledge_base_updated")),
+        normalize_question(question)
+    )
+
+async def retrieve_documents_coalesced(user: dict, question: str):
+    """retrieve_documents shared between concurrent identical questions; returns (documents, shared)"""
+    return await _retrieval_flights.do(
+        _question_key(user, question),
+        lambda: retrieve_documents(user["vector_store_path"], question)
+    )
+
+async def generate_reply_coalesced(user: dict, prompt: PromptTemplate, context: str, question: str, documents):
+    """generate_reply shared between concurrent identical questions; returns (reply, shared).
+
+    Only use this when context carries nothing sender-specific, otherwise
+    senders would receive an answer built on someone else's conversation.
+    """
+    reply, shared = await _reply_flights.do(
+        _question_key(user, question) + (id(prompt),),
+        lambda: generate_reply(prompt, context, question, documents)
+    )
+    # Each sender stores its own copy of the route on its chat history entry
+    return {"answer": reply["answer"], "route": dict(reply["route"], coalesced=shared)}, shared
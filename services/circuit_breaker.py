@@ -0,0 +1,170 @@
+"""Circuit breakers for outbound providers.
+
+A provider that is down makes every call wait for the full timeout, which
+ties up worker slots and slows the whole API. After
+CIRCUIT_FAILURE_THRESHOLD consecutive provider-side failures (timeouts,
+connection errors, 5xx) a breaker opens and calls fail immediately with
+CircuitOpenError. Once the recovery time has passed the breaker goes
+half-open and lets one probe call through: success closes it, failure opens
+it again with the recovery time doubled, up to CIRCUIT_MAX_RECOVERY_SECONDS.
+
+Client errors (bad number, invalid token, 429) are answers from a healthy
+provider and count as successes. Where one tenant's account can fail on its
+own (a WhatsApp number), a sender breaker keyed by that account takes its
+timeouts and 5xx, and the provider breaker only counts failures that affect
+everyone, such as not being able to connect. Each caller decides its own fallback:
+campaign sends are deferred until the breaker's retry time, the chatbot
+answers with a canned reply.
+"""
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict
+
+from config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_SECONDS, CIRCUIT_MAX_RECOVERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        recovery_seconds: float = CIRCUIT_RECOVERY_SECONDS,
+        max_recovery_seconds: float = CIRCUIT_MAX_RECOVERY_SECONDS
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_recovery_seconds = recovery_seconds
+        self.max_recovery_seconds = max_recovery_seconds
+        self.state = CLOSED
+        self.recovery_seconds = recovery_seconds
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self.rejected_count = 0
+        self.last_failure = ""
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+
+    def _retry_in(self) -> float:
+        return max(0.0, self._opened_at + self.recovery_seconds - time.monotonic())
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go out now"""
+        if self.state == CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == OPEN and self._retry_in() <= 0:
+            self.state = HALF_OPEN
+            self._probe_started = now
+            logger.info(f"Circuit {self.name} half-open; probing")
+            return
+        # A probe that never reported back (e.g. cancelled) doesn't block the next one forever
+        if self.state == HALF_OPEN and now - self._probe_started > self.recovery_seconds:
+            self._probe_started = now
+            return
+        self.rejected_count += 1
+        raise CircuitOpenError(self.name, self._retry_in() or self.recovery_seconds)
+
+    def raise_if_open(self):
+        """check() without side effects: fail fast while open, but never claim the half-open probe"""
+        if self.state == OPEN and self._retry_in() > 0:
+            self.rejected_count += 1
+            raise CircuitOpenError(self.name, self._retry_in())
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.recovery_seconds = self.base_recovery_seconds
+
+    def record_failure(self, reason: str = ""):
+        self.consecutive_failures += 1
+        self.last_failure = reason[:200]
+        if self.state == HALF_OPEN:
+            self.recovery_seconds = min(self.max_recovery_seconds, self.recovery_seconds * 2)
+            self._open()
+        elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.opened_count += 1
+        logger.warning(
+            f"Circuit {self.name} open for {self.recovery_seconds:.0f}s after "
+            f"{self.consecutive_failures} failures: {self.last_failure}"
+        )
+
+    @asynccontextmanager
+    async def protect(self, is_failure: Callable[[Exception], bool] = lambda error: True):
+        """Guard an exception-raising call; `is_failure` picks the errors that mean the provider is down"""
+        self.check()
+        try:
+            yield
+        except Exception as e:
+            if is_failure(e):
+                self.record_failure(f"{type(e).__name__}: {e}")
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened_count,
+            "rejected": self.rejected_count,
+            "retry_in_seconds": round(self._retry_in(), 1) if self.state == OPEN else 0.0,
+            "last_failure": self.last_failure
+        }
+
+meta_breaker = CircuitBreaker("meta")
+twilio_breaker = CircuitBreaker("twilio")
+sendgrid_breaker = CircuitBreaker("sendgrid")
+groq_breaker = CircuitBreaker("groq")
+gemini_breaker = CircuitBreaker("gemini")
+
+BREAKERS: Dict[str, CircuitBreaker] = {
+    breaker.name: breaker
+    for breaker in (meta_breaker, twilio_breaker, sendgrid_breaker, groq_breaker, gemini_breaker)
+}
+
+# "<provider>:<sender>" -> breaker for one tenant's sender, so failures on one
+# account (a slow number, a 5xx for one WABA) don't fail every tenant's sends
+_sender_breakers: Dict[str, CircuitBreaker] = {}
+
+def sender_breaker(provider: str, sender: str) -> CircuitBreaker:
+    name = f"{provider}:{sender}"
+    breaker = _sender_breakers.get(name)
+    if breaker is None:
+        breaker = _sender_breakers[name] = CircuitBreaker(name)
+    return breaker
+
+def sender_breaker_open(provider: str, sender: str) -> bool:
+    """Whether the sender's breaker is refusing calls; doesn't create one"""
+    breaker = _sender_breakers.get(f"{provider}:{sender}")
+    return breaker is not None and breaker.state == OPEN
+
+def breaker_stats() -> Dict[str, dict]:
+    return {name: breaker.stats() for name, breaker in BREAKERS.items()}
+
+def sender_breaker_stats() -> Dict[str, dict]:
+    return {name: breaker.stats() for name, breaker in _sender_breakers.items()}
+
+def is_server_error(error: Exception) -> bool:
+    """Timeouts, connection errors and 5xx; errors carrying a 4xx status mean the provider answered"""
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    return not isinstance(status, int) or status >= 500
@@ -101,6 +101,35 @@ async def get_sms_campaigns_collection():
     db = await get_database()
     return db.sms_campaigns
 
+async def get_campaign_send_tasks_collection():
+    from config import CAMPAIGN_SEND_TASKS_COLLECTION
+    db = await get_database()
+    return db[CAMPAIGN_SEND_TASKS_COLLECTION]
+
+async def get_campaign_dead_letters_collection():
+    db = await get_database()
+    return db.campaign_dead_letters
+
+async def get_leader_leases_collection():
+    db = await get_database()
+    return db.leader_leases
+
+async def get_idempotency_keys_collection():
+    db = await get_database()
+    return db.idempotency_keys
+
+async def get_whatsapp_media_collection():
+    db = await get_database()
+    return db.whatsapp_media
+
+async def get_rate_buckets_collection():
+    db = await get_database()
+    return db.rate_buckets
+
+async def get_rate_quotas_collection():
+    db = await get_database()
+    return db.rate_quotas
+
 async def get_password_reset_sessions_collection():
     """Get password reset sessions collection"""
     db = await get_database()
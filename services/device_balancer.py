@@ -0,0 +1,104 @@
+"""Spread one WhatsApp campaign across several of a user's devices.
+
+Each recipient is assigned to a device by weighted rendezvous hashing: every
+device scores the recipient, weighted by its Meta messaging tier and quality
+rating, and the best score wins. The assignment is deterministic, a device's
+share of recipients follows its weight, and when a device drops out only the
+recipients it held move to the remaining devices. The pick happens at send
+time against a briefly cached view of the devices, so a device that goes
+inactive mid-campaign stops receiving sends within DEVICE_STATE_TTL_SECONDS.
+
+Tier and quality are copied from the Graph API by the credential checks in
+services.meta_credentials. A device whose token is known to be invalid, or
+whose circuit breaker is open, gets no recipients until it recovers.
+"""
+import hashlib
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from services.database import get_devices_collection
+from services.meta_credentials import cached_health, CREDENTIALS_INVALID
+from services.circuit_breaker import sender_breaker_open
+
+# Meta messaging limit tier (business-initiated conversations per 24h) -> weight
+TIER_WEIGHTS = {
+    "TIER_50": 0.05,
+    "TIER_250": 0.25,
+    "TIER_1K": 1,
+    "TIER_10K": 10,
+    "TIER_100K": 100,
+    "TIER_UNLIMITED": 250
+}
+DEFAULT_TIER_WEIGHT = 1
+
+# Meta phone number quality rating -> share of the tier weight kept
+QUALITY_FACTORS = {"GREEN": 1.0, "YELLOW": 0.5, "RED": 0.1}
+
+DEVICE_STATE_TTL_SECONDS = 10
+
+# tuple of device ids -> (monotonic time loaded, device id -> weight of active devices)
+_device_weights: Dict[Tuple[str, ...], Tuple[float, Dict[str, float]]] = {}
+
+def device_weight(device: dict) -> float:
+    """Send share of an active device: its tier, discounted by its quality rating"""
+    if device.get("status") != "active":
+        return 0.0
+    metadata = device.get("metadata") or {}
+    tier = TIER_WEIGHTS.get(str(metadata.get("messaging_limit_tier", "")).upper(), DEFAULT_TIER_WEIGHT)
+    quality = QUALITY_FACTORS.get(str(metadata.get("quality_rating", "")).upper(), 1.0)
+    return tier * quality
+
+def _unit_hash(device_id: str, recipient: str) -> float:
+    digest = hashlib.blake2b(f"{device_id}|{recipient}".encode(), digest_size=8).digest()
+    # Map to (0, 1) exclusive so the log below is always defined
+    return (int.from_bytes(digest, "big") + 0.5) / 2 ** 64
+
+def pick_device(recipient: str, weights: Dict[str, float]) -> Optional[str]:
+    """Device for a recipient (weighted rendezvous); None if no device has weight"""
+    best, best_score = None, -math.inf
+    for device_id, weight in weights.items():
+        if weight <= 0:
+            continue
+        score = -weight / math.log(_unit_hash(device_id, recipient))
+        if score > best_score:
+            best, best_score = device_id, score
+    return best
+
+async def active_device_weights(user_id, device_ids: List[str]) -> Dict[str, float]:
+    """Weights of the user's devices among `device_ids`, reloaded every few seconds"""
+    key = tuple(device_ids)
+    cached = _device_weights.get(key)
+    if cached and time.monotonic() - cached[0] < DEVICE_STATE_TTL_SECONDS:
+        return cached[1]
+
+    devices_collection = await get_devices_collection()
+    devices = await devices_collection.find(
+        {"_id": {"$in": [ObjectId(device_id) for device_id in device_ids]}, "user_id": user_id},
+        {"status": 1, "metadata": 1}
+    ).to_list(length=len(device_ids))
+    weights = {str(device["_id"]): device_weight(device) for device in devices}
+    _device_weights[key] = (time.monotonic(), weights)
+    return weights
+
+def healthy_weights(user: dict, weights: Dict[str, float]) -> Dict[str, float]:
+    """Drop devices with invalid Meta credentials or an open circuit breaker"""
+    healthy = {}
+    for device_id, weight in weights.items():
+        health = cached_health(user, device_id)
+        if health and health["status"] == CREDENTIALS_INVALID:
+            continue
+        if sender_breaker_open("meta", device_id):
+            continue
+        healthy[device_id] = weight
+    return healthy
+
+async def campaign_device(campaign: dict, recipient: str, user: dict) -> Optional[str]:
+    """Device to send this recipient's message from; None if all of the campaign's devices are down"""
+    device_ids = campaign.get("instance_ids")
+    if not device_ids:
+        return campaign["phone_number_id"]
+    weights = await active_device_weights(campaign["user_id"], device_ids)
+    return pick_device(recipient, healthy_weights(user, weights))
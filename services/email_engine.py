@@ -0,0 +1,185 @@
+"""Bulk email through the SendGrid v3 API.
+
+Recipients are packed into /mail/send calls of up to SENDGRID_BATCH_SIZE
+personalizations, each carrying that recipient's substitutions, and the calls
+run concurrently over one pooled async HTTP client. A SendGrid batch_id ties
+the calls of one campaign together so its scheduled sends can be paused or
+cancelled at SendGrid.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import httpx
+
+from config import SG_BASE, SENDGRID_HTTP_TIMEOUT, SENDGRID_BATCH_SIZE, SENDGRID_SEND_CONCURRENCY
+from services.send_errors import classify_sendgrid_response, classify_circuit_open
+from services.circuit_breaker import sendgrid_breaker, CircuitOpenError
+from services.personalization import compile_template
+
+logger = logging.getLogger(__name__)
+
+class SendGridClient:
+    """Shared async HTTP client for the SendGrid v3 API, opened in the app lifespan"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=SG_BASE, timeout=SENDGRID_HTTP_TIMEOUT)
+            logger.info("SendGrid HTTP client started")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("SendGrid HTTP client closed")
+
+    async def request(self, method: str, path: str, api_key: str, **kwargs) -> httpx.Response:
+        if self._client is None:
+            await self.start()
+        headers = {"Authorization": f"Bearer {api_key}"}
+        # Raises CircuitOpenError while SendGrid is considered down
+        sendgrid_breaker.check()
+        try:
+            response = await self._client.request(method, path, headers=headers, **kwargs)
+        except httpx.HTTPError as e:
+            sendgrid_breaker.record_failure(f"{type(e).__name__}: {e}")
+            raise
+        if response.status_code >= 500:
+            sendgrid_breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            sendgrid_breaker.record_success()
+        return response
+
+sendgrid_client = SendGridClient()
+
+@dataclass
+class EmailBatchResult:
+    """Outcome of one /mail/send call covering `recipient_count` recipients"""
+    ok: bool
+    recipient_count: int
+    status_code: Optional[int] = None
+    message_id: Optional[str] = None
+    error: Optional[dict] = None
+
+def build_personalization(recipient: dict, placeholders) -> dict:
+    """One personalization: the recipient plus a substitution for each placeholder in the message"""
+    to = {"email": recipient["email"]}
+    if recipient.get("name"):
+        to["name"] = recipient["name"]
+    personalization = {"to": [to]}
+    if placeholders:
+        # SendGrid swaps each placeholder token for the recipient's value server-side
+        personalization["substitutions"] = {
+            p.token: str(recipient.get(p.field) or p.default) for p in placeholders
+        }
+    return personalization
+
+def message_placeholders(subject: str, content: str) -> tuple:
+    """Placeholders of subject and body together; raises ValueError for unknown ones"""
+    placeholders = compile_template(subject).placeholders + compile_template(content).placeholders
+    return tuple(dict.fromkeys(placeholders))
+
+def _error_message(response: httpx.Response) -> str:
+    try:
+        errors = response.json().get("errors") or []
+        return "; ".join(error.get("message", "") for error in errors) or response.text
+    except ValueError:
+        return response.text
+
+async def create_batch_id(api_key: str) -> Optional[str]:
+    """Reserve a SendGrid batch id; None if SendGrid would not issue one"""
+    try:
+        response = await sendgrid_client.request("POST", "/mail/batch", api_key)
+    except (httpx.HTTPError, CircuitOpenError) as e:
+        logger.warning(f"Could not create SendGrid batch id: {e}")
+        return None
+    if response.status_code != 201:
+        logger.warning(f"Could not create SendGrid batch id: {_error_message(response)}")
+        return None
+    return response.json().get("batch_id")
+
+async def set_batch_status(api_key: str, batch_id: str, action: str) -> bool:
+    """Pause or cancel a batch's scheduled sends at SendGrid; "resume" lifts a pause or cancel"""
+    try:
+        if action == "resume":
+            response = await sendgrid_client.request("DELETE", f"/user/scheduled_sends/{batch_id}", api_key)
+        else:
+            response = await sendgrid_client.request(
+                "POST", "/user/scheduled_sends", api_key, json={"batch_id": batch_id, "status": action}
+            )
+    except (httpx.HTTPError, CircuitOpenError) as e:
+        logger.warning(f"Could not {action} SendGrid batch {batch_id}: {e}")
+        return False
+    # Nothing scheduled under the batch is not an error
+    return response.status_code in (201, 204, 404)
+
+async def send_email_batch(
+    api_key: str,
+    from_email: str,
+    subject: str,
+    content: str,
+    recipients: List[dict],
+    content_type: str = "text/html",
+    batch_id: Optional[str] = None,
+    send_at: Optional[datetime] = None
+) -> EmailBatchResult:
+    """One /mail/send call for at most SENDGRID_BATCH_SIZE recipients ({"email", "name", "var1".."var3"})"""
+    placeholders = message_placeholders(subject, content)
+    payload = {
+        "personalizations": [build_personalization(recipient, placeholders) for recipient in recipients],
+        "from": {"email": from_email},
+        "subject": subject,
+        "content": [{"type": content_type, "value": content}]
+    }
+    if batch_id:
+        payload["batch_id"] = batch_id
+    if send_at and send_at > datetime.now(timezone.utc):
+        payload["send_at"] = int(send_at.timestamp())
+
+    try:
+        response = await sendgrid_client.request("POST", "/mail/send", api_key, json=payload)
+    except CircuitOpenError as e:
+        return EmailBatchResult(ok=False, recipient_count=len(recipients), error=classify_circuit_open(e))
+    except httpx.HTTPError as e:
+        error = classify_sendgrid_response(None, message=f"{type(e).__name__}: {e}")
+        return EmailBatchResult(ok=False, recipient_count=len(recipients), error=error)
+
+    if response.status_code == 202:
+        return EmailBatchResult(
+            ok=True,
+            recipient_count=len(recipients),
+            status_code=response.status_code,
+            message_id=response.headers.get("X-Message-Id")
+        )
+    error = classify_sendgrid_response(response.status_code, response.headers, _error_message(response))
+    return EmailBatchResult(
+        ok=False, recipient_count=len(recipients), status_code=response.status_code, error=error
+    )
+
+async def send_bulk_email(
+    api_key: str,
+    from_email: str,
+    subject: str,
+    content: str,
+    recipients: List[dict],
+    content_type: str = "text/html",
+    batch_id: Optional[str] = None,
+    send_at: Optional[datetime] = None,
+    concurrency: int = SENDGRID_SEND_CONCURRENCY
+) -> List[EmailBatchResult]:
+    """Send to any number of recipients, SENDGRID_BATCH_SIZE per call, `concurrency` calls at a time"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(chunk: List[dict]) -> EmailBatchResult:
+        async with semaphore:
+            return await send_email_batch(
+                api_key, from_email, subject, content, chunk, content_type, batch_id, send_at
+            )
+
+    chunks = [recipients[i:i + SENDGRID_BATCH_SIZE] for i in range(0, len(recipients), SENDGRID_BATCH_SIZE)]
+    return await asyncio.gather(*(send(chunk) for chunk in chunks))
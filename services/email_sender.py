@@ -1,59 +1,31 @@
-import smtplib
+import asyncio
 import logging
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import os
-from datetime import datetime
+import time
+from email.message import EmailMessage
+from typing import Optional
 
-logger = logging.getLogger(__name__)
-
-class EmailSender:
-    def __init__(self):
-        self.smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-        self.smtp_port = int(os.getenv('SMTP_PORT', 587))
-        self.smtp_username = os.getenv('SMTP_USERNAME')
-        self.smtp_password = os.getenv('SMTP_PASSWORD')
-        self.from_email = os.getenv('FROM_EMAIL', self.smtp_username)
+import aiosmtplib
 
-    async def send_otp_email(self, to_email: str, otp: str) -> bool:
-        """Send OTP email using SMTP"""
-        try:
-            # Create message
-            subject = "Your AiMsgHub Verification Code For Password Reset"
-            body = self._create_otp_email_body(otp)
-            
-            msg = MIMEMultipart()
-            msg['From'] = self.from_email
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            msg.attach(MIMEText(body, 'html'))
-
-            # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()  # Enable security
-                server.login(self.smtp_username, self.smtp_password)
-                server.send_message(msg)
+from config import SMTP_POOL_SIZE, SMTP_TIMEOUT, SMTP_SEND_TIMEOUT, SMTP_IDLE_CHECK_SECONDS, SMTP_REALTIME_RESERVED
+from services.priority_lanes import LaneScheduler, REALTIME, STANDARD
 
-            logger.info(f"OTP email sent to {to_email}")
-            return True
+logger = logging.getLogger(__name__)
 
-        except Exception as e:
-            logger.error(f"Failed to send OTP email: {str(e)}")
-            return False
+OTP_EMAIL_SUBJECT = "Your AiMsgHub Verification Code For Password Reset"
 
-    def _create_otp_email_body(self, otp: str) -> str:
-        """Create HTML email body for OTP"""
-        return f"""
+# Rendered once; only the code is substituted per message
+OTP_EMAIL_TEMPLATE = """
         <!DOCTYPE html>
         <html>
         <head>
             <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .header {{ background: #4f46e5; color: white; padding: 20px; text-align: center; border-radius: 10px 10px 0 0; }}
-                .content {{ background: #f9fafb; padding: 30px; border-radius: 0 0 10px 10px; }}
-                .otp-code {{ font-size: 32px; font-weight: bold; text-align: center; color: #4f46e5; margin: 20px 0; }}
-                .footer {{ text-align: center; margin-top: 20px; font-size: 12px; color: #666; }}
+                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+                .header { background: #4f46e5; color: white; padding: 20px; text-align: center; border-radius: 10px 10px 0 0; }
+                .content { background: #f9fafb; padding: 30px; border-radius: 0 0 10px 10px; }
+                .otp-code { font-size: 32px; font-weight: bold; text-align: center; color: #4f46e5; margin: 20px 0; }
+                .footer { text-align: center; margin-top: 20px; font-size: 12px; color: #666; }
             </style>
         </head>
         <body>
@@ -77,5 +49,149 @@ class EmailSender:
         </html>
         """
 
+class SMTPConnectionPool:
+    """A few authenticated SMTP connections, reused across sends.
+
+    At most `size` connections are open at once; extra senders wait for one to
+    free up, with SMTP_REALTIME_RESERVED of them kept for realtime mail (OTP). A connection idle longer than `idle_check_seconds` is NOOP-checked
+    before reuse and replaced if the server has dropped it.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: Optional[str],
+        password: Optional[str],
+        size: int = SMTP_POOL_SIZE,
+        timeout: float = SMTP_TIMEOUT,
+        idle_check_seconds: float = SMTP_IDLE_CHECK_SECONDS
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.idle_check_seconds = idle_check_seconds
+        self._slots = LaneScheduler("smtp", size, {REALTIME: min(SMTP_REALTIME_RESERVED, size)})
+        self._idle = []
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        # Port 465 is implicit TLS; anything else upgrades with STARTTLS
+        use_tls = self.port == 465
+        smtp = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=use_tls,
+            start_tls=not use_tls,
+            timeout=self.timeout
+        )
+        await smtp.connect()
+        return smtp
+
+    async def _healthy(self, smtp: aiosmtplib.SMTP, last_used: float) -> bool:
+        if not smtp.is_connected:
+            return False
+        if time.monotonic() - last_used < self.idle_check_seconds:
+            return True
+        try:
+            await smtp.noop()
+            return True
+        except aiosmtplib.SMTPException:
+            smtp.close()
+            return False
+
+    async def _checkout(self) -> aiosmtplib.SMTP:
+        while self._idle:
+            smtp, last_used = self._idle.pop()
+            if await self._healthy(smtp, last_used):
+                return smtp
+        return await self._connect()
+
+    def _checkin(self, smtp: aiosmtplib.SMTP, reusable: bool):
+        if reusable and smtp.is_connected:
+            self._idle.append((smtp, time.monotonic()))
+        else:
+            smtp.close()
+
+    async def send(self, message: EmailMessage, timeout: float = SMTP_SEND_TIMEOUT, lane: str = STANDARD):
+        """Send over a pooled connection; raises aiosmtplib / timeout errors"""
+        async with self._slots.slot(lane):
+            while True:
+                pooled = bool(self._idle)
+                smtp = await self._checkout()
+                reusable = False
+                try:
+                    await asyncio.wait_for(smtp.send_message(message), timeout)
+                    reusable = True
+                    return
+                except aiosmtplib.SMTPServerDisconnected:
+                    # A pooled session the server dropped since its last check; retry on a fresh one
+                    if pooled:
+                        continue
+                    raise
+                except aiosmtplib.SMTPResponseException:
+                    # The server answered (e.g. refused a recipient); the session is still usable
+                    reusable = True
+                    raise
+                finally:
+                    self._checkin(smtp, reusable)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
+class EmailSender:
+    """Transactional email (OTP, notifications) over a pooled async SMTP transport"""
+
+    def __init__(self):
+        self.smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+        self.smtp_port = int(os.getenv('SMTP_PORT', 587))
+        self.smtp_username = os.getenv('SMTP_USERNAME')
+        self.smtp_password = os.getenv('SMTP_PASSWORD')
+        self.from_email = os.getenv('FROM_EMAIL', self.smtp_username)
+        self.pool = SMTPConnectionPool(
+            self.smtp_server, self.smtp_port, self.smtp_username, self.smtp_password
+        )
+
+    async def send_email(self, to_email: str, subject: str, html: str, text: Optional[str] = None, lane: str = STANDARD) -> bool:
+        """Send one transactional email; returns False instead of raising on failure"""
+        msg = EmailMessage()
+        msg['From'] = self.from_email
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        if text:
+            msg.set_content(text)
+            msg.add_alternative(html, subtype='html')
+        else:
+            msg.set_content(html, subtype='html')
+
+        try:
+            await self.pool.send(msg, lane=lane)
+            return True
+        except (aiosmtplib.SMTPException, asyncio.TimeoutError, OSError) as e:
+            logger.error(f"Failed to send email to {to_email}: {type(e).__name__}: {e}")
+            return False
+
+    async def send_otp_email(self, to_email: str, otp: str) -> bool:
+        """Send OTP email using SMTP"""
+        sent = await self.send_email(to_email, OTP_EMAIL_SUBJECT, self._create_otp_email_body(otp), lane=REALTIME)
+        if sent:
+            logger.info(f"OTP email sent to {to_email}")
+        return sent
+
+    def _create_otp_email_body(self, otp: str) -> str:
+        """Create HTML email body for OTP"""
+        return OTP_EMAIL_TEMPLATE.replace("{otp}", otp)
+
+    async def close(self):
+        await self.pool.close()
+
 # Global instance
-email_sender = EmailSender()
\ No newline at end of file
+email_sender = EmailSender()
@@ -2,7 +2,8 @@ import google.generativeai as genai
 import asyncio
 import logging
 from fastapi import HTTPException
-from config import GEMINI_API_KEY
+from config import GEMINI_API_KEY, GEMINI_TIMEOUT
+from services.circuit_breaker import gemini_breaker, CircuitOpenError
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +27,16 @@ async def call_gemini_api(system_prompt, user_query, model_name: str = "gemini-2
     if not GEMINI_API_KEY:
         raise HTTPException(status_code=500, detail="GEMINI_API_KEY not configured on server.")
 
+    try:
+        gemini_breaker.check()
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": str(int(e.retry_after) + 1)}
+        )
+
+    response = None
     try:
         # Initialize the model with the system prompt
         model = genai.GenerativeModel(
@@ -37,8 +48,10 @@ async def call_gemini_api(system_prompt, user_query, model_name: str = "gemini-2
         # in a separate thread to avoid blocking FastAPI's event loop.
         response = await asyncio.to_thread(
             model.generate_content, 
-            user_query
+            user_query,
+            request_options={"timeout": GEMINI_TIMEOUT}
         )
+        gemini_breaker.record_success()
         
         # Safely get the text
         if response.text:
@@ -56,6 +69,10 @@ async def call_gemini_api(system_prompt, user_query, model_name: str = "gemini-2
              raise HTTPException(status_code=401, detail="Invalid GEMINI_API_KEY.")
         if "404" in str(e) or "not found" in str(e).lower():
              raise HTTPException(status_code=404, detail=f"Model '{model_name}' not found or not available to your API key.")
+
+        # Anything else from the call itself (timeouts, 5xx, connection errors) counts towards opening the circuit
+        if response is None:
+            gemini_breaker.record_failure(f"{type(e).__name__}: {e}")
         
         # General catch-all
         raise HTTPException(status_code=502, detail=f"Error communicating with AI service: {e}")
\ No newline at end of file
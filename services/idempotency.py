@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pymongo.errors import DuplicateKeyError
+
+from config import IDEMPOTENCY_KEY_TTL_HOURS, IDEMPOTENCY_LOCK_SECONDS, IDEMPOTENCY_WAIT_SECONDS
+from services.database import get_idempotency_keys_collection
+
+logger = logging.getLogger(__name__)
+
+KEY_IN_PROGRESS = "in_progress"
+KEY_COMPLETED = "completed"
+
+POLL_INTERVAL_SECONDS = 0.25
+
+async def create_idempotency_indexes():
+    idempotency_collection = await get_idempotency_keys_collection()
+    await idempotency_collection.create_index("expires_at", expireAfterSeconds=0)
+
+def request_hash(payload: Any) -> str:
+    """Stable fingerprint of a request body, stored with its key"""
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def _check_same_request(record: dict, fingerprint: Optional[str]):
+    # Records stored before fingerprints were kept carry none
+    stored = record.get("request_hash")
+    if fingerprint and stored and stored != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="This Idempotency-Key was already used with a different request body"
+        )
+
+async def _claim(key_id: str, token: str, fingerprint: Optional[str] = None) -> Optional[dict]:
+    """Lock the key for this request; returns the existing record if someone else holds it"""
+    idempotency_collection = await get_idempotency_keys_collection()
+    now = datetime.now(timezone.utc)
+    try:
+        await idempotency_collection.insert_one({
+            "_id": key_id,
+            "status": KEY_IN_PROGRESS,
+            "request_hash": fingerprint,
+            "lock_token": token,
+            "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+            "created_at": now,
+            "expires_at": now + timedelta(hours=IDEMPOTENCY_KEY_TTL_HOURS)
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+
+    # A holder that died mid-request leaves its lock to expire; take it over
+    taken = await idempotency_collection.update_one(
+        {"_id": key_id, "status": KEY_IN_PROGRESS, "locked_until": {"$lt": now}},
+        {"$set": {
+            "lock_token": token,
+            "request_hash": fingerprint,
+            "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+        }}
+    )
+    if taken.modified_count:
+        return None
+    return await idempotency_collection.find_one({"_id": key_id}) or {"status": KEY_IN_PROGRESS}
+
+async def _wait_for_result(key_id: str, token: str, fingerprint: Optional[str] = None) -> Optional[dict]:
+    """Block a concurrent duplicate until the first request finishes.
+
+    Returns the completed record, or None once this request owns the key
+    (the first request failed and released it, or its lock expired).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+    while loop.time() < deadline:
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        record = await _claim(key_id, token, fingerprint)
+        if record is None or record["status"] == KEY_COMPLETED:
+            return record
+    raise HTTPException(
+        status_code=409,
+        detail="A request with this Idempotency-Key is still in progress"
+    )
+
+def _replay(record: dict) -> JSONResponse:
+    return JSONResponse(
+        status_code=record.get("status_code", 200),
+        content=record["response"],
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+async def run_idempotent(
+    idempotency_key: Optional[str],
+    user_id: Any,
+    scope: str,
+    handler: Callable[[], Awaitable[Any]],
+    status_code: int = 200,
+    request_body: Any = None
+):
+    """Run `handler` at most once per (scope, user, Idempotency-Key).
+
+    The first request stores its response against the key; repeats within the
+    TTL get that response back without re-executing, and concurrent duplicates
+    wait for the first one to finish. Failed requests release the key so the
+    client can retry them. Without a key the handler just runs.
+
+    A fingerprint of `request_body` is stored with the key, and reusing the
+    key for a different body is rejected with 422 instead of replaying an
+    unrelated response.
+    """
+    if not idempotency_key:
+        return await handler()
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 255 characters")
+
+    key_id = f"{scope}:{user_id}:{idempotency_key}"
+    token = uuid.uuid4().hex
+    fingerprint = request_hash(request_body) if request_body is not None else None
+
+    record = await _claim(key_id, token, fingerprint)
+    if record is not None:
+        _check_same_request(record, fingerprint)
+    if record is not None and record["status"] != KEY_COMPLETED:
+        record = await _wait_for_result(key_id, token, fingerprint)
+    if record is not None:
+        _check_same_request(record, fingerprint)
+        logger.info(f"Replaying stored response for idempotency key {key_id}")
+        return _replay(record)
+
+    idempotency_collection = await get_idempotency_keys_collection()
+    try:
+        response = await handler()
+    except BaseException:
+        await idempotency_collection.delete_one({"_id": key_id, "lock_token": token})
+        raise
+
+    await idempotency_collection.update_one(
+        {"_id": key_id, "lock_token": token},
+        {
+            "$set": {
+                "status": KEY_COMPLETED,
+                "status_code": status_code,
+                "response": jsonable_encoder(response),
+                "completed_at": datetime.now(timezone.utc)
+            },
+            "$unset": {"locked_until": ""}
+        }
+    )
+    return response
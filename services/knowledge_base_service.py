@@ -1,10 +1,15 @@
 import os
 import shutil
+import asyncio
+import hashlib
 import logging
 from bson import ObjectId
 from datetime import datetime, timezone
 
-from utils.file_processing import replace_user_knowledge_base
+from langchain_core.documents import Document
+from utils.file_processing import replace_user_knowledge_base, split_documents
+from utils.web_scraping import WebCrawler
+from services.database import get_knowledge_base_collection
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +32,9 @@ async def update_replace_user_knowledge_base_service(user_id: str, file, users_c
             except Exception as e:
                 logger.warning(f"Could not clean up old vector store: {e}")
         
+        # Crawled pages lived in the replaced vector store
+        await forget_crawled_pages(user_id)
+        
         # Update user in database
         await users_collection.update_one(
             {"_id": ObjectId(user_id)},
@@ -50,4 +58,118 @@ async def update_replace_user_knowledge_base_service(user_id: str, file, users_c
         return {
             "success": False,
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+async def forget_crawled_pages(user_id):
+    """Drop crawl bookkeeping so the next crawl re-embeds every page"""
+    knowledge_base_collection = await get_knowledge_base_collection()
+    await knowledge_base_collection.delete_many({"user_id": str(user_id), "source": "web"})
+
+def _page_chunk_ids(url: str, count: int):
+    page_key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return [f"web_{page_key}_{i}" for i in range(count)]
+
+async def crawl_user_knowledge_base_service(user_id: str, start_url: str, users_collection, max_pages: int = 50):
+    """Crawl a website into the user's knowledge base, re-embedding only pages that changed"""
+    from utils.embeddings import embedding_model
+    from langchain_community.vectorstores import Chroma
+    
+    user_id = str(user_id)
+    vector_store_path = f"vector_stores/user_{user_id}/vector_store"
+    knowledge_base_collection = await get_knowledge_base_collection()
+    stats = {"changed": 0, "unchanged": 0, "removed": 0, "failed": 0, "chunks_added": 0}
+    
+    try:
+        known_docs = await knowledge_base_collection.find(
+            {"user_id": user_id, "source": "web", "root_url": start_url}
+        ).to_list(length=None)
+        
+        # Validators are only trustworthy if the embedded chunks still exist
+        if not os.path.exists(vector_store_path):
+            known_docs = []
+            await forget_crawled_pages(user_id)
+        known_pages = {doc["url"]: doc for doc in known_docs}
+        
+        os.makedirs(os.path.dirname(vector_store_path), exist_ok=True)
+        vector_store = Chroma(persist_directory=vector_store_path, embedding_function=embedding_model)
+        loop = asyncio.get_event_loop()
+        
+        crawler = WebCrawler(start_url, max_pages=max_pages, known_pages=known_pages)
+        async for page in crawler.crawl():
+            url = page["url"]
+            known = known_pages.get(url, {})
+            
+            if page["status"] == "unchanged":
+                stats["unchanged"] += 1
+                continue
+            
+            if page["status"] == "failed":
+                stats["failed"] += 1
+                continue
+            
+            # Embed the new version before dropping the old chunks
+            old_chunk_ids = known.get("chunk_ids", [])
+            chunk_ids = []
+            if page["status"] == "changed":
+                page_doc = Document(page_content=page["text"], metadata={"source": url, "title": page["title"]})
+                chunks = await loop.run_in_executor(None, split_documents, [page_doc])
+                chunk_ids = _page_chunk_ids(url, len(chunks))
+                stale_ids = [cid for cid in old_chunk_ids if cid not in chunk_ids]
+                if chunks:
+                    await loop.run_in_executor(
+                        None, lambda: vector_store.add_documents(chunks, ids=chunk_ids)
+                    )
+            else:
+                stale_ids = old_chunk_ids
+            
+            if stale_ids:
+                await loop.run_in_executor(None, lambda: vector_store.delete(ids=stale_ids))
+            
+            if page["status"] in ("gone", "empty"):
+                stats["removed"] += 1
+                await knowledge_base_collection.delete_one({"user_id": user_id, "source": "web", "url": url})
+                continue
+            
+            stats["changed"] += 1
+            stats["chunks_added"] += len(chunk_ids)
+            await knowledge_base_collection.update_one(
+                {"user_id": user_id, "source": "web", "url": url},
+                {"$set": {
+                    "root_url": start_url,
+                    "title": page["title"],
+                    "etag": page["etag"],
+                    "last_modified": page["last_modified"],
+                    "content_hash": page["content_hash"],
+                    "rendered": page["rendered"],
+                    "chunk_ids": chunk_ids,
+                    "crawled_at": datetime.now(timezone.utc)
+                }},
+                upsert=True
+            )
+            logger.info(f"Embedded {len(chunk_ids)} chunks from {url}")
+        
+        doc_count = await loop.run_in_executor(None, lambda: vector_store._collection.count())
+        
+        await users_collection.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$set": {
+                "vector_store_path": vector_store_path,
+                "knowledge_base_source_url": start_url,
+                "knowledge_base_updated": datetime.now(timezone.utc),
+                "documents_count": doc_count
+            }}
+        )
+        
+        return {
+            "success": True,
+            "documents_count": doc_count,
+            "pages": stats,
+            "message": "Website crawled into knowledge base successfully"
+        }
+        
+    except Exception as e:
+        logger.error(f"Error crawling knowledge base from {start_url}: {e}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
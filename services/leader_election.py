@@ -0,0 +1,50 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from services.database import get_leader_leases_collection
+
+logger = logging.getLogger(__name__)
+
+class LeaderLease:
+    """Mongo-backed lease so exactly one node runs a singleton loop.
+
+    Whoever holds the `name` document with an unexpired lease is leader; the
+    holder renews it every tick, and anyone may take it over once it lapses.
+    """
+
+    def __init__(self, name: str, owner: str, ttl_seconds: int):
+        self.name = name
+        self.owner = owner
+        self.ttl_seconds = ttl_seconds
+        self.is_leader = False
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease; returns whether this node is leader now"""
+        leases_collection = await get_leader_leases_collection()
+        now = datetime.now(timezone.utc)
+        try:
+            lease = await leases_collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl_seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            leader = lease is not None and lease.get("owner") == self.owner
+        except DuplicateKeyError:
+            # Someone else holds an unexpired lease, so the upsert collided with it
+            leader = False
+
+        if leader != self.is_leader:
+            logger.info(f"{self.owner} {'became' if leader else 'is no longer'} leader for {self.name}")
+        self.is_leader = leader
+        return leader
+
+    async def release(self):
+        if not self.is_leader:
+            return
+        leases_collection = await get_leader_leases_collection()
+        await leases_collection.delete_one({"_id": self.name, "owner": self.owner})
+        self.is_leader = False
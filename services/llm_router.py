@@ -0,0 +1,44 @@
+import logging
+from typing import List, Optional
+from config import (
+    CHATBOT_FAST_MODEL, CHATBOT_SLOW_MODEL,
+    CHATBOT_FAST_MAX_QUERY_WORDS, CHATBOT_FAST_MIN_RETRIEVAL_SCORE
+)
+
+logger = logging.getLogger(__name__)
+
+def retrieval_scores(documents) -> List[float]:
+    """Read the query similarity scores the EmbeddingsFilter attaches to retrieved documents"""
+    scores = []
+    for doc in documents:
+        score = getattr(doc, "state", {}).get("query_similarity_score")
+        if score is not None:
+            scores.append(float(score))
+    return scores
+
+def route_reply_model(
+    question: str,
+    scores: List[float],
+    max_query_words: int = CHATBOT_FAST_MAX_QUERY_WORDS,
+    min_retrieval_score: float = CHATBOT_FAST_MIN_RETRIEVAL_SCORE
+) -> dict:
+    """Pick the fast model for short questions with a confident retrieval hit, else the large one"""
+    query_words = len(question.split())
+    top_score: Optional[float] = max(scores) if scores else None
+
+    if top_score is None:
+        tier, reason = "slow", "no_retrieval_hits"
+    elif query_words > max_query_words:
+        tier, reason = "slow", "long_query"
+    elif top_score < min_retrieval_score:
+        tier, reason = "slow", "low_retrieval_confidence"
+    else:
+        tier, reason = "fast", "short_query_high_confidence"
+
+    return {
+        "model": CHATBOT_FAST_MODEL if tier == "fast" else CHATBOT_SLOW_MODEL,
+        "tier": tier,
+        "reason": reason,
+        "query_words": query_words,
+        "top_score": round(top_score, 4) if top_score is not None else None
+    }
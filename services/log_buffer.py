@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class BufferedLogWriter:
+    """Collects log documents in memory and writes them with insert_many.
+
+    Documents are flushed when `batch_size` accumulate or every
+    `flush_interval` seconds, whichever comes first. Logging is best-effort,
+    like the per-message inserts it replaces: a failed write is logged and
+    dropped rather than raised into the send path.
+    """
+
+    def __init__(self, get_collection: Callable[[], Awaitable], batch_size: int = 500, flush_interval: float = 1.0):
+        self.get_collection = get_collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[dict] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._pending = set()
+
+    def add(self, document: dict):
+        self._buffer.append(document)
+        if len(self._buffer) >= self.batch_size:
+            job = asyncio.create_task(self.flush())
+            self._pending.add(job)
+            job.add_done_callback(self._pending.discard)
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        documents, self._buffer = self._buffer, []
+        try:
+            collection = await self.get_collection()
+            await collection.insert_many(documents, ordered=False)
+        except Exception as e:
+            logger.error(f"Failed to write {len(documents)} buffered log entries: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        await self.flush()
@@ -0,0 +1,145 @@
+"""Cached health of a tenant's Meta (WhatsApp Cloud API) credentials.
+
+Each user document carries the last check of its token per phone number id
+under "meta_credentials". Campaign starts read that record from the user they
+already loaded instead of probing the Graph API. A check older than
+META_CREDENTIAL_CHECK_TTL_SECONDS is refreshed in the background, and sends
+that come back with an auth error mark the credentials invalid straight away.
+Each successful check also copies the number's messaging tier and quality
+rating onto its device, where services.device_balancer weighs them.
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from config import META_CREDENTIAL_CHECK_TTL_SECONDS
+from services.database import get_users_collection, get_devices_collection
+from services.singleflight import SingleFlight
+from services.whatsapp_service import whatsapp_client
+
+logger = logging.getLogger(__name__)
+
+CREDENTIALS_VALID = "valid"
+CREDENTIALS_INVALID = "invalid"
+CREDENTIALS_UNREACHABLE = "unreachable"
+
+credential_checks = SingleFlight("meta_credential_check")
+_refreshes = set()
+# (user id, phone number id) -> fingerprint of the token last marked invalid in this process
+_marked_invalid = {}
+
+def token_fingerprint(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode()).hexdigest()[:16]
+
+def _health_field(phone_number_id: str) -> str:
+    return f"meta_credentials.{phone_number_id}"
+
+def cached_health(user: dict, phone_number_id: str) -> Optional[dict]:
+    """The last check for the user's current token, or None if it was never checked"""
+    health = (user.get("meta_credentials") or {}).get(str(phone_number_id))
+    if not health or health.get("token") != token_fingerprint(user.get("meta_api_key") or ""):
+        return None
+    return health
+
+async def record_health(user_id, phone_number_id: str, access_token: str, status: str, status_code: Optional[int] = None, detail: str = ""):
+    if status != CREDENTIALS_INVALID:
+        _marked_invalid.pop((str(user_id), str(phone_number_id)), None)
+    users_collection = await get_users_collection()
+    await users_collection.update_one(
+        {"_id": user_id},
+        {"$set": {_health_field(phone_number_id): {
+            "status": status,
+            "status_code": status_code,
+            "detail": detail,
+            "token": token_fingerprint(access_token),
+            "checked_at": datetime.now(timezone.utc)
+        }}}
+    )
+
+# Graph phone number fields device_balancer weighs devices by
+PHONE_NUMBER_FIELDS = "messaging_limit_tier,quality_rating"
+
+async def record_phone_number_metadata(user_id, phone_number_id: str, data: dict):
+    """Copy the number's tier and quality rating onto the device sending from it"""
+    update = {
+        f"metadata.{field}": data[field]
+        for field in PHONE_NUMBER_FIELDS.split(",") if data.get(field)
+    }
+    if not update or not ObjectId.is_valid(str(phone_number_id)):
+        return
+    devices_collection = await get_devices_collection()
+    await devices_collection.update_one({"_id": ObjectId(str(phone_number_id)), "user_id": user_id}, {"$set": update})
+
+async def check_credentials(user_id, phone_number_id: str, access_token: str) -> str:
+    """Probe the Graph API for the phone number and record the result"""
+    result = await whatsapp_client.request(
+        "GET", f"/{phone_number_id}", access_token, params={"fields": PHONE_NUMBER_FIELDS}
+    )
+    if result:
+        status = CREDENTIALS_VALID
+        await record_phone_number_metadata(user_id, phone_number_id, result.data or {})
+    elif result.status_code in (401, 403):
+        status = CREDENTIALS_INVALID
+    else:
+        # Network trouble or a Meta outage says nothing about the token
+        status = CREDENTIALS_UNREACHABLE
+    await record_health(user_id, phone_number_id, access_token, status, result.status_code, result.error_message)
+    return status
+
+def refresh_in_background(user_id, phone_number_id: str, access_token: str):
+    async def refresh():
+        try:
+            await credential_checks.do(
+                (str(user_id), phone_number_id),
+                lambda: check_credentials(user_id, phone_number_id, access_token)
+            )
+        except Exception as e:
+            logger.warning(f"Meta credential check for {phone_number_id} failed: {e}")
+
+    # Keep a reference so the task isn't garbage collected mid-flight
+    task = asyncio.create_task(refresh())
+    _refreshes.add(task)
+    task.add_done_callback(_refreshes.discard)
+
+async def mark_credentials_invalid(user_id, phone_number_id: str, access_token: str, status_code: Optional[int] = None, detail: str = ""):
+    """Called when a send is rejected for auth, so the next campaign start fails fast"""
+    key = (str(user_id), str(phone_number_id))
+    fingerprint = token_fingerprint(access_token)
+    # The rest of a campaign fails the same way; record it once
+    if _marked_invalid.get(key) == fingerprint:
+        return
+    _marked_invalid[key] = fingerprint
+    logger.warning(f"Meta credentials for {phone_number_id} rejected during send: {status_code} {detail}")
+    await record_health(user_id, phone_number_id, access_token, CREDENTIALS_INVALID, status_code, detail)
+
+def current_health(user: dict, phone_number_id: str) -> Optional[dict]:
+    """cached_health, scheduling a background check when it is missing or stale"""
+    health = cached_health(user, phone_number_id)
+    if health is None or _is_stale(health):
+        refresh_in_background(user["_id"], phone_number_id, user["meta_api_key"])
+    return health
+
+def require_valid_credentials(user: dict):
+    """Reject a campaign start whose Meta token is known to be bad; never waits on Meta.
+
+    An unchecked or stale record lets the campaign through and schedules a check;
+    a token that turns out to be bad is then caught by the first sends.
+    """
+    health = current_health(user, user["phone_number_id"])
+    if health is None or health["status"] != CREDENTIALS_INVALID:
+        return
+
+    if health.get("status_code") == 403:
+        detail = "Access denied to Meta API. Please check your permissions and reconnect your account."
+    else:
+        detail = "Meta API token is invalid or expired. Please reconnect your WhatsApp Business account."
+    raise HTTPException(status_code=400, detail=detail)
+
+def _is_stale(health: dict) -> bool:
+    checked_at = health["checked_at"].replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - checked_at).total_seconds() > META_CREDENTIAL_CHECK_TTL_SECONDS
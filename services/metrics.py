@@ -0,0 +1,70 @@
+"""Send-path and provider health metrics in the Prometheus text exposition format, served at /metrics.
+
+Values are this process's view; scrape every worker and sum or compare there.
+Sender labels keep the key's kind but replace the tenant's number or id with a
+short hash, so scraped series never carry phone numbers or account ids.
+"""
+import hashlib
+from typing import Iterable, List, Tuple
+
+from services.adaptive_throttle import controller_stats
+from services.circuit_breaker import breaker_stats, sender_breaker_stats, CLOSED, HALF_OPEN, OPEN
+from services.priority_lanes import whatsapp_lanes, sms_lanes
+
+CIRCUIT_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _sender_label(key: str) -> str:
+    """"whatsapp:<phone_number_id>" -> "whatsapp:<hash>"; hash a known id the same way to find its series"""
+    kind, _, identifier = key.partition(":")
+    if not identifier:
+        return key
+    return f"{kind}:{hashlib.sha256(identifier.encode()).hexdigest()[:12]}"
+
+def _metric(lines: List[str], name: str, kind: str, help_text: str, samples: Iterable[Tuple[dict, float]]):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{_label_value(val)}"' for key, val in labels.items())
+        lines.append(f"{name}{{{label_text}}} {float(value)}")
+
+def render_metrics() -> str:
+    lines: List[str] = []
+
+    senders = controller_stats()
+    _metric(lines, "sender_send_rate", "gauge", "Current adaptive send rate (messages/s)",
+            (({"sender": _sender_label(key)}, stats["rate"]) for key, stats in senders.items()))
+    _metric(lines, "sender_configured_rate", "gauge", "Configured send rate (messages/s)",
+            (({"sender": _sender_label(key)}, stats["configured_rate"]) for key, stats in senders.items()))
+    _metric(lines, "sender_latency_seconds", "gauge", "Smoothed provider response time",
+            (({"sender": _sender_label(key)}, stats["latency_ms"] / 1000) for key, stats in senders.items()
+             if stats["latency_ms"] is not None))
+    _metric(lines, "sender_throttled_total", "counter", "Sends the provider rejected as rate limited",
+            (({"sender": _sender_label(key)}, stats["throttled"]) for key, stats in senders.items()))
+
+    lanes = [
+        ({"provider": scheduler.name, "lane": lane}, lane_stats)
+        for scheduler in (whatsapp_lanes, sms_lanes)
+        for lane, lane_stats in scheduler.stats()["lanes"].items()
+    ]
+    _metric(lines, "lane_slots_in_use", "gauge", "Concurrent send slots held by a priority lane",
+            ((labels, stats["in_use"]) for labels, stats in lanes))
+    _metric(lines, "lane_waiting", "gauge", "Sends queued for a slot in a priority lane",
+            ((labels, stats["waiting"]) for labels, stats in lanes))
+    _metric(lines, "lane_wait_p95_seconds", "gauge", "95th percentile of recent slot waits",
+            ((labels, stats["wait_p95_ms"] / 1000) for labels, stats in lanes))
+
+    circuits = breaker_stats()
+    senders = sender_breaker_stats()
+    _metric(lines, "circuit_state", "gauge", "Provider circuit breaker state (0 closed, 1 half-open, 2 open)",
+            (({"provider": name}, CIRCUIT_STATE_VALUES[stats["state"]]) for name, stats in circuits.items()))
+    _metric(lines, "sender_circuit_state", "gauge", "Circuit breaker state of one tenant's sender (0 closed, 1 half-open, 2 open)",
+            (({"sender": _sender_label(name)}, CIRCUIT_STATE_VALUES[stats["state"]]) for name, stats in senders.items()))
+    _metric(lines, "circuit_opened_total", "counter", "Times the provider's circuit opened",
+            (({"provider": name}, stats["opened"]) for name, stats in circuits.items()))
+    _metric(lines, "circuit_rejected_total", "counter", "Calls refused while the provider's circuit was open",
+            (({"provider": name}, stats["rejected"]) for name, stats in circuits.items()))
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,86 @@
+"""Per-recipient message personalization.
+
+Templates use {name}, {var1}, {var2} and {var3}, optionally with a fallback
+for contacts that have no value: "Hi {name|there}". A template is parsed once
+into literal and field parts; rendering a recipient is then a join over those
+parts, with no regex work per contact.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+PERSONALIZATION_FIELDS = ("name", "var1", "var2", "var3")
+
+# {field} or {field|default}; CSS/JSON braces ("{ color: red }") never match
+_PLACEHOLDER = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)(?:\|([^{}\n]*))?\}")
+
+@dataclass(frozen=True)
+class Placeholder:
+    token: str
+    field: str
+    default: str = ""
+
+class CompiledTemplate:
+    """A parsed template; render() fills it in for one recipient"""
+
+    def __init__(self, text: str, parts: Tuple, placeholders: Tuple[Placeholder, ...]):
+        self.text = text
+        self._parts = parts
+        self.placeholders = placeholders
+
+    @property
+    def is_static(self) -> bool:
+        return not self.placeholders
+
+    def values(self, recipient: dict) -> Dict[str, str]:
+        """Placeholder token -> the recipient's value, or the placeholder's default"""
+        return {p.token: str(recipient.get(p.field) or p.default) for p in self.placeholders}
+
+    def render(self, recipient: dict, escape: Optional[Callable[[str], str]] = None) -> str:
+        if not self.placeholders:
+            return self.text
+        rendered = []
+        for literal, placeholder in self._parts:
+            rendered.append(literal)
+            if placeholder is not None:
+                value = str(recipient.get(placeholder.field) or placeholder.default)
+                rendered.append(escape(value) if escape else value)
+        return "".join(rendered)
+
+    def render_many(self, recipients: List[dict], escape: Optional[Callable[[str], str]] = None) -> List[str]:
+        if not self.placeholders:
+            return [self.text] * len(recipients)
+        render = self.render
+        return [render(recipient, escape) for recipient in recipients]
+
+@lru_cache(maxsize=512)
+def compile_template(text: str) -> CompiledTemplate:
+    """Parse a template once; raises ValueError for unknown placeholders"""
+    text = text or ""
+    parts = []
+    placeholders = []
+    position = 0
+    for match in _PLACEHOLDER.finditer(text):
+        field = match.group(1)
+        if field not in PERSONALIZATION_FIELDS:
+            raise ValueError(
+                f"Unknown placeholder '{match.group(0)}'; use one of "
+                + ", ".join(f"{{{f}}}" for f in PERSONALIZATION_FIELDS)
+            )
+        placeholder = Placeholder(token=match.group(0), field=field, default=(match.group(2) or "").strip())
+        parts.append((text[position:match.start()], placeholder))
+        if placeholder not in placeholders:
+            placeholders.append(placeholder)
+        position = match.end()
+    parts.append((text[position:], None))
+    return CompiledTemplate(text, tuple(parts), tuple(placeholders))
+
+def validate_template(*texts: Optional[str]):
+    """Compile each non-empty text so bad placeholders surface before anything is queued"""
+    for text in texts:
+        if text:
+            compile_template(text)
+
+def render_message(text: Optional[str], recipient: dict) -> str:
+    return compile_template(text).render(recipient) if text else ""
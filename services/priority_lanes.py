@@ -0,0 +1,135 @@
+"""Priority lanes for outbound sends.
+
+Traffic is split into three classes that share each provider's capacity:
+
+    realtime  OTP email, chatbot and auto replies - a person is waiting
+    standard  single sends made through the API
+    bulk      campaign sends
+
+A LaneScheduler hands out a provider's concurrent slots. Every lane has some
+slots reserved that no other lane may take, so a campaign filling all spare
+capacity can never make an OTP wait for a slot. Spare slots go to waiting
+lanes by weight (smooth weighted round robin), which favours realtime and
+standard traffic without starving bulk.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+from config import (
+    LANE_WEIGHTS, LANE_REALTIME_SLO_MS,
+    WHATSAPP_LANE_CAPACITY, WHATSAPP_LANE_RESERVED,
+    SMS_LANE_CAPACITY, SMS_LANE_RESERVED
+)
+
+logger = logging.getLogger(__name__)
+
+REALTIME = "realtime"
+STANDARD = "standard"
+BULK = "bulk"
+LANES = (REALTIME, STANDARD, BULK)
+
+# Recent slot waits kept per lane for stats()
+WAIT_SAMPLE_SIZE = 1000
+
+class LaneScheduler:
+    """`capacity` concurrent slots shared by the priority lanes"""
+
+    def __init__(self, name: str, capacity: int, reserved: Dict[str, int], weights: Dict[str, int] = LANE_WEIGHTS):
+        if sum(reserved.values()) > capacity:
+            raise ValueError(f"{name}: reserved slots exceed capacity {capacity}")
+        self.name = name
+        self.capacity = capacity
+        self.reserved = {lane: reserved.get(lane, 0) for lane in LANES}
+        self.weights = {lane: weights.get(lane, 1) for lane in LANES}
+        self._in_use = {lane: 0 for lane in LANES}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in LANES}
+        self._current = {lane: 0 for lane in LANES}
+        self._waits: Dict[str, Deque[float]] = {lane: deque(maxlen=WAIT_SAMPLE_SIZE) for lane in LANES}
+
+    def _can_take(self, lane: str) -> bool:
+        free = self.capacity - sum(self._in_use.values())
+        # Slots other lanes have reserved but aren't using stay free for them
+        held = sum(
+            max(0, self.reserved[other] - self._in_use[other]) for other in LANES if other != lane
+        )
+        return free - held > 0
+
+    def _next_lane(self):
+        eligible = [lane for lane in LANES if self._waiters[lane] and self._can_take(lane)]
+        if not eligible:
+            return None
+        total = 0
+        for lane in eligible:
+            self._current[lane] += self.weights[lane]
+            total += self.weights[lane]
+        lane = max(eligible, key=lambda l: self._current[l])
+        self._current[lane] -= total
+        return lane
+
+    def _dispatch(self):
+        while True:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            waiter = self._waiters[lane].popleft()
+            if not waiter.done():
+                self._in_use[lane] += 1
+                waiter.set_result(None)
+
+    def _release(self, lane: str):
+        self._in_use[lane] -= 1
+        self._dispatch()
+
+    async def acquire(self, lane: str):
+        started = time.monotonic()
+        if not any(self._waiters.values()) and self._can_take(lane):
+            self._in_use[lane] += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[lane].append(waiter)
+            # A reserved slot may be free even while other lanes queue for shared ones
+            self._dispatch()
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Granted just as the caller gave up; hand the slot on
+                    self._release(lane)
+                else:
+                    try:
+                        self._waiters[lane].remove(waiter)
+                    except ValueError:
+                        pass
+                raise
+
+        waited_ms = (time.monotonic() - started) * 1000
+        self._waits[lane].append(waited_ms)
+        if lane == REALTIME and waited_ms > LANE_REALTIME_SLO_MS:
+            logger.warning(f"{self.name}: realtime send waited {waited_ms:.0f}ms for a slot")
+
+    @asynccontextmanager
+    async def slot(self, lane: str = STANDARD):
+        await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def stats(self) -> dict:
+        lanes = {}
+        for lane in LANES:
+            waits = sorted(self._waits[lane])
+            lanes[lane] = {
+                "in_use": self._in_use[lane],
+                "reserved": self.reserved[lane],
+                "waiting": len(self._waiters[lane]),
+                "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 1) if waits else 0.0
+            }
+        return {"capacity": self.capacity, "lanes": lanes}
+
+whatsapp_lanes = LaneScheduler("whatsapp", WHATSAPP_LANE_CAPACITY, WHATSAPP_LANE_RESERVED)
+sms_lanes = LaneScheduler("sms", SMS_LANE_CAPACITY, SMS_LANE_RESERVED)
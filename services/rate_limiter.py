@@ -0,0 +1,208 @@
+"""Provider rate governor.
+
+Sends are paced by token buckets keyed by provider and sender account
+("whatsapp:<phone_number_id>", "sms_number:<sender>", ...). With
+RATE_GOVERNOR_BACKEND=mongo (the default) a bucket lives in MongoDB and is
+shared by every worker process and node, so the aggregate rate stays at the
+provider limit however many workers run. Each process leases tokens in
+batches of about RATE_GOVERNOR_LEASE_SECONDS worth, so a busy bucket costs one
+atomic update per batch rather than one per send. RATE_GOVERNOR_BACKEND=local
+keeps the buckets in process, for tests and single-process development.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from config import RATE_GOVERNOR_BACKEND, RATE_GOVERNOR_LEASE_SECONDS
+from services.database import get_rate_buckets_collection, get_rate_quotas_collection
+
+# Shortest sleep while waiting for a shared bucket to refill
+MIN_REFILL_WAIT_SECONDS = 0.01
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursting up to `capacity`.
+
+    Waiters are served in arrival order; each acquire sleeps only as long as
+    the bucket needs to refill. This is the in-process (local) backend.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        # Never below one token, or slow buckets could never serve a single acquire
+        self.capacity = max(1.0, float(capacity or rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float, capacity: Optional[float] = None):
+        self._refill()
+        self.rate = float(rate)
+        # Never below one token, or slow buckets could never serve a single acquire
+        self.capacity = max(1.0, float(capacity or rate))
+        self._tokens = min(self._tokens, self.capacity)
+
+    async def acquire(self, tokens: float = 1):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+class MongoTokenBucket:
+    """Token bucket stored in MongoDB and shared across processes.
+
+    The refill and the take happen in one pipeline update using the server's
+    clock ($$NOW), so nodes with skewed clocks still agree on the rate. Tokens
+    leased by this process but not used within a few lease periods are dropped
+    rather than spent late as a burst.
+    """
+
+    def __init__(self, key: str, rate: float, capacity: Optional[float] = None):
+        self.key = key
+        self._local = 0.0
+        self._leased_at = 0.0
+        self._lock = asyncio.Lock()
+        self.set_rate(rate, capacity)
+
+    def set_rate(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity or rate))
+        self.lease_size = max(1, round(self.rate * RATE_GOVERNOR_LEASE_SECONDS))
+        self._local = min(self._local, self.lease_size)
+
+    async def _lease(self, wanted: float) -> Tuple[float, float]:
+        """Take up to `wanted` whole tokens; returns (granted, tokens left in the bucket)"""
+        buckets_collection = await get_rate_buckets_collection()
+        elapsed_seconds = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+        doc = await buckets_collection.find_one_and_update(
+            {"_id": self.key},
+            [
+                {"$set": {
+                    "tokens": {"$min": [self.capacity, {"$add": [
+                        {"$ifNull": ["$tokens", self.capacity]},
+                        {"$multiply": [elapsed_seconds, self.rate]}
+                    ]}]},
+                    "rate": self.rate,
+                    "capacity": self.capacity,
+                    "updated_at": "$$NOW"
+                }},
+                {"$set": {"granted": {"$min": [wanted, {"$floor": "$tokens"}]}}},
+                {"$set": {"tokens": {"$subtract": ["$tokens", "$granted"]}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["granted"], doc["tokens"]
+
+    async def acquire(self, tokens: float = 1):
+        async with self._lock:
+            if time.monotonic() - self._leased_at > RATE_GOVERNOR_LEASE_SECONDS * 4:
+                self._local = 0.0
+            while self._local < tokens:
+                granted, remaining = await self._lease(max(self.lease_size, tokens - self._local))
+                if granted:
+                    self._local += granted
+                    self._leased_at = time.monotonic()
+                    continue
+                # Saturated: come back when a whole lease has refilled rather than polling per token
+                needed = max(tokens - self._local, min(self.lease_size, self.capacity)) - remaining
+                await asyncio.sleep(max(MIN_REFILL_WAIT_SECONDS, needed / self.rate))
+            self._local -= tokens
+
+# key -> bucket, shared by every send from the same provider account in this process
+_buckets = {}
+
+def get_token_bucket(key: str, rate: float, capacity: Optional[float] = None):
+    bucket = _buckets.get(key)
+    if bucket is None:
+        if RATE_GOVERNOR_BACKEND == "mongo":
+            bucket = MongoTokenBucket(key, rate, capacity)
+        else:
+            bucket = TokenBucket(rate, capacity)
+        _buckets[key] = bucket
+    elif bucket.rate != rate:
+        bucket.set_rate(rate, capacity)
+    return bucket
+
+@dataclass
+class QuotaGrant:
+    """Quota taken by consume_quota; refunds go back to the window it was taken from"""
+    key: str
+    window_start: int
+    amount: int
+    remaining: int
+
+# key -> {window start: used} for the local quota backend
+_quotas: Dict[str, Dict[int, int]] = {}
+
+def _sliding_usage(previous: int, current: int, window_start: int, window_seconds: int) -> float:
+    """Usage over the last window_seconds, counting the previous window by how much of it still overlaps"""
+    elapsed = time.time() - window_start
+    return previous * max(0.0, 1 - elapsed / window_seconds) + current
+
+async def consume_quota(key: str, amount: int, limit: int, window_seconds: int) -> Optional[QuotaGrant]:
+    """Take `amount` from a sliding-window quota; None if it would go over.
+
+    Counts are kept per fixed window, and the previous window is weighted by
+    how much of it still falls within the last `window_seconds`. That way a
+    burst just before a window boundary still counts just after it.
+    """
+    window_start = int(time.time() // window_seconds * window_seconds)
+    previous_start = window_start - window_seconds
+    if RATE_GOVERNOR_BACKEND != "mongo":
+        windows = _quotas.setdefault(key, {})
+        for start in [start for start in windows if start < previous_start]:
+            del windows[start]
+        used = _sliding_usage(windows.get(previous_start, 0), windows.get(window_start, 0), window_start, window_seconds)
+        if used + amount > limit:
+            return None
+        windows[window_start] = windows.get(window_start, 0) + amount
+        return QuotaGrant(key, window_start, amount, int(limit - used - amount))
+
+    quotas_collection = await get_rate_quotas_collection()
+    window_end = datetime.fromtimestamp(window_start + window_seconds, timezone.utc)
+    doc = await quotas_collection.find_one_and_update(
+        {"_id": f"{key}:{window_start}"},
+        # Kept a window past its end, while it still counts as the previous window
+        {"$inc": {"used": amount}, "$setOnInsert": {"expires_at": window_end + timedelta(seconds=window_seconds)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    previous = await quotas_collection.find_one({"_id": f"{key}:{previous_start}"})
+    used = _sliding_usage(previous["used"] if previous else 0, doc["used"], window_start, window_seconds)
+    if used > limit:
+        # Over the limit: give the amount back so concurrent callers aren't shut out by this one
+        await quotas_collection.update_one({"_id": doc["_id"]}, {"$inc": {"used": -amount}})
+        return None
+    return QuotaGrant(key, window_start, amount, int(limit - used))
+
+async def refund_quota(grant: QuotaGrant, amount: int):
+    """Return unused quota (e.g. for sends that failed) to the window it was taken from"""
+    amount = min(amount, grant.amount)
+    if amount <= 0:
+        return
+    if RATE_GOVERNOR_BACKEND != "mongo":
+        windows = _quotas.get(grant.key, {})
+        if grant.window_start in windows:
+            windows[grant.window_start] = max(0, windows[grant.window_start] - amount)
+        return
+    quotas_collection = await get_rate_quotas_collection()
+    await quotas_collection.update_one({"_id": f"{grant.key}:{grant.window_start}"}, {"$inc": {"used": -amount}})
+
+async def create_rate_governor_indexes():
+    buckets_collection = await get_rate_buckets_collection()
+    # Buckets of senders idle for a day are dropped; they restart full
+    await buckets_collection.create_index("updated_at", expireAfterSeconds=24 * 3600)
+    quotas_collection = await get_rate_quotas_collection()
+    await quotas_collection.create_index("expires_at", expireAfterSeconds=0)
@@ -0,0 +1,170 @@
+"""Classify provider send failures into structured, retry-aware error codes.
+
+Every classifier returns the same shape:
+
+    {"error_code": str, "provider_code": int | None, "retryable": bool,
+     "retry_after": float | None, "error_message": str}
+
+Calls refused by an open circuit breaker also carry "deferred": True.
+"""
+import asyncio
+from typing import Optional
+
+import aiohttp
+import httpx
+
+from services.circuit_breaker import CircuitOpenError
+
+RATE_LIMITED = "rate_limited"
+PROVIDER_UNAVAILABLE = "provider_unavailable"
+TIMEOUT = "timeout"
+INVALID_NUMBER = "invalid_number"
+NOT_ON_WHATSAPP = "not_on_whatsapp"
+OPTED_OUT = "opted_out"
+OUTSIDE_SESSION_WINDOW = "outside_session_window"
+AUTH_FAILED = "auth_failed"
+INVALID_REQUEST = "invalid_request"
+NOT_CONFIGURED = "not_configured"
+UNKNOWN = "unknown"
+
+# 429, 5xx and transport failures; anything unclassified fails without retrying
+RETRYABLE_CODES = {RATE_LIMITED, PROVIDER_UNAVAILABLE, TIMEOUT}
+
+class SendConfigurationError(Exception):
+    """The account isn't set up to send (no provider client, unverified sender); no retry can succeed"""
+
+# Meta Cloud API error.code -> error code
+META_ERROR_CODES = {
+    4: RATE_LIMITED,
+    80007: RATE_LIMITED,
+    130429: RATE_LIMITED,
+    131048: RATE_LIMITED,
+    131056: RATE_LIMITED,
+    1: PROVIDER_UNAVAILABLE,
+    2: PROVIDER_UNAVAILABLE,
+    131000: PROVIDER_UNAVAILABLE,
+    131016: PROVIDER_UNAVAILABLE,
+    131052: PROVIDER_UNAVAILABLE,
+    131053: PROVIDER_UNAVAILABLE,
+    131026: NOT_ON_WHATSAPP,
+    131030: INVALID_NUMBER,
+    131021: INVALID_NUMBER,
+    131050: OPTED_OUT,
+    131047: OUTSIDE_SESSION_WINDOW,
+    190: AUTH_FAILED,
+    10: AUTH_FAILED,
+    200: AUTH_FAILED,
+    100: INVALID_REQUEST,
+    131008: INVALID_REQUEST,
+    131009: INVALID_REQUEST,
+    132000: INVALID_REQUEST,
+    132001: INVALID_REQUEST,
+}
+
+# Meta codes for media Meta could not download or no longer has (e.g. an expired media id)
+MEDIA_ERROR_CODES = {131052, 131053}
+
+# Twilio error code -> error code
+TWILIO_ERROR_CODES = {
+    20429: RATE_LIMITED,
+    14107: RATE_LIMITED,
+    20500: PROVIDER_UNAVAILABLE,
+    20503: PROVIDER_UNAVAILABLE,
+    21211: INVALID_NUMBER,
+    21614: INVALID_NUMBER,
+    21217: INVALID_NUMBER,
+    21612: INVALID_NUMBER,
+    21408: INVALID_REQUEST,
+    21610: OPTED_OUT,
+    20003: AUTH_FAILED,
+    20404: INVALID_REQUEST,
+    21602: INVALID_REQUEST,
+}
+
+def _error(error_code: str, message: str, provider_code=None, retry_after: Optional[float] = None) -> dict:
+    return {
+        "error_code": error_code,
+        "provider_code": provider_code,
+        "retryable": error_code in RETRYABLE_CODES,
+        "retry_after": retry_after,
+        "error_message": message
+    }
+
+def _from_http_status(status_code: Optional[int]) -> str:
+    if status_code is None:
+        return TIMEOUT
+    if status_code == 429:
+        return RATE_LIMITED
+    if status_code >= 500:
+        return PROVIDER_UNAVAILABLE
+    if status_code in (401, 403):
+        return AUTH_FAILED
+    if 400 <= status_code < 500:
+        return INVALID_REQUEST
+    return UNKNOWN
+
+def _transport_error_code(error: Exception) -> Optional[str]:
+    """TIMEOUT or PROVIDER_UNAVAILABLE for errors raised before any response arrived, else None"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException, aiohttp.ServerTimeoutError)):
+        return TIMEOUT
+    if isinstance(error, (ConnectionError, httpx.TransportError, aiohttp.ClientConnectionError)):
+        return PROVIDER_UNAVAILABLE
+    return None
+
+def _retry_after(headers) -> Optional[float]:
+    value = (headers or {}).get("Retry-After") or (headers or {}).get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def classify_whatsapp_result(result) -> dict:
+    """Classify a failed WhatsAppSendResult"""
+    if result.circuit_error:
+        return classify_circuit_open(result.circuit_error)
+    error_code = META_ERROR_CODES.get(result.error_code) or _from_http_status(result.status_code)
+    return _error(error_code, result.error_message, result.error_code, _retry_after(result.headers))
+
+def classify_twilio_error(error: Exception) -> dict:
+    """Classify an exception raised by the Twilio client"""
+    if isinstance(error, CircuitOpenError):
+        return classify_circuit_open(error)
+    if isinstance(error, SendConfigurationError):
+        return _error(NOT_CONFIGURED, str(error))
+    provider_code = getattr(error, "code", None)
+    status_code = getattr(error, "status", None)
+    if provider_code in TWILIO_ERROR_CODES:
+        error_code = TWILIO_ERROR_CODES[provider_code]
+    elif status_code is not None:
+        error_code = _from_http_status(status_code)
+    else:
+        # Connection errors and timeouts carry no HTTP status
+        error_code = _transport_error_code(error) or UNKNOWN
+    return _error(error_code, getattr(error, "msg", None) or str(error), provider_code)
+
+def classify_sendgrid_error(error: Exception) -> dict:
+    """Classify an exception raised by the SendGrid client"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        error_code = _from_http_status(status_code)
+    else:
+        error_code = _transport_error_code(error) or UNKNOWN
+    return _error(error_code, str(error), status_code, _retry_after(getattr(error, "headers", None)))
+
+def classify_sendgrid_response(status_code: Optional[int], headers=None, message: str = "") -> dict:
+    """Classify a failed SendGrid v3 API response; no status means the request never completed"""
+    return _error(_from_http_status(status_code), message, status_code, _retry_after(headers))
+
+def classify_circuit_open(error: CircuitOpenError) -> dict:
+    """A call refused by an open circuit breaker; retry once it may close.
+
+    The send never reached the provider, so it is marked deferred and
+    doesn't use up one of the task's attempts.
+    """
+    return dict(_error(PROVIDER_UNAVAILABLE, str(error), retry_after=error.retry_after), deferred=True)
+
+def classify_exception(error: Exception) -> dict:
+    """Fallback for errors raised outside a provider client"""
+    if isinstance(error, SendConfigurationError):
+        return _error(NOT_CONFIGURED, str(error))
+    return _error(_transport_error_code(error) or UNKNOWN, str(error))
@@ -0,0 +1,167 @@
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Calling code -> timezone used for delivery windows when a contact has no timezone.
+# Longest prefix wins; countries spanning several zones get their most populous one.
+CALLING_CODE_TIMEZONES = {
+    "1": "America/New_York",
+    "7": "Europe/Moscow",
+    "20": "Africa/Cairo",
+    "27": "Africa/Johannesburg",
+    "33": "Europe/Paris",
+    "34": "Europe/Madrid",
+    "39": "Europe/Rome",
+    "44": "Europe/London",
+    "49": "Europe/Berlin",
+    "52": "America/Mexico_City",
+    "55": "America/Sao_Paulo",
+    "60": "Asia/Kuala_Lumpur",
+    "61": "Australia/Sydney",
+    "62": "Asia/Jakarta",
+    "63": "Asia/Manila",
+    "65": "Asia/Singapore",
+    "66": "Asia/Bangkok",
+    "81": "Asia/Tokyo",
+    "82": "Asia/Seoul",
+    "86": "Asia/Shanghai",
+    "90": "Europe/Istanbul",
+    "91": "Asia/Kolkata",
+    "92": "Asia/Karachi",
+    "94": "Asia/Colombo",
+    "234": "Africa/Lagos",
+    "254": "Africa/Nairobi",
+    "880": "Asia/Dhaka",
+    "966": "Asia/Riyadh",
+    "971": "Asia/Dubai",
+    "977": "Asia/Kathmandu",
+}
+
+def recipient_timezone(recipient: str, contact: Optional[dict], default: ZoneInfo) -> ZoneInfo:
+    """Timezone of a recipient: the contact's own, else guessed from the number's calling code"""
+    if contact and contact.get("timezone"):
+        try:
+            return ZoneInfo(contact["timezone"])
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+
+    digits = recipient.lstrip("+")
+    if recipient.startswith("+") and digits.isdigit():
+        for length in (3, 2, 1):
+            zone = CALLING_CODE_TIMEZONES.get(digits[:length])
+            if zone:
+                return ZoneInfo(zone)
+    return default
+
+def _parse_clock(value: str) -> time:
+    try:
+        return time.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}', expected HH:MM")
+
+@dataclass
+class SendSchedule:
+    """When a campaign's recipients are released to the send queue.
+
+    Recipients are spread evenly over `spread_seconds` of *open* time starting
+    at `send_at`. With a window, only the hours between window_start and
+    window_end in each recipient's local time count as open, and without an
+    explicit spread recipients are spread over one window's worth of open
+    time rather than all released the moment it opens.
+    """
+    send_at: datetime
+    spread_seconds: float = 0
+    window_start: Optional[time] = None
+    window_end: Optional[time] = None
+    default_timezone: ZoneInfo = ZoneInfo("UTC")
+
+    @classmethod
+    def from_request(
+        cls,
+        send_at: Optional[str] = None,
+        spread_minutes: Optional[float] = None,
+        window_start: Optional[str] = None,
+        window_end: Optional[str] = None,
+        timezone_name: Optional[str] = None
+    ) -> Optional["SendSchedule"]:
+        """Build a schedule from API fields; None when the campaign should just send now"""
+        if not any([send_at, spread_minutes, window_start, window_end]):
+            return None
+
+        try:
+            default_timezone = ZoneInfo(timezone_name or "UTC")
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown timezone '{timezone_name}'")
+
+        now = datetime.now(timezone.utc)
+        if send_at:
+            try:
+                start = datetime.fromisoformat(send_at.replace("Z", "+00:00"))
+            except ValueError:
+                raise ValueError("send_at must be an ISO 8601 datetime")
+            if start.tzinfo is None:
+                start = start.replace(tzinfo=default_timezone)
+            start = max(start.astimezone(timezone.utc), now)
+        else:
+            start = now
+
+        if spread_minutes is not None and spread_minutes < 0:
+            raise ValueError("spread_minutes cannot be negative")
+
+        if bool(window_start) != bool(window_end):
+            raise ValueError("window_start and window_end must be given together")
+        start_clock = _parse_clock(window_start) if window_start else None
+        end_clock = _parse_clock(window_end) if window_end else None
+        if start_clock and start_clock >= end_clock:
+            raise ValueError("window_start must be before window_end")
+
+        spread_seconds = (spread_minutes or 0) * 60
+        if spread_minutes is None and start_clock:
+            spread_seconds = (
+                datetime.combine(now.date(), end_clock) - datetime.combine(now.date(), start_clock)
+            ).total_seconds()
+
+        return cls(
+            send_at=start,
+            spread_seconds=spread_seconds,
+            window_start=start_clock,
+            window_end=end_clock,
+            default_timezone=default_timezone
+        )
+
+    def _advance_open_time(self, start: datetime, offset: float, tz: ZoneInfo) -> datetime:
+        """Walk `offset` seconds of open window time forward from start"""
+        local = start.astimezone(tz)
+        # A window is open at most 24h a day, so this terminates within offset/86400 + 2 days
+        while True:
+            day = local.date()
+            opens = datetime.combine(day, self.window_start, tzinfo=tz)
+            closes = datetime.combine(day, self.window_end, tzinfo=tz)
+            if local < opens:
+                local = opens
+            if local >= closes:
+                local = datetime.combine(day + timedelta(days=1), self.window_start, tzinfo=tz)
+                continue
+
+            remaining = (closes - local).total_seconds()
+            if offset < remaining:
+                return (local + timedelta(seconds=offset)).astimezone(timezone.utc)
+            offset -= remaining
+            local = datetime.combine(day + timedelta(days=1), self.window_start, tzinfo=tz)
+
+    def release_at(self, index: int, count: int, recipient: str, contact: Optional[dict] = None) -> datetime:
+        offset = self.spread_seconds * index / count if count else 0
+        if self.window_start is None:
+            return self.send_at + timedelta(seconds=offset)
+        tz = recipient_timezone(recipient, contact, self.default_timezone)
+        return self._advance_open_time(self.send_at, offset, tz)
+
+    def to_document(self) -> dict:
+        return {
+            "send_at": self.send_at,
+            "spread_minutes": self.spread_seconds / 60,
+            "window_start": self.window_start.strftime("%H:%M") if self.window_start else None,
+            "window_end": self.window_end.strftime("%H:%M") if self.window_end else None,
+            "timezone": str(self.default_timezone)
+        }
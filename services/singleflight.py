@@ -0,0 +1,38 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running await the same task and get its result (or exception).
+    The key is forgotten as soon as the task finishes, so nothing is cached.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run fn once per key at a time; returns (result, shared)"""
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            logger.debug(f"{self.name}: joined in-flight call for {key}")
+        else:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+
+        # Shield so one cancelled caller (e.g. a dropped webhook) doesn't cancel the others
+        return await asyncio.shield(task), shared
@@ -0,0 +1,218 @@
+"""Async Twilio SMS sending.
+
+Messages go through Twilio's aiohttp-based client, one pooled session per
+(sub)account, with bounded concurrency and each sender paced to its
+messages-per-second limit. Log entries are buffered and written in batches.
+
+A sender is either a phone number or a Messaging Service SID ("MG..."). A
+tenant with several senders has its recipients spread across them, each
+recipient sticking to the same sender from one campaign to the next.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from twilio.rest import Client
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+
+from config import (
+    TWILIO_HTTP_TIMEOUT, SMS_SEND_CONCURRENCY, SMS_NUMBER_MESSAGES_PER_SECOND,
+    SMS_MESSAGING_SERVICE_MESSAGES_PER_SECOND, SMS_LOG_BATCH_SIZE, SMS_LOG_FLUSH_SECONDS,
+    SMS_SEND_MAX_ATTEMPTS, SMS_RETRY_BASE_SECONDS, SMS_RETRY_MAX_SECONDS
+)
+from services.database import get_sms_logs_collection
+from services.campaign_dispatcher import sms_number_slot
+from services.campaign_queue import retry_delay
+from services.log_buffer import BufferedLogWriter
+from services.send_errors import classify_twilio_error
+from services.circuit_breaker import twilio_breaker, is_server_error, CircuitOpenError
+from services.priority_lanes import sms_lanes, STANDARD
+
+logger = logging.getLogger(__name__)
+
+SMS_MESSAGE_COST = 0.0075
+
+sms_log_writer = BufferedLogWriter(get_sms_logs_collection, SMS_LOG_BATCH_SIZE, SMS_LOG_FLUSH_SECONDS)
+
+class TwilioClientPool:
+    """One async Twilio client per account SID, each with its own pooled HTTP session"""
+
+    def __init__(self):
+        self._clients: Dict[str, Tuple[str, Client]] = {}
+
+    def get(self, account_sid: str, auth_token: str) -> Client:
+        entry = self._clients.get(account_sid)
+        if entry and entry[0] == auth_token:
+            return entry[1]
+        if entry:
+            # Rotated auth token: retire the old session
+            asyncio.create_task(entry[1].http_client.close())
+
+        client = Client(account_sid, auth_token, http_client=AsyncTwilioHttpClient())
+        self._clients[account_sid] = (auth_token, client)
+        return client
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        for _, client in clients.values():
+            await client.http_client.close()
+        if clients:
+            logger.info(f"Closed {len(clients)} Twilio HTTP sessions")
+
+twilio_clients = TwilioClientPool()
+
+def is_messaging_service(sender: str) -> bool:
+    return sender.startswith("MG")
+
+def user_senders(sms_user: dict) -> List[str]:
+    """Senders a tenant sends from: its Messaging Service, else its own numbers"""
+    if sms_user.get("messaging_service_sid"):
+        return [sms_user["messaging_service_sid"]]
+    senders = []
+    for number in [sms_user.get("purchased_number"), *sms_user.get("sender_numbers", [])]:
+        if number and number not in senders:
+            senders.append(number)
+    return senders
+
+def sender_rate(sender: str, messages_per_second: float = None) -> float:
+    if messages_per_second:
+        return messages_per_second
+    if is_messaging_service(sender):
+        return SMS_MESSAGING_SERVICE_MESSAGES_PER_SECOND
+    return SMS_NUMBER_MESSAGES_PER_SECOND
+
+def aggregate_rate(senders: List[str], messages_per_second: float = None) -> float:
+    return sum(sender_rate(sender, messages_per_second) for sender in senders)
+
+def estimate_send_seconds(count: int, senders: List[str], messages_per_second: float = None) -> float:
+    """Lower bound on how long `count` messages take at the senders' combined rate"""
+    rate = aggregate_rate(senders, messages_per_second)
+    return round(count / rate, 1) if rate else 0.0
+
+def _rendezvous_score(sender: str, recipient: str) -> int:
+    digest = hashlib.blake2b(f"{sender}|{recipient}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+def pick_sender(recipient: str, senders: List[str]) -> str:
+    """Sticky sender for a recipient (rendezvous hashing).
+
+    Adding or removing a sender only moves the recipients that hash to it,
+    so everyone else keeps hearing from the same number.
+    """
+    return max(senders, key=lambda sender: _rendezvous_score(sender, recipient))
+
+@dataclass
+class SMSSendResult:
+    to_number: str
+    ok: bool
+    sid: Optional[str] = None
+    error: Optional[dict] = None
+    sender: Optional[str] = None
+
+async def create_message(
+    client: Client, sender: str, to_number: str, body: str, messages_per_second: float = None,
+    lane: str = STANDARD, before_send: Optional[Callable[[], Awaitable[None]]] = None
+):
+    """Send one SMS once, paced to the sender's limit; raises on failure.
+
+    `before_send` is awaited once the sender's slot is granted, right before
+    the request to Twilio (campaign sends re-check their campaign there).
+    """
+    if is_messaging_service(sender):
+        route = {"messaging_service_sid": sender}
+    else:
+        route = {"from_": sender}
+    # Fail fast while Twilio is down instead of waiting for a sender slot; the
+    # state-changing check (and the half-open probe) happens in protect() below
+    twilio_breaker.raise_if_open()
+    # The sender's tokens go to waiting lanes by priority, so an API or realtime
+    # send from a number running a bulk campaign doesn't wait out its backlog
+    async with sms_number_slot(sender, sender_rate(sender, messages_per_second), lane) as feedback, sms_lanes.slot(lane):
+        if before_send is not None:
+            await before_send()
+        started = time.monotonic()
+        try:
+            async with twilio_breaker.protect(is_server_error):
+                message = await asyncio.wait_for(
+                    client.messages.create_async(body=body, to=to_number, **route),
+                    TWILIO_HTTP_TIMEOUT
+                )
+        except Exception as e:
+            # Twilio throttling (429 / 20429) slows this sender down
+            feedback.report(classify_twilio_error(e))
+            raise
+        feedback.report({"ok": True}, time.monotonic() - started)
+        return message
+
+def log_sms_result(user_id: str, sender: str, body: str, result: SMSSendResult):
+    log_doc = {
+        "user_id": user_id,
+        "to_number": result.to_number,
+        "from_number": sender,
+        "message": body,
+        "sid": result.sid,
+        "status": "sent" if result.ok else "failed",
+        "cost": SMS_MESSAGE_COST if result.ok else 0.0,
+        "timestamp": datetime.now(timezone.utc)
+    }
+    if not result.ok:
+        log_doc["error_code"] = result.error["error_code"]
+        log_doc["error_message"] = result.error["error_message"]
+    sms_log_writer.add(log_doc)
+
+async def send_sms_message(
+    client: Client, sender: str, to_number: str, body: str, user_id: str,
+    messages_per_second: float = None
+) -> SMSSendResult:
+    """Send one SMS, retrying transient Twilio errors with a short backoff, and log the outcome"""
+    for attempt in range(1, SMS_SEND_MAX_ATTEMPTS + 1):
+        try:
+            message = await create_message(client, sender, to_number, body, messages_per_second)
+            result = SMSSendResult(to_number=to_number, ok=True, sid=message.sid, sender=sender)
+            break
+        except Exception as e:
+            error = classify_twilio_error(e)
+            # An open circuit won't close within this short backoff; leave retries to the caller
+            if not error["retryable"] or attempt == SMS_SEND_MAX_ATTEMPTS or isinstance(e, CircuitOpenError):
+                logger.error(f"Error sending SMS to {to_number}: {error['error_message']}")
+                result = SMSSendResult(to_number=to_number, ok=False, error=error, sender=sender)
+                break
+            delay = retry_delay(attempt, error["retry_after"], SMS_RETRY_BASE_SECONDS, SMS_RETRY_MAX_SECONDS)
+            logger.warning(f"Retrying SMS to {to_number} in {delay:.1f}s after {error['error_code']}")
+            await asyncio.sleep(delay)
+
+    log_sms_result(user_id, sender, body, result)
+    return result
+
+async def send_sms_batch(
+    account_sid: str,
+    auth_token: str,
+    senders: List[str],
+    messages: List[dict],
+    user_id: str,
+    messages_per_second: float = None,
+    concurrency: int = SMS_SEND_CONCURRENCY
+) -> List[SMSSendResult]:
+    """Send `messages` ({"to", "body"}) spread over `senders`; results come back in input order.
+
+    Every sender gets its own `concurrency` slots, so a backlog queued on one
+    slow sender never holds up the others.
+    """
+    client = twilio_clients.get(account_sid, auth_token)
+    semaphores = {sender: asyncio.Semaphore(concurrency) for sender in senders}
+
+    async def send(message: dict) -> SMSSendResult:
+        sender = pick_sender(message["to"], senders)
+        async with semaphores[sender]:
+            return await send_sms_message(
+                client, sender, message["to"], message["body"], user_id, messages_per_second
+            )
+
+    results = await asyncio.gather(*(send(message) for message in messages))
+    # Callers read the logs back (hourly limits, reports) right after a batch
+    await sms_log_writer.flush()
+    return results
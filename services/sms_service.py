@@ -1,47 +1,67 @@
 
 import logging
-from services.database import get_sms_users_collection, get_sms_logs_collection
-from config import twilio_client
-from datetime import datetime, timezone
+from dataclasses import dataclass
+from typing import List, Optional
+
+from services.database import get_sms_users_collection
+from config import twilio_client, TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN
+from services.sms_engine import (
+    twilio_clients, create_message, log_sms_result, SMSSendResult, user_senders, pick_sender
+)
 from services.api_key_service import APIKeyService
+from services.priority_lanes import STANDARD
+from services.send_errors import SendConfigurationError
 
 logger = logging.getLogger(__name__)
 
-async def send_sms(req, user_id: str):
+@dataclass
+class SMSRoute:
+    """The Twilio account and sender pool a user's SMS go out through"""
+    account_sid: str
+    auth_token: str
+    senders: List[str]
+    messages_per_second: Optional[float] = None
+
+async def get_sms_route(user_id: str) -> SMSRoute:
+    """Tenants with a Twilio subaccount send from its numbers (or Messaging Service);
+    others from their verified number on the main account.
+
+    Raises SendConfigurationError if SMS can't be sent at all.
+    """
+    sms_users_collection = await get_sms_users_collection()
+    user = await sms_users_collection.find_one({"user_id": user_id})
+
+    if user and user.get("subaccount_sid") and user_senders(user):
+        return SMSRoute(
+            user["subaccount_sid"], user["subaccount_auth_token"], user_senders(user),
+            user.get("sms_messages_per_second")
+        )
+    if not twilio_client:
+        raise SendConfigurationError("Twilio client not configured")
+    if not user or not user.get("verified_number"):
+        raise SendConfigurationError("User number not verified")
+    return SMSRoute(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, [user["verified_number"]])
+
+async def send_sms(req, user_id: str, lane: str = STANDARD, before_send=None):
     """Send SMS message with user authentication"""
     from models.marketing import SMSRequest
     
     if not isinstance(req, SMSRequest):
         raise ValueError("Request must be SMSRequest instance")
     
-    if not twilio_client:
-        raise Exception("Twilio client not configured")
-        
-    sms_users_collection = await get_sms_users_collection()
-    user = await sms_users_collection.find_one({"user_id": user_id})
-    
-    if not user or not user.get("verified_number"):
-        raise Exception("User number not verified")
-        
-    verified_number = user["verified_number"]
+    route = await get_sms_route(user_id)
+    # The same recipient always hears from the same sender of the pool
+    sender = pick_sender(req.to_number, route.senders)
     try:
-        message = twilio_client.messages.create(
-            body=req.message,
-            from_=verified_number,
-            to=req.to_number
+        client = twilio_clients.get(route.account_sid, route.auth_token)
+        message = await create_message(
+            client, sender, req.to_number, req.message, route.messages_per_second,
+            lane=lane, before_send=before_send
         )
         
-        sms_logs_collection = await get_sms_logs_collection()
-        await sms_logs_collection.insert_one({
-            "user_id": user_id,
-            "to_number": req.to_number,
-            "message": req.message,
-            "sid": message.sid,
-            "status": "sent",
-            "timestamp": datetime.now(timezone.utc)
-        })
+        log_sms_result(user_id, sender, req.message, SMSSendResult(to_number=req.to_number, ok=True, sid=message.sid, sender=sender))
         
-        return {"message": "SMS sent", "sid": message.sid}
+        return {"message": "SMS sent", "sid": message.sid, "sender": sender}
     except Exception as e:
         logger.error(f"Error sending SMS: {e}")
-        raise e
\ No newline at end of file
+        raise e
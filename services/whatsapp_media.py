@@ -0,0 +1,179 @@
+"""Upload-once media for WhatsApp campaigns.
+
+Sending {"link": url} makes Meta fetch the asset from our origin for every
+message. Instead the asset is fetched once, uploaded to the sender's Cloud API
+/media endpoint, and the returned media id is reused for every recipient until
+it nears Meta's expiry. Ids are kept in memory and in Mongo, so other workers
+and restarts reuse the same upload; concurrent sends of a new asset share one
+upload.
+"""
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import mimetypes
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import httpx
+
+from config import WHATSAPP_MEDIA_ID_TTL_HOURS, WHATSAPP_MEDIA_MAX_UPLOAD_BYTES, WHATSAPP_MEDIA_FETCH_TIMEOUT
+from services.database import get_whatsapp_media_collection
+from services.singleflight import SingleFlight
+from services.whatsapp_service import whatsapp_client
+
+logger = logging.getLogger(__name__)
+
+media_uploads = SingleFlight("whatsapp_media_upload")
+
+# A failed upload is not retried for this long; sends fall back to the link meanwhile
+UPLOAD_FAILURE_BACKOFF_SECONDS = 300
+
+MAX_FETCH_REDIRECTS = 5
+
+# (phone_number_id, media_url) -> (media_id or None after a failed upload, monotonic expiry)
+_media_ids: Dict[Tuple[str, str], Tuple[Optional[str], float]] = {}
+
+async def create_whatsapp_media_indexes():
+    media_collection = await get_whatsapp_media_collection()
+    await media_collection.create_index("expires_at", expireAfterSeconds=0)
+
+def _cache_id(phone_number_id: str, media_url: str) -> str:
+    return f"{phone_number_id}:{hashlib.sha256(media_url.encode()).hexdigest()}"
+
+def _remember(phone_number_id: str, media_url: str, media_id: str, expires_at: datetime):
+    ttl = (expires_at - datetime.now(timezone.utc)).total_seconds()
+    _media_ids[(phone_number_id, media_url)] = (media_id, time.monotonic() + ttl)
+
+class UnsafeMediaURL(Exception):
+    pass
+
+async def _check_public_url(url: str):
+    """Refuse URLs that would make the server fetch from itself or a private network.
+
+    The media URL comes from the tenant and the body is uploaded to Meta, so an
+    internal address (metadata service, admin ports) would become readable over
+    WhatsApp. Every address the host resolves to must be public.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise UnsafeMediaURL(f"unsupported media URL {url!r}")
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80), type=socket.SOCK_STREAM
+        )
+    except socket.gaierror as e:
+        raise UnsafeMediaURL(f"cannot resolve {parsed.hostname}: {e}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0].split("%", 1)[0])
+        if not ip.is_global or ip.is_multicast:
+            raise UnsafeMediaURL(f"{parsed.hostname} resolves to non-public address {ip}")
+
+async def _fetch_asset(media_url: str) -> Optional[Tuple[bytes, str]]:
+    """Download the asset once; None if it can't be fetched, isn't public or is too large to upload"""
+    # A separate client: the Graph API client carries the sender's access token.
+    # Redirects are followed by hand so every hop gets the same address check.
+    async with httpx.AsyncClient(timeout=WHATSAPP_MEDIA_FETCH_TIMEOUT) as client:
+        url = media_url
+        try:
+            for _ in range(MAX_FETCH_REDIRECTS + 1):
+                await _check_public_url(url)
+                async with client.stream("GET", url) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers["location"])
+                        continue
+                    response.raise_for_status()
+                    if int(response.headers.get("content-length") or 0) > WHATSAPP_MEDIA_MAX_UPLOAD_BYTES:
+                        logger.warning(f"Media {media_url} is {response.headers['content-length']} bytes; sending it by link instead")
+                        return None
+                    content = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        content.extend(chunk)
+                        if len(content) > WHATSAPP_MEDIA_MAX_UPLOAD_BYTES:
+                            logger.warning(f"Media {media_url} is over {WHATSAPP_MEDIA_MAX_UPLOAD_BYTES} bytes; sending it by link instead")
+                            return None
+                    content_type = response.headers.get("content-type", "")
+                    break
+            else:
+                logger.warning(f"Could not fetch media {media_url}: more than {MAX_FETCH_REDIRECTS} redirects")
+                return None
+        except UnsafeMediaURL as e:
+            logger.warning(f"Not fetching media {media_url}: {e}")
+            return None
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not fetch media {media_url}: {e}")
+            return None
+
+    mime_type = content_type.split(";")[0].strip()
+    if not mime_type or mime_type == "application/octet-stream":
+        mime_type = mimetypes.guess_type(media_url.split("?", 1)[0])[0] or "application/octet-stream"
+    return bytes(content), mime_type
+
+async def _upload(phone_number_id: str, access_token: str, media_url: str) -> Optional[str]:
+    asset = await _fetch_asset(media_url)
+    if asset is None:
+        return None
+    content, mime_type = asset
+    filename = media_url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1] or "media"
+
+    result = await whatsapp_client.request(
+        "POST", f"/{phone_number_id}/media", access_token,
+        # A slow 16 MB upload says nothing about whether sends will get through
+        count_failures=False,
+        data={"messaging_product": "whatsapp", "type": mime_type},
+        files={"file": (filename, content, mime_type)}
+    )
+    media_id = (result.data or {}).get("id") if result else None
+    if not media_id:
+        logger.warning(f"Media upload for {media_url} failed: {result.status_code} {result.error_message}")
+        return None
+
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=WHATSAPP_MEDIA_ID_TTL_HOURS)
+    media_collection = await get_whatsapp_media_collection()
+    await media_collection.replace_one(
+        {"_id": _cache_id(phone_number_id, media_url)},
+        {
+            "phone_number_id": phone_number_id,
+            "media_url": media_url,
+            "media_id": media_id,
+            "mime_type": mime_type,
+            "uploaded_at": datetime.now(timezone.utc),
+            "expires_at": expires_at
+        },
+        upsert=True
+    )
+    _remember(phone_number_id, media_url, media_id, expires_at)
+    logger.info(f"Uploaded {media_url} for {phone_number_id} as media {media_id}")
+    return media_id
+
+async def get_media_id(phone_number_id: str, access_token: str, media_url: str) -> Optional[str]:
+    """Cloud API media id for the asset on this sender, uploading it if needed.
+
+    None means the asset could not be uploaded and should be sent by link.
+    """
+    key = (phone_number_id, media_url)
+    cached = _media_ids.get(key)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    media_collection = await get_whatsapp_media_collection()
+    doc = await media_collection.find_one({"_id": _cache_id(phone_number_id, media_url)})
+    if doc:
+        expires_at = doc["expires_at"].replace(tzinfo=timezone.utc)
+        if expires_at > datetime.now(timezone.utc):
+            _remember(phone_number_id, media_url, doc["media_id"], expires_at)
+            return doc["media_id"]
+
+    media_id, shared = await media_uploads.do(key, lambda: _upload(phone_number_id, access_token, media_url))
+    if media_id is None and not shared:
+        _media_ids[key] = (None, time.monotonic() + UPLOAD_FAILURE_BACKOFF_SECONDS)
+    return media_id
+
+async def forget_media_id(phone_number_id: str, media_url: str):
+    """Drop a media id Meta no longer accepts, so the next send uploads the asset again"""
+    _media_ids.pop((phone_number_id, media_url), None)
+    media_collection = await get_whatsapp_media_collection()
+    await media_collection.delete_one({"_id": _cache_id(phone_number_id, media_url)})
@@ -0,0 +1,239 @@
+"""Precompiled Cloud API payloads for campaign sends.
+
+A campaign's message is built into its Cloud API payload once and serialized
+to JSON once. The recipient and any personalized text ({name}, {var1}...) are
+left as slots in that JSON, so each send only renders those fields and joins
+the pre-serialized pieces instead of rebuilding and re-encoding the body.
+"""
+import json
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from services.personalization import compile_template
+from services.whatsapp_service import create_button_message, create_list_message
+
+# Types a campaign can be sent as; "Approved Template" is a Meta-approved message template
+WHATSAPP_MESSAGE_TYPES = [
+    "Text",
+    "Text with Media",
+    "Media",
+    "Buttons",
+    "Buttons with Media",
+    "List",
+    "List with Media",
+    "List/Menu",
+    "List/Menu with Media",
+    "Poll",
+    "Poll with Media",
+    "Approved Template"
+]
+
+MEDIA_EXTENSIONS = {
+    "video": (".mp4", ".3gp"),
+    "audio": (".mp3", ".ogg", ".aac", ".amr", ".m4a"),
+    "document": (".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".txt", ".csv")
+}
+
+# Interactive message limits enforced by the Cloud API
+MAX_BUTTONS = 3
+MAX_BUTTON_TITLE = 20
+MAX_LIST_ROWS = 10
+MAX_ROW_TITLE = 24
+
+def media_type_for(url: str) -> str:
+    path = url.split("?", 1)[0].lower()
+    for media_type, extensions in MEDIA_EXTENSIONS.items():
+        if path.endswith(extensions):
+            return media_type
+    return "image"
+
+class _Personalized:
+    """Marks a payload string that is rendered per recipient"""
+
+    def __init__(self, text: str):
+        self.template = compile_template(text)
+
+def _text(value: str):
+    template = compile_template(value or "")
+    return value if template.is_static else _Personalized(value)
+
+def _media_object(media_url: str, media_id: Optional[str]) -> dict:
+    # An uploaded media id spares Meta a fetch from our origin on every message
+    return {"id": media_id} if media_id else {"link": media_url}
+
+def _media_header(media_url: str, media_id: Optional[str] = None) -> dict:
+    media_type = media_type_for(media_url)
+    # Interactive headers take image, video or document
+    if media_type == "audio":
+        media_type = "document"
+    return {"type": media_type, media_type: _media_object(media_url, media_id)}
+
+def _option_title(option, index: int) -> str:
+    """Label of a button or list option; dict options may lack a title, plain options are their own label"""
+    if isinstance(option, dict):
+        return str(option.get("title") or option.get("name") or option.get("id") or f"Option {index + 1}")
+    if isinstance(option, (str, int, float)) and str(option).strip():
+        return str(option).strip()
+    raise ValueError(f"Option {index + 1} needs a title")
+
+def _buttons(options: List) -> List[dict]:
+    return [{"title": _option_title(option, i)[:MAX_BUTTON_TITLE]} for i, option in enumerate(options[:MAX_BUTTONS])]
+
+def _list_rows(items: List) -> List[dict]:
+    rows = []
+    for i, item in enumerate(items[:MAX_LIST_ROWS]):
+        title = _option_title(item, i)
+        description = item.get("description", "") if isinstance(item, dict) else ""
+        row = {"id": f"item_{i + 1}", "title": title[:MAX_ROW_TITLE]}
+        if description:
+            row["description"] = description[:72]
+        rows.append(row)
+    return rows
+
+def _choices_message(body, options: List, header: Optional[dict] = None) -> dict:
+    """Buttons for up to three options, a list for more"""
+    if len(options) <= MAX_BUTTONS:
+        interactive = create_button_message(body, _buttons(options))
+        if header:
+            interactive["header"] = header
+        return interactive
+    return create_list_message("Options", body, [{"title": "Options", "rows": _list_rows(options)}])
+
+def build_message(
+    message_type: str,
+    content: str = "",
+    media_url: str = "",
+    caption: str = "",
+    buttons: Optional[List] = None,
+    list_items: Optional[List] = None,
+    poll_data: Optional[dict] = None,
+    approved_template: Optional[dict] = None,
+    media_id: Optional[str] = None
+) -> dict:
+    """The type-specific part of a Cloud API message ({"type": ..., <type>: {...}})"""
+    with_media = message_type.endswith("with Media") or message_type == "Media"
+    if with_media and not media_url:
+        raise ValueError("Media URL is required for media messages")
+
+    if message_type in ("Media", "Text with Media"):
+        media_type = media_type_for(media_url)
+        media = _media_object(media_url, media_id)
+        text = caption or content if message_type == "Text with Media" else ""
+        if text and media_type != "audio":
+            media["caption"] = _text(text)
+        return {"type": media_type, media_type: media}
+
+    header = _media_header(media_url, media_id) if with_media else None
+
+    if message_type.startswith("Buttons"):
+        if not buttons:
+            raise ValueError("Button messages need at least one button")
+        interactive = create_button_message(_text(content), _buttons(buttons))
+        if header:
+            interactive["header"] = header
+        return {"type": "interactive", "interactive": interactive}
+
+    if message_type.startswith("List"):
+        if not list_items:
+            raise ValueError("List messages need at least one list item")
+        # List headers can only be text, so a media URL is not attached here
+        sections = [{"title": "Options", "rows": _list_rows(list_items)}]
+        return {"type": "interactive", "interactive": create_list_message("Options", _text(content), sections)}
+
+    if message_type.startswith("Poll"):
+        # The Cloud API has no polls; the question goes out with its options as replies
+        poll_data = poll_data or {}
+        options = poll_data.get("options") or []
+        if not options:
+            raise ValueError("Poll messages need at least one option")
+        question = _text(poll_data.get("question") or content)
+        return {"type": "interactive", "interactive": _choices_message(question, options, header)}
+
+    if message_type == "Approved Template":
+        if not approved_template or not approved_template.get("name"):
+            raise ValueError("Approved template messages need the template name")
+        components = approved_template.get("components") or []
+        return {
+            "type": "template",
+            "template": {
+                "name": approved_template["name"],
+                "language": {"code": approved_template.get("language", "en")},
+                "components": _personalize_components(components)
+            }
+        }
+
+    return {"type": "text", "text": {"body": _text(content)}}
+
+def _personalize_components(value):
+    if isinstance(value, dict):
+        return {k: (_text(v) if k == "text" and isinstance(v, str) else _personalize_components(v)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_personalize_components(v) for v in value]
+    return value
+
+class CompiledPayload:
+    """A message serialized once; render() produces the bytes for one recipient"""
+
+    def __init__(self, message: dict):
+        self.message_type = message["type"]
+        marker = f"@@slot-{uuid.uuid4().hex}@@"
+        slots: List[Optional[_Personalized]] = [None]  # slot 0 is the recipient
+
+        def mark(value):
+            if isinstance(value, _Personalized):
+                slots.append(value)
+                return f"{marker}{len(slots) - 1}{marker}"
+            if isinstance(value, dict):
+                return {k: mark(v) for k, v in value.items()}
+            if isinstance(value, list):
+                return [mark(v) for v in value]
+            return value
+
+        payload = {"messaging_product": "whatsapp", "to": f"{marker}0{marker}", **mark(message)}
+        pieces = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).split(marker)
+        # pieces alternate literal JSON and slot numbers: lit, 0, lit, 1, lit, ...
+        self._literals: Tuple[str, ...] = tuple(pieces[0::2])
+        self._slots: Tuple[Optional[_Personalized], ...] = tuple(slots[int(n)] for n in pieces[1::2])
+
+    def render(self, to_number: str, data: Optional[dict] = None) -> bytes:
+        data = data or {}
+        literals = self._literals
+        rendered = [literals[0]]
+        for i, slot in enumerate(self._slots, 1):
+            value = to_number if slot is None else slot.template.render(data)
+            # Slots sit inside JSON strings; escape without the surrounding quotes
+            rendered.append(json.dumps(value, ensure_ascii=False)[1:-1])
+            rendered.append(literals[i])
+        return "".join(rendered).encode("utf-8")
+
+def compile_payload(**message_fields) -> CompiledPayload:
+    return CompiledPayload(build_message(**message_fields))
+
+def uses_media(campaign: dict) -> bool:
+    """Whether the campaign's payload carries its media (lists only take text headers)"""
+    message_type = campaign.get("message_type") or ""
+    return bool(campaign.get("media_url")) and (
+        message_type == "Media" or message_type.endswith("with Media")
+    ) and not message_type.startswith("List")
+
+# (campaign id, media id) -> CompiledPayload; campaign messages never change once queued
+_campaign_payloads: Dict[Tuple[str, Optional[str]], CompiledPayload] = {}
+
+def campaign_payload(campaign: dict, content_field: str = "message_content", media_id: Optional[str] = None) -> CompiledPayload:
+    key = (str(campaign["_id"]), media_id)
+    payload = _campaign_payloads.get(key)
+    if payload is None:
+        if len(_campaign_payloads) > 1000:
+            _campaign_payloads.clear()
+        payload = _campaign_payloads[key] = compile_payload(
+            message_type=campaign.get("message_type") or "Text",
+            content=campaign.get(content_field, ""),
+            media_url=campaign.get("media_url", ""),
+            caption=campaign.get("caption", ""),
+            buttons=campaign.get("buttons"),
+            list_items=campaign.get("list_items"),
+            poll_data=campaign.get("poll_data"),
+            approved_template=campaign.get("approved_template"),
+            media_id=media_id
+        )
+    return payload
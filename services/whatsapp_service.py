@@ -1,37 +1,193 @@
-import requests
+import httpx
 import logging
-from config import WHATSAPP_API_URL
-import json
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Optional
+from services.priority_lanes import whatsapp_lanes, STANDARD
+from services.circuit_breaker import meta_breaker, sender_breaker, CircuitOpenError
+from config import (
+    WHATSAPP_API_URL, WHATSAPP_HTTP_TIMEOUT, WHATSAPP_HTTP_CONNECT_TIMEOUT,
+    WHATSAPP_HTTP_MAX_CONNECTIONS, WHATSAPP_HTTP_MAX_KEEPALIVE
+)
 
 logger = logging.getLogger(__name__)
 
-def send_whatsapp_message(phone_number_id, to_number, message, access_token):
-    """Send WhatsApp text message via Meta API"""
+@dataclass
+class WhatsAppSendResult:
+    """Outcome of a Cloud API call; truthy only when the request succeeded"""
+    ok: bool
+    status_code: Optional[int] = None
+    data: Optional[dict] = None
+    error_code: Optional[int] = None
+    error_message: str = ""
+    # Response headers of a failed call (Retry-After on throttling)
+    headers: Optional[httpx.Headers] = None
+    # Seconds the API took to answer
+    elapsed: Optional[float] = None
+    # Set when the call was refused because the Meta circuit breaker is open
+    circuit_error: Optional[CircuitOpenError] = None
+
+    def __bool__(self):
+        return self.ok
+
+    @property
+    def message_id(self) -> Optional[str]:
+        messages = (self.data or {}).get("messages") or []
+        return messages[0].get("id") if messages else None
+
+# Built once per token; callers must not mutate the returned dict
+@lru_cache(maxsize=256)
+def _auth_headers(access_token: Optional[str], content_type: Optional[str] = None) -> dict:
+    # No token for app-level calls such as the OAuth code exchange
+    headers = {"Authorization": f"Bearer {access_token}"} if access_token else {}
+    if content_type:
+        headers["Content-Type"] = content_type
+    return headers
+
+class WhatsAppClient:
+    """Shared async HTTP client for the Meta Graph API.
+
+    One pooled connection set (keep-alive, HTTP/2 when h2 is installed) is
+    opened in the app lifespan and reused by every send.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=WHATSAPP_API_URL,
+                http2=find_spec("h2") is not None,
+                timeout=httpx.Timeout(WHATSAPP_HTTP_TIMEOUT, connect=WHATSAPP_HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=WHATSAPP_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=WHATSAPP_HTTP_MAX_KEEPALIVE
+                )
+            )
+            logger.info("WhatsApp HTTP client started")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("WhatsApp HTTP client closed")
+
+    async def request(
+        self, method: str, path: str, access_token: Optional[str], timeout: Optional[float] = None,
+        content_type: Optional[str] = None, breaker_key: Optional[str] = None, count_failures: bool = True,
+        **kwargs
+    ) -> WhatsAppSendResult:
+        """Call the Graph API; never raises.
+
+        Only connection failures count towards the process-wide Meta breaker.
+        Timeouts and 5xx count towards the breaker of `breaker_key` (the
+        sending phone number id), if given. `count_failures=False` keeps slow
+        calls such as media uploads out of both.
+        """
+        # Scripts and background jobs may run outside the app lifespan
+        if self._client is None:
+            await self.start()
+
+        headers = _auth_headers(access_token, content_type)
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        sender = sender_breaker("meta", breaker_key) if breaker_key else None
+        try:
+            if sender is not None:
+                sender.raise_if_open()
+            meta_breaker.check()
+            if sender is not None:
+                sender.check()
+        except CircuitOpenError as e:
+            return WhatsAppSendResult(ok=False, status_code=503, error_message=str(e), circuit_error=e)
+
+        started = time.monotonic()
+        try:
+            response = await self._client.request(method, path, headers=headers, **kwargs)
+        except httpx.HTTPError as e:
+            reason = f"{type(e).__name__}: {e}"
+            if count_failures:
+                if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                    meta_breaker.record_failure(reason)
+                if sender is not None:
+                    sender.record_failure(reason)
+            return WhatsAppSendResult(ok=False, error_message=reason)
+        elapsed = time.monotonic() - started
+        meta_breaker.record_success()
+        if sender is not None:
+            if response.status_code >= 500 and count_failures:
+                sender.record_failure(f"HTTP {response.status_code}")
+            else:
+                sender.record_success()
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+
+        if response.is_success:
+            return WhatsAppSendResult(ok=True, status_code=response.status_code, data=data, elapsed=elapsed)
+
+        error = (data or {}).get("error", {}) if isinstance(data, dict) else {}
+        return WhatsAppSendResult(
+            ok=False,
+            status_code=response.status_code,
+            data=data,
+            error_code=error.get("code"),
+            error_message=error.get("message") or response.text[:500],
+            headers=response.headers,
+            elapsed=elapsed
+        )
+
+whatsapp_client = WhatsAppClient()
+
+async def post_whatsapp_message(phone_number_id, access_token, data, timeout: Optional[float] = None, lane: str = STANDARD) -> WhatsAppSendResult:
+    """POST a message payload to /{phone_number_id}/messages in the given priority lane"""
     if not phone_number_id or not access_token:
         logger.error("Missing WhatsApp credentials")
-        return None
-        
-    url = f"{WHATSAPP_API_URL}/{phone_number_id}/messages"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    data = {"messaging_product": "whatsapp", "to": to_number, "type": "text", "text": {"body": message}}
-    
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending WhatsApp message: {e}")
-        return None
-
-def send_whatsapp_media(phone_number_id, to_number, media_url, caption, access_token, media_type="image"):
-    """Send WhatsApp media message"""
+        return WhatsAppSendResult(ok=False, error_message="Missing WhatsApp credentials")
+
+    async with whatsapp_lanes.slot(lane):
+        result = await whatsapp_client.request(
+            "POST", f"/{phone_number_id}/messages", access_token, timeout=timeout,
+            breaker_key=phone_number_id, json=data
+        )
+    if not result:
+        logger.error(
+            f"Error sending WhatsApp {data.get('type')} message: "
+            f"{result.status_code} {result.error_code} {result.error_message}"
+        )
+    return result
+
+async def post_whatsapp_payload(phone_number_id, access_token, body: bytes, message_type: str, timeout: Optional[float] = None, lane: str = STANDARD) -> WhatsAppSendResult:
+    """POST an already-serialized JSON message body (see services.whatsapp_payloads)"""
     if not phone_number_id or not access_token:
         logger.error("Missing WhatsApp credentials")
-        return None
-        
-    url = f"{WHATSAPP_API_URL}/{phone_number_id}/messages"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    
+        return WhatsAppSendResult(ok=False, error_message="Missing WhatsApp credentials")
+
+    async with whatsapp_lanes.slot(lane):
+        result = await whatsapp_client.request(
+            "POST", f"/{phone_number_id}/messages", access_token, timeout=timeout,
+            content_type="application/json", breaker_key=phone_number_id, content=body
+        )
+    if not result:
+        logger.error(
+            f"Error sending WhatsApp {message_type} message: "
+            f"{result.status_code} {result.error_code} {result.error_message}"
+        )
+    return result
+
+async def send_whatsapp_message(phone_number_id, to_number, message, access_token, timeout=None, lane=STANDARD):
+    """Send WhatsApp text message via Meta API"""
+    data = {"messaging_product": "whatsapp", "to": to_number, "type": "text", "text": {"body": message}}
+    return await post_whatsapp_message(phone_number_id, access_token, data, timeout, lane)
+
+async def send_whatsapp_media(phone_number_id, to_number, media_url, caption, access_token, media_type="image", timeout=None, lane=STANDARD):
+    """Send WhatsApp media message"""
     media_types = {
         "image": "image",
         "video": "video", 
@@ -50,48 +206,20 @@ def send_whatsapp_media(phone_number_id, to_number, media_url, caption, access_t
             "caption": caption
         }
     }
-    
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending WhatsApp media: {e}")
-        return None
-
-def send_whatsapp_interactive(phone_number_id, to_number, interactive_data, access_token):
+    return await post_whatsapp_message(phone_number_id, access_token, data, timeout, lane)
+
+async def send_whatsapp_interactive(phone_number_id, to_number, interactive_data, access_token, timeout=None, lane=STANDARD):
     """Send interactive message (buttons, lists)"""
-    if not phone_number_id or not access_token:
-        logger.error("Missing WhatsApp credentials")
-        return None
-        
-    url = f"{WHATSAPP_API_URL}/{phone_number_id}/messages"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    
     data = {
         "messaging_product": "whatsapp",
         "to": to_number,
         "type": "interactive",
         "interactive": interactive_data
     }
-    
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending WhatsApp interactive message: {e}")
-        return None
-
-def send_whatsapp_template(phone_number_id, to_number, template_name, template_components, access_token):
+    return await post_whatsapp_message(phone_number_id, access_token, data, timeout, lane)
+
+async def send_whatsapp_template(phone_number_id, to_number, template_name, template_components, access_token, timeout=None, lane=STANDARD):
     """Send WhatsApp template message"""
-    if not phone_number_id or not access_token:
-        logger.error("Missing WhatsApp credentials")
-        return None
-        
-    url = f"{WHATSAPP_API_URL}/{phone_number_id}/messages"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    
     data = {
         "messaging_product": "whatsapp",
         "to": to_number,
@@ -102,14 +230,7 @@ def send_whatsapp_template(phone_number_id, to_number, template_name, template_c
             "components": template_components
         }
     }
-    
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending WhatsApp template: {e}")
-        return None
+    return await post_whatsapp_message(phone_number_id, access_token, data, timeout, lane)
 
 def create_button_message(body_text, buttons):
     """Create button message structure"""
@@ -2,7 +2,7 @@ import torch
 import torch.nn.functional as F
 from transformers import AutoTokenizer, AutoModel
 from langchain_core.embeddings import Embeddings
-from config import BATCH_SIZE
+from config import BATCH_SIZE, EMBEDDING_MAX_TOKENS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,6 +14,16 @@ class E5Embeddings(Embeddings):
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.model = self.model.to(self.device)
         self.instruction = "Given a sentence, retrieve semantically similar sentences: "
+        # Tokens left for document text once the instruction and special tokens are added
+        self.max_content_tokens = (
+            EMBEDDING_MAX_TOKENS
+            - self.count_tokens(self.instruction)
+            - self.tokenizer.num_special_tokens_to_add()
+        )
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens for text as the embedding model sees it, excluding special tokens"""
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
 
     def _last_token_pooling(self, hidden_states, attention_mask):
         last_non_padded_idx = attention_mask.sum(dim=1) - 1
@@ -27,7 +37,7 @@ class E5Embeddings(Embeddings):
             texts_with_instruction = [self.instruction + t for t in batch_texts]
             inputs = self.tokenizer(
                 texts_with_instruction, padding=True, truncation=True,
-                max_length=512, return_tensors="pt"
+                max_length=EMBEDDING_MAX_TOKENS, return_tensors="pt"
             ).to(self.device)
             with torch.no_grad():
                 outputs = self.model(**inputs)
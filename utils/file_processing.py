@@ -7,6 +7,7 @@ from langchain_core.documents import Document
 from langchain_community.document_loaders import TextLoader, PyMuPDFLoader, Docx2txtLoader
 from langchain_community.vectorstores.utils import filter_complex_metadata
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from config import CHUNK_MIN_TOKENS, CHUNK_OVERLAP_RATIO
 
 logger = logging.getLogger(__name__)
 
@@ -42,40 +43,56 @@ def load_documents(file_path: str, file_type: str):
         logger.error(f"Unable to load {file_type} -> {e}")
         raise
 
-def calculate_dynamic_chunk_size(text: str) -> tuple[int, int]:
-    """Calculate dynamic chunk size and overlap based on text characteristics"""
-    total_chars = len(text)
-    dynamic_chunk_size = min(1000, max(200, total_chars // 20))
-    dynamic_chunk_overlap = int(dynamic_chunk_size * 0.15)
+def calculate_dynamic_chunk_size(total_tokens: int, max_tokens: int) -> tuple[int, int]:
+    """Calculate dynamic chunk size and overlap in tokens, capped at the embedding budget"""
+    dynamic_chunk_size = min(max_tokens, max(CHUNK_MIN_TOKENS, total_tokens // 20))
+    dynamic_chunk_overlap = int(dynamic_chunk_size * CHUNK_OVERLAP_RATIO)
     return dynamic_chunk_size, dynamic_chunk_overlap
 
 def split_documents(documents: List[Document]) -> List[Document]:
-    """Split documents into chunks with dynamic sizing based on content"""
+    """Split documents into chunks sized by embedding-tokenizer tokens"""
     try:
         if not documents:
             return []
         
-        # Combine all document content for analysis
-        combined_text = " ".join([doc.page_content for doc in documents])
+        from utils.embeddings import embedding_model
+        count_tokens = embedding_model.count_tokens
         
-        # Calculate optimal chunk size and overlap dynamically
-        chunk_size, chunk_overlap = calculate_dynamic_chunk_size(combined_text)
+        # Stream over the documents instead of joining them into one string
+        total_tokens = sum(count_tokens(doc.page_content) for doc in documents)
         
-        logger.info(f"Dynamic chunk settings - Size: {chunk_size}, Overlap: {chunk_overlap}")
+        chunk_size, chunk_overlap = calculate_dynamic_chunk_size(
+            total_tokens, embedding_model.max_content_tokens
+        )
+        
+        logger.info(f"Dynamic chunk settings - Size: {chunk_size} tokens, Overlap: {chunk_overlap} tokens (document: {total_tokens} tokens)")
         
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
-            length_function=len,
+            length_function=count_tokens,
             separators=["\n\n", "\n", ". ", "! ", "? ", " ", ""]
         )
         
         split_docs = text_splitter.split_documents(documents)
         
-        # Log chunk statistics
+        # Single pass for chunk statistics; token counts are kept on the chunk
+        chunk_tokens_total = 0
+        min_tokens = None
+        max_tokens = 0
+        for doc in split_docs:
+            tokens = count_tokens(doc.page_content)
+            doc.metadata["token_count"] = tokens
+            chunk_tokens_total += tokens
+            max_tokens = max(max_tokens, tokens)
+            min_tokens = tokens if min_tokens is None else min(min_tokens, tokens)
+        
         if split_docs:
-            avg_chunk_length = sum(len(doc.page_content) for doc in split_docs) / len(split_docs)
-            logger.info(f"Document splitting complete: {len(split_docs)} chunks, avg length: {avg_chunk_length:.0f} chars")
+            logger.info(
+                f"Document splitting complete: {len(split_docs)} chunks, "
+                f"avg {chunk_tokens_total / len(split_docs):.0f} tokens, "
+                f"min {min_tokens}, max {max_tokens} (budget {embedding_model.max_content_tokens})"
+            )
         
         return split_docs
         
@@ -0,0 +1,84 @@
+from collections import deque
+from typing import Any, List, Optional, Tuple
+
+class KeywordMatcher:
+    """Aho-Corasick automaton matching many keywords in one pass over the text.
+
+    Matching is case-insensitive and only accepts whole-word hits, so "hi"
+    matches "Hi there" but not "this".
+    """
+
+    def __init__(self, keywords: List[Tuple[str, Any]]):
+        # Trie nodes: outgoing edges, failure link and the patterns ending here
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._patterns = []
+
+        for keyword, payload in keywords:
+            keyword = " ".join(keyword.lower().split())
+            if not keyword:
+                continue
+            self._add(keyword, len(self._patterns))
+            self._patterns.append((keyword, payload))
+
+        self._build_failure_links()
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def _add(self, keyword: str, pattern_index: int):
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(pattern_index)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                # Inherit matches from the longest proper suffix
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    @staticmethod
+    def _is_boundary(text: str, index: int) -> bool:
+        return index < 0 or index >= len(text) or not text[index].isalnum()
+
+    def find_all(self, text: str) -> List[Tuple[int, str, Any]]:
+        """Return (start, keyword, payload) for every whole-word keyword in text"""
+        text = " ".join(text.lower().split())
+        matches = []
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for pattern_index in self._output[node]:
+                keyword, payload = self._patterns[pattern_index]
+                start = position - len(keyword) + 1
+                if self._is_boundary(text, start - 1) and self._is_boundary(text, position + 1):
+                    matches.append((start, keyword, payload))
+        return matches
+
+    def match(self, text: str) -> Optional[Any]:
+        """Return the payload of the earliest (then longest) keyword in text"""
+        if not self._patterns or not text:
+            return None
+        matches = self.find_all(text)
+        if not matches:
+            return None
+        _, _, payload = min(matches, key=lambda m: (m[0], -len(m[1])))
+        return payload
@@ -1 +1,291 @@
-from .file_processing import crawl_links, valid_url
\ No newline at end of file
+import asyncio
+import hashlib
+import logging
+import re
+import xml.etree.ElementTree as ET
+from typing import AsyncIterator, Dict, List, Optional
+from urllib import robotparser
+from urllib.parse import urljoin, urldefrag, urlparse
+
+import httpx
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "AiMsgHubBot/1.0 (+https://aimsghub.com)"
+SKIPPED_EXTENSIONS = (
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".css", ".js",
+    ".zip", ".mp4", ".mp3", ".avi", ".mov", ".xml", ".json", ".woff", ".woff2", ".ttf"
+)
+# Pages with less visible text than this are treated as client-side rendered
+MIN_STATIC_TEXT_CHARS = 200
+SPA_ROOT_IDS = {"root", "app", "__next", "__nuxt", "svelte"}
+
+def normalize_url(url: str) -> str:
+    """Drop fragments and trailing slashes so the same page is crawled once"""
+    url, _ = urldefrag(url.strip())
+    parsed = urlparse(url)
+    path = parsed.path.rstrip("/") or "/"
+    return parsed._replace(path=path, params="").geturl()
+
+def extract_page_content(html: str, base_url: str) -> dict:
+    """Extract title, readable text and same-page links from an HTML document"""
+    soup = BeautifulSoup(html, "html.parser")
+
+    script_count = len(soup.find_all("script"))
+    spa_root = any(soup.find(id=root_id) for root_id in SPA_ROOT_IDS)
+
+    links = []
+    for anchor in soup.find_all("a", href=True):
+        href = anchor["href"].strip()
+        if href.startswith(("mailto:", "tel:", "javascript:", "#")):
+            continue
+        links.append(normalize_url(urljoin(base_url, href)))
+
+    for tag in soup(["script", "style", "noscript", "template", "svg", "iframe", "nav", "footer", "header", "form"]):
+        tag.decompose()
+
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    text = soup.get_text(separator="\n")
+    text = re.sub(r"[ \t\xa0]+", " ", text)
+    text = re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+    return {
+        "title": title,
+        "text": text,
+        "links": links,
+        "needs_javascript": len(text) < MIN_STATIC_TEXT_CHARS and (spa_root or script_count > 0)
+    }
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class WebCrawler:
+    """Async same-site crawler with per-host concurrency, robots/sitemap awareness and conditional GETs"""
+
+    def __init__(
+        self,
+        start_url: str,
+        max_pages: int = 50,
+        per_host_concurrency: int = 4,
+        known_pages: Optional[Dict[str, dict]] = None,
+        request_timeout: float = 15.0
+    ):
+        self.start_url = normalize_url(start_url)
+        self.host = urlparse(self.start_url).netloc
+        self.max_pages = max_pages
+        self.per_host_concurrency = per_host_concurrency
+        # url -> {"etag", "last_modified", "content_hash"} from the previous crawl
+        self.known_pages = known_pages or {}
+        self.request_timeout = request_timeout
+
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._robots: Optional[robotparser.RobotFileParser] = None
+        self._crawl_delay = 0.0
+        self._browser = None
+        self._playwright = None
+        self._browser_lock = asyncio.Lock()
+        self._browser_semaphore = asyncio.Semaphore(2)
+
+    def _semaphore_for(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_semaphores[host]
+
+    def _in_scope(self, url: str) -> bool:
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or parsed.netloc != self.host:
+            return False
+        if parsed.path.lower().endswith(SKIPPED_EXTENSIONS):
+            return False
+        if self._robots and not self._robots.can_fetch(USER_AGENT, url):
+            return False
+        return True
+
+    async def _load_robots(self, client: httpx.AsyncClient) -> List[str]:
+        """Load robots.txt and return the sitemap URLs it advertises"""
+        robots_url = urljoin(self.start_url, "/robots.txt")
+        self._robots = robotparser.RobotFileParser(robots_url)
+        try:
+            response = await client.get(robots_url)
+            if response.status_code == 200:
+                self._robots.parse(response.text.splitlines())
+            else:
+                # No robots.txt means everything is allowed
+                self._robots.parse([])
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not fetch robots.txt for {self.host}: {e}")
+            self._robots.parse([])
+
+        self._crawl_delay = float(self._robots.crawl_delay(USER_AGENT) or 0)
+        return self._robots.site_maps() or [urljoin(self.start_url, "/sitemap.xml")]
+
+    async def _load_sitemaps(self, client: httpx.AsyncClient, sitemap_urls: List[str], depth: int = 0) -> List[str]:
+        """Collect page URLs from sitemaps, following sitemap indexes one level deep"""
+        urls = []
+        for sitemap_url in sitemap_urls:
+            try:
+                response = await client.get(sitemap_url)
+                if response.status_code != 200:
+                    continue
+                root = ET.fromstring(response.content)
+            except (httpx.HTTPError, ET.ParseError) as e:
+                logger.debug(f"Skipping sitemap {sitemap_url}: {e}")
+                continue
+
+            locations = [el.text.strip() for el in root.iter() if el.tag.endswith("loc") and el.text]
+            if root.tag.endswith("sitemapindex"):
+                if depth < 1:
+                    urls.extend(await self._load_sitemaps(client, locations, depth + 1))
+            else:
+                urls.extend(locations)
+
+            if len(urls) >= self.max_pages:
+                break
+        return urls
+
+    async def _render_with_browser(self, url: str) -> Optional[str]:
+        """Render a JavaScript-driven page with a shared headless Chromium"""
+        try:
+            async with self._browser_lock:
+                if self._browser is None:
+                    from playwright.async_api import async_playwright
+                    self._playwright = await async_playwright().start()
+                    self._browser = await self._playwright.chromium.launch(headless=True)
+
+            async with self._browser_semaphore:
+                page = await self._browser.new_page(user_agent=USER_AGENT)
+                try:
+                    await page.goto(url, wait_until="networkidle", timeout=self.request_timeout * 1000)
+                    return await page.content()
+                finally:
+                    await page.close()
+        except Exception as e:
+            logger.warning(f"Headless render failed for {url}: {e}")
+            return None
+
+    async def _close_browser(self):
+        if self._browser:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str) -> dict:
+        """Fetch one page, using the stored validators for a conditional GET"""
+        known = self.known_pages.get(url, {})
+        headers = {}
+        if known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        if known.get("last_modified"):
+            headers["If-Modified-Since"] = known["last_modified"]
+
+        async with self._semaphore_for(url):
+            try:
+                response = await client.get(url, headers=headers)
+            except httpx.HTTPError as e:
+                logger.warning(f"Failed to fetch {url}: {e}")
+                return {"url": url, "status": "failed", "error": str(e), "links": []}
+            finally:
+                if self._crawl_delay:
+                    await asyncio.sleep(self._crawl_delay)
+
+        if response.status_code == 304:
+            return {"url": url, "status": "unchanged", "links": []}
+
+        if response.status_code in (404, 410):
+            return {"url": url, "status": "gone", "links": []}
+
+        content_type = response.headers.get("content-type", "")
+        if response.status_code != 200 or "html" not in content_type:
+            return {"url": url, "status": "failed", "error": f"HTTP {response.status_code} ({content_type})", "links": []}
+
+        page = extract_page_content(response.text, str(response.url))
+        rendered = False
+        if page["needs_javascript"]:
+            html = await self._render_with_browser(url)
+            if html:
+                links = page["links"]
+                page = extract_page_content(html, url)
+                page["links"] = list(set(links) | set(page["links"]))
+                rendered = True
+
+        digest = content_hash(page["text"])
+        status = "unchanged" if digest == known.get("content_hash") else "changed"
+
+        return {
+            "url": url,
+            "status": status if page["text"] else "empty",
+            "title": page["title"],
+            "text": page["text"],
+            "links": page["links"],
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "content_hash": digest,
+            "rendered": rendered
+        }
+
+    async def crawl(self) -> AsyncIterator[dict]:
+        """Crawl the site and yield page results as soon as each page is fetched"""
+        limits = httpx.Limits(
+            max_connections=self.per_host_concurrency * 2,
+            max_keepalive_connections=self.per_host_concurrency
+        )
+        async with httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=self.request_timeout,
+            follow_redirects=True,
+            limits=limits
+        ) as client:
+            sitemap_urls = await self._load_robots(client)
+            seeds = [self.start_url] + await self._load_sitemaps(client, sitemap_urls) + list(self.known_pages)
+
+            queue: asyncio.Queue = asyncio.Queue()
+            seen = set()
+            for url in seeds:
+                url = normalize_url(url)
+                if url not in seen and self._in_scope(url) and len(seen) < self.max_pages:
+                    seen.add(url)
+                    queue.put_nowait(url)
+
+            results: asyncio.Queue = asyncio.Queue()
+
+            async def worker():
+                while True:
+                    url = await queue.get()
+                    try:
+                        try:
+                            page = await self._fetch(client, url)
+                        except Exception as e:
+                            # Parser, Playwright or encoding trouble on one page must not stop the worker
+                            logger.warning(f"Crawling {url} failed: {e}")
+                            page = {"url": url, "status": "failed", "error": f"{type(e).__name__}: {e}", "links": []}
+                        for link in page.get("links", []):
+                            if link not in seen and len(seen) < self.max_pages and self._in_scope(link):
+                                seen.add(link)
+                                queue.put_nowait(link)
+                        await results.put(page)
+                    finally:
+                        queue.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.per_host_concurrency)]
+            drained = asyncio.create_task(queue.join())
+
+            try:
+                while True:
+                    getter = asyncio.create_task(results.get())
+                    done, _ = await asyncio.wait({getter, drained}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter in done:
+                        yield getter.result()
+                        continue
+                    getter.cancel()
+                    while not results.empty():
+                        yield results.get_nowait()
+                    break
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                await self._close_browser()